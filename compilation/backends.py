@@ -0,0 +1,78 @@
+"""
+In-process compilers for the compiling handlers, used instead of running
+their command when the Python binding they need is importable. A handler
+lists the ones it can use in `backends`, and the first available one is
+picked the first time the handler compiles something:
+
+    class SASSHandler(BaseCompilingHandler):
+        backends = ('libsass-sass',)
+        command = 'sass -t compressed %s'
+
+The source is handed over as a string, with no temp file, fork or
+interpreter startup, but under the executor's slots and timeout like the
+commands (see compilation.executor). Set COMPILER_IN_PROCESS_COMPILERS = False to always run
+the commands.
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger('compilation')
+
+def compile_sass(source):
+    import sass
+    return sass.compile(string=source, indented=True, output_style='compressed')
+
+def compile_scss(source):
+    import sass
+    return sass.compile(string=source, output_style='compressed')
+
+def compile_less(source):
+    import lesscpy
+    from StringIO import StringIO
+    return lesscpy.compile(StringIO(source))
+
+#name -> (module it needs, function of the source returning the output)
+BACKENDS = {
+    'libsass-sass': ('sass', compile_sass),
+    'libsass-scss': ('sass', compile_scss),
+    'lesscpy': ('lesscpy', compile_less),
+}
+
+#handler class -> (name, function) of its backend, or None for its command
+chosen = {}
+_lock = threading.Lock()
+
+def available(module):
+    try:
+        __import__(module)
+    except ImportError:
+        return False
+    return True
+
+def choose_backend(handler_class):
+    """
+    Returns the (name, function) of the backend a handler class compiles
+    with, or None when it runs its command.
+    """
+
+    from compilation.settings import COMPILER
+    if not COMPILER.IN_PROCESS_COMPILERS:
+        return None
+
+    try:
+        return chosen[handler_class]
+    except KeyError:
+        pass
+
+    with _lock:
+        if handler_class not in chosen:
+            backend = None
+            for name in handler_class.backends:
+                if name in BACKENDS and available(BACKENDS[name][0]):
+                    backend = name, BACKENDS[name][1]
+                    break
+            if backend is not None:
+                logger.info('%s compiles in process with %s', handler_class.__name__, backend[0])
+            chosen[handler_class] = backend
+    return chosen[handler_class]
@@ -0,0 +1,214 @@
+"""
+Size and compile time reports of the bundles that get built, and budgets on
+them for CI.
+
+With COMPILER_BUNDLE_REPORTS on, every bundle built (on render or through
+compilation.build) leaves a record in COMPILER_ROOT/reports: its url, its
+raw, compiled and gzipped byte counts, and for each member the same sizes
+and the time its stages took.
+
+    python -m compilation.budget collect -o assets.json
+    python -m compilation.budget diff before.json assets.json --max-gzip-bytes 100000 --max-growth-percent 10
+
+collect merges the records into one report, keeping the newest build of
+each bundle. Bundles are told apart by their type and members, since their
+hash changes with every edit. diff lists what was added, removed or changed
+size between two reports and exits 1 if the new one breaks a budget.
+"""
+
+import json
+import os
+import sys
+import time
+import zlib
+
+#name of the diff option -> (what it limits, message)
+BUDGETS = (
+    ('max_bytes', 'bytes', '%(id)s is %(value)d bytes, over the budget of %(limit)d'),
+    ('max_gzip_bytes', 'gzip_bytes', '%(id)s is %(value)d bytes gzipped, over the budget of %(limit)d'),
+    ('max_compile_seconds', 'compile_seconds', '%(id)s took %(value).2fs to compile, over the budget of %(limit).2fs'),
+)
+
+def gzip_size(content):
+    if isinstance(content, unicode):
+        content = content.encode('utf-8')
+    #wbits 31 is the gzip container, as sent with Content-Encoding: gzip
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return len(compressor.compress(content) + compressor.flush())
+
+def member_source(handler):
+    #Inline members are told apart by their content
+    return handler._url or handler._file_path or 'inline %s %s' % (handler.mime, handler.hash[:16])
+
+def member_record(handler, source, raw_bytes, ran):
+    """
+    Returns the report record of a member, from where it came from, its
+    size before the stages and the (stage id, seconds, cached) they
+    returned.
+    """
+
+    from compilation.storage.bundles import bundle_size
+    return {
+        'source': source,
+        'mime': handler.mime,
+        'raw_bytes': raw_bytes,
+        'bytes': bundle_size(handler.content),
+        'compile_seconds': sum(seconds for _, seconds, _ in ran),
+        'stages': [[stage_id, seconds, cached] for stage_id, seconds, cached in ran],
+    }
+
+def bundle_id(record):
+    return '%s %s' % (record['type'], ' + '.join(member['source'] for member in record['members']))
+
+def reports_directory():
+    from compilation.storage.bundles import compiler_location
+    return os.path.dirname(compiler_location('reports', 'report.json')[0])
+
+def save_report(name, node_type, url, content, members):
+    """
+    Writes the record of a bundle that was just built. url is None for
+    bundles inlined into the page.
+    """
+
+    from compilation.storage.bundles import bundle_size, write_file
+
+    record = {
+        'name': name,
+        'type': node_type,
+        'url': url,
+        'built': time.time(),
+        'raw_bytes': sum(member['raw_bytes'] for member in members),
+        'bytes': bundle_size(content),
+        'gzip_bytes': gzip_size(content),
+        'compile_seconds': sum(member['compile_seconds'] for member in members),
+        'members': members,
+    }
+
+    directory = reports_directory()
+    try:
+        os.makedirs(directory)
+    except OSError:
+        if not os.path.isdir(directory):
+            raise
+    write_file(os.path.join(directory, '%s-%s.json' % (node_type, name)), json.dumps(record, sort_keys=True))
+    return record
+
+def collect(directory):
+    """
+    Returns the report of the records in directory: {'bundles': {id:
+    record}, 'totals': {...}}, with the newest record of each bundle.
+    """
+
+    bundles = {}
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as handle:
+                record = json.load(handle)
+        except (IOError, ValueError):
+            continue
+        key = bundle_id(record)
+        if key not in bundles or bundles[key]['built'] < record['built']:
+            bundles[key] = record
+
+    totals = dict((field, sum(record[field] for record in bundles.values()))
+                  for field in ('raw_bytes', 'bytes', 'gzip_bytes', 'compile_seconds'))
+    totals['bundles'] = len(bundles)
+    return {'bundles': bundles, 'totals': totals}
+
+def percent(old, new):
+    if not old:
+        return 0.0 if not new else 100.0
+    return (new - old) * 100.0 / old
+
+def diff(old, new, max_bytes=None, max_gzip_bytes=None, max_compile_seconds=None,
+         max_growth_bytes=None, max_growth_percent=None, max_total_bytes=None):
+    """
+    Compares two reports, returning (lines describing the changes, budget
+    violations). Growth budgets are on the gzipped size of each bundle.
+    """
+
+    limits = {'max_bytes': max_bytes, 'max_gzip_bytes': max_gzip_bytes, 'max_compile_seconds': max_compile_seconds}
+    lines = []
+    violations = []
+
+    old_bundles = old['bundles']
+    new_bundles = new['bundles']
+    for key in sorted(set(old_bundles) | set(new_bundles)):
+        before = old_bundles.get(key)
+        after = new_bundles.get(key)
+        if after is None:
+            lines.append('removed  %8d gz  %s' % (before['gzip_bytes'], key))
+            continue
+
+        if before is None:
+            lines.append('added    %8d gz  %s' % (after['gzip_bytes'], key))
+        elif before['gzip_bytes'] != after['gzip_bytes'] or before['bytes'] != after['bytes']:
+            growth = after['gzip_bytes'] - before['gzip_bytes']
+            lines.append('changed  %+8d gz  %+6.1f%%  %d -> %d bytes  %s' % (
+                growth, percent(before['gzip_bytes'], after['gzip_bytes']), before['bytes'], after['bytes'], key))
+            if max_growth_bytes is not None and growth > max_growth_bytes:
+                violations.append('%s grew by %d bytes gzipped, over the budget of %d' % (key, growth, max_growth_bytes))
+            if max_growth_percent is not None and percent(before['gzip_bytes'], after['gzip_bytes']) > max_growth_percent:
+                violations.append('%s grew by %.1f%% gzipped, over the budget of %.1f%%' % (
+                    key, percent(before['gzip_bytes'], after['gzip_bytes']), max_growth_percent))
+
+        for option, field, message in BUDGETS:
+            limit = limits[option]
+            if limit is not None and after[field] > limit:
+                violations.append(message % {'id': key, 'value': after[field], 'limit': limit})
+
+    old_totals = old['totals']
+    new_totals = new['totals']
+    lines.append('total    %+8d gz  %+6.1f%%  %d bundles, %d bytes, %d gzipped, %.2fs compiling' % (
+        new_totals['gzip_bytes'] - old_totals['gzip_bytes'], percent(old_totals['gzip_bytes'], new_totals['gzip_bytes']),
+        new_totals['bundles'], new_totals['bytes'], new_totals['gzip_bytes'], new_totals['compile_seconds']))
+    if max_total_bytes is not None and new_totals['gzip_bytes'] > max_total_bytes:
+        violations.append('all bundles are %d bytes gzipped, over the budget of %d' % (new_totals['gzip_bytes'], max_total_bytes))
+    return lines, violations
+
+def main(argv=None, stream=None):
+    import argparse
+    stream = stream or sys.stdout
+    parser = argparse.ArgumentParser(description='Bundle size and compile time reports.')
+    commands = parser.add_subparsers(dest='command')
+
+    collect_parser = commands.add_parser('collect', help='merge the bundle records into a report')
+    collect_parser.add_argument('--dir', default=None, help='record directory, COMPILER_ROOT/reports by default')
+    collect_parser.add_argument('-o', '--output', default=None, help='report file, stdout by default')
+
+    diff_parser = commands.add_parser('diff', help='compare two reports and check the budgets')
+    diff_parser.add_argument('old')
+    diff_parser.add_argument('new')
+    diff_parser.add_argument('--max-bytes', type=int, default=None, help='per bundle')
+    diff_parser.add_argument('--max-gzip-bytes', type=int, default=None, help='per bundle')
+    diff_parser.add_argument('--max-compile-seconds', type=float, default=None, help='per bundle')
+    diff_parser.add_argument('--max-growth-bytes', type=int, default=None, help='gzipped, per bundle')
+    diff_parser.add_argument('--max-growth-percent', type=float, default=None, help='gzipped, per bundle')
+    diff_parser.add_argument('--max-total-bytes', type=int, default=None, help='gzipped, all bundles')
+    options = parser.parse_args(argv)
+
+    if options.command == 'collect':
+        report = json.dumps(collect(options.dir or reports_directory()), indent=2, sort_keys=True)
+        if options.output:
+            with open(options.output, 'w') as handle:
+                handle.write(report)
+        else:
+            stream.write(report + '\n')
+        return 0
+
+    with open(options.old) as handle:
+        old = json.load(handle)
+    with open(options.new) as handle:
+        new = json.load(handle)
+    lines, violations = diff(old, new, options.max_bytes, options.max_gzip_bytes, options.max_compile_seconds,
+                             options.max_growth_bytes, options.max_growth_percent, options.max_total_bytes)
+    for line in lines:
+        stream.write(line + '\n')
+    for violation in violations:
+        stream.write('OVER BUDGET: %s\n' % violation)
+    return 1 if violations else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
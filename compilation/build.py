@@ -0,0 +1,182 @@
+"""
+Bulk building of bundles ahead of time (CI, deploys) instead of on the first
+render that needs them.
+
+    from compilation.build import build_bundles
+    summary = build_bundles([(script_handlers, 'script'), (style_handlers, 'style')])
+
+Jobs that produce the same bundle are built once, and a member shared by
+several bundles (the same file or inline content through the same handler)
+is compiled once. Compiles and writes are spread over a process pool sized
+to the machine.
+"""
+
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+
+from compilation.settings import COMPILER
+from compilation.handlers.base import HandlerRegistry
+from compilation.storage.shared import get_shared_state
+from compilation.storage.bundles import hash_handlers, bundle_location, bundle_size, measure_member, join_members, save_bundle
+
+class BuildSummary(object):
+    def __init__(self):
+        #(node_type, hash, full path, bytes) of every bundle written
+        self.built = []
+        #(node_type, hash, error) of every bundle that couldn't be built
+        self.failed = []
+        self.up_to_date = 0
+        self.duplicates = 0
+        self.compiled_members = 0
+        self.shared_members = 0
+        self.seconds = 0.0
+
+    @property
+    def bytes(self):
+        return sum(size for _, _, _, size in self.built)
+
+    def report(self, stream):
+        seconds = max(self.seconds, 1e-6)
+        megabytes = self.bytes / (1024.0 * 1024.0)
+        stream.write('Built %d bundles (%.1f MB) in %.1fs: %.1f bundles/s, %.2f MB/s\n' % (
+            len(self.built), megabytes, self.seconds, len(self.built) / seconds, megabytes / seconds))
+        stream.write('  %d members compiled, %d more shared between bundles\n' % (self.compiled_members, self.shared_members))
+        stream.write('  %d bundles up to date, %d duplicate jobs skipped\n' % (self.up_to_date, self.duplicates))
+        if self.failed:
+            stream.write('  %d bundles failed:\n' % len(self.failed))
+            for node_type, name, error in self.failed:
+                stream.write('    %s %s: %s\n' % (node_type, name, error))
+
+class Progress(object):
+    def __init__(self, stream, label, total, step=10):
+        self.stream = stream
+        self.label = label
+        self.total = total
+        self.step = step
+        self.done = 0
+        self.shown = -1
+        self.started = time.time()
+
+    def advance(self):
+        self.done += 1
+        percent = self.done * 100 // self.total
+        if percent // self.step > self.shown or self.done == self.total:
+            self.shown = percent // self.step
+            elapsed = max(time.time() - self.started, 1e-6)
+            self.stream.write('%s: %d/%d (%d%%), %.1f/s\n' % (self.label, self.done, self.total, percent, self.done / elapsed))
+
+def _compile_member(task):
+    (category, mime, _), source = task
+    try:
+        handler = getattr(HandlerRegistry, '%ss' % category)[mime].from_source(*source)
+        content, record = measure_member(handler)
+        return task[0], content, record, None
+    except Exception, e:
+        return task[0], None, None, '%s: %s' % (e.__class__.__name__, e)
+
+def _write_bundle(task):
+    full_path, content = task
+    save_bundle(full_path, content)
+    return full_path
+
+def build_bundles(jobs, processes=None, stream=sys.stdout, force=False):
+    """
+    Builds the bundles for an iterable of (handlers, node_type) jobs and
+    returns a BuildSummary. Bundles already in COMPILER_ROOT are skipped
+    unless force is set. processes defaults to the number of cpus, 1 builds
+    in this process.
+    """
+
+    started = time.time()
+    summary = BuildSummary()
+
+    seen = set()
+    bundles = []
+    members = {}
+    for handlers, node_type in jobs:
+        handlers = list(handlers)
+        if not handlers:
+            continue
+
+        name = hash_handlers(handlers)
+        if (node_type, name) in seen:
+            summary.duplicates += 1
+            continue
+        seen.add((node_type, name))
+
+        full_path, _ = bundle_location(name, node_type)
+        if not force and os.path.exists(full_path):
+            summary.up_to_date += 1
+            continue
+
+        keys = []
+        for handler in handlers:
+            key = (handler.category, handler.mime, handler.fingerprint)
+            if key in members:
+                summary.shared_members += 1
+            else:
+                members[key] = handler.source
+            keys.append(key)
+        bundles.append((node_type, name, full_path, keys))
+
+    processes = processes or multiprocessing.cpu_count()
+    pool = None
+    imap = itertools.imap
+    if processes > 1 and len(members) > 1:
+        pool = multiprocessing.Pool(processes)
+        imap = lambda function, tasks: pool.imap_unordered(function, tasks, chunksize=4)
+
+    try:
+        compiled = {}
+        records = {}
+        errors = {}
+        if members:
+            progress = Progress(stream, 'compile', len(members))
+            for key, content, record, error in imap(_compile_member, members.items()):
+                if error is None:
+                    compiled[key] = content
+                    records[key] = record
+                else:
+                    errors[key] = error
+                progress.advance()
+        summary.compiled_members = len(compiled)
+
+        writes = []
+        for node_type, name, full_path, keys in bundles:
+            failed = [errors[key] for key in keys if key in errors]
+            if failed:
+                summary.failed.append((node_type, name, failed[0]))
+                continue
+
+            content = join_members(compiled[key] for key in keys)
+            summary.built.append((node_type, name, full_path, bundle_size(content)))
+            writes.append((full_path, content))
+
+        if writes:
+            progress = Progress(stream, 'write', len(writes))
+            for _ in imap(_write_bundle, writes):
+                progress.advance()
+        
+        #Let the app servers know these are done
+        shared = get_shared_state()
+        if shared is not None:
+            for (node_type, name, _, _), (_, content) in zip(summary.built, writes):
+                shared.publish(node_type, name, content)
+        
+        if COMPILER.BUNDLE_REPORTS:
+            from compilation.budget import save_report
+            keys = dict(((node_type, name), keys) for node_type, name, _, keys in bundles)
+            for (node_type, name, _, _), (_, content) in zip(summary.built, writes):
+                save_report(name, node_type, bundle_location(name, node_type)[1], content,
+                            [records[key] for key in keys[(node_type, name)]])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    summary.seconds = time.time() - started
+    summary.report(stream)
+    return summary
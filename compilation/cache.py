@@ -0,0 +1,68 @@
+import os
+import threading
+from collections import OrderedDict
+
+_missing = object()
+
+class BoundedCache(object):
+    """
+    Thread safe dictionary that forgets its least recently used entries once
+    it holds more than `size` of them. A size of 0 or None means unbounded.
+    """
+
+    def __init__(self, size=None):
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.pop(key, _missing)
+            if value is _missing:
+                return default
+            #Reinsert so it becomes the most recently used
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        """
+        Stores the value and returns it, so callers can cache and return in
+        one statement.
+        """
+
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            if self.size:
+                while len(self._data) > self.size:
+                    self._data.popitem(last=False)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+def fresh(dependencies):
+    """
+    Returns whether none of the (path, mtime) pairs changed on disk since.
+    """
+
+    for path, mtime in dependencies:
+        try:
+            if os.path.getmtime(path) != mtime:
+                return False
+        except OSError:
+            return False
+    return True
@@ -0,0 +1,353 @@
+"""
+Rewriting of the url() and @import references in stylesheets going into a
+bundle.
+
+A stylesheet moved into COMPILER_ROOT/css can't reach the images and fonts
+next to it any more, so every url() that can be located is rewritten to a
+copy of the asset named after its content hash (COMPILER_ROOT/assets), which
+can be served with a far future expiry. Images of at most
+COMPILER.CSS_DATA_URI_THRESHOLD bytes go into the stylesheet as data: uris
+instead. References that can't be located are left alone.
+
+@imports of plain stylesheets are replaced by the stylesheet they import,
+recursively, so the browser doesn't have to fetch them one after the other.
+
+split_critical separates the rules needed to render the top of the page from
+the rest, for inlining them and loading the rest without blocking.
+"""
+
+import base64
+import mimetypes
+import os
+import posixpath
+import re
+import urlparse
+
+from compilation.cache import BoundedCache, fresh
+
+URL_PATTERN = re.compile(r'''url\(\s*(['"]?)([^'"\)]*?)\1\s*\)''')
+IMPORT_PATTERN = re.compile(r'''@import\s+(?:url\(\s*(['"]?)([^'"\)]+)\1\s*\)|(['"])([^'"]+)\3)\s*([^;]*);''')
+CHARSET_PATTERN = re.compile(r'''^\s*@charset\s+['"][^'"]*['"]\s*;''')
+COMMENT_PATTERN = re.compile(r'/\*.*?\*/', re.S)
+
+#At-rules whose body is a list of rules to split in turn
+GROUPING_RULES = ('@media', '@supports', '@document')
+
+#Rewritten stylesheets keyed by (content hash, url, file path), along with
+#the mtimes of the assets they reference
+rewritten = BoundedCache(1024)
+
+#Flattened imported stylesheets keyed by (path, url), along with the mtimes
+#of every file that went into them. Shared by all the bundles importing them.
+imports = BoundedCache(1024)
+
+def is_external(url):
+    return not url or url.startswith(('data:', '#', '//')) or urlparse.urlsplit(url).scheme != ''
+
+def split_suffix(url):
+    #Keep '?#iefix' and '#icon' style suffixes on the rewritten url
+    match = re.search(r'[?#]', url)
+    if match is None:
+        return url, ''
+    return url[:match.start()], url[match.start():]
+
+def absolute_url(url, base_url):
+    if url.startswith('/'):
+        return url
+    if base_url is not None:
+        return urlparse.urljoin(base_url, url)
+    return None
+
+def locate(url, base_url, base_path):
+    """
+    Returns the file a url() in a stylesheet refers to, or None. Relative
+    urls are tried against the stylesheet's url and then its directory.
+    """
+
+    from compilation.locators.base import LocatorRegistry
+
+    absolute = absolute_url(url, base_url)
+    if absolute is not None:
+        paths = [path for path in LocatorRegistry.locate(absolute) if os.path.isfile(path)]
+        if paths:
+            return paths[0]
+
+    if not url.startswith('/') and base_path is not None:
+        path = os.path.normpath(os.path.join(os.path.dirname(base_path), *url.split('/')))
+        if os.path.isfile(path):
+            return path
+    return None
+
+def asset_url(path):
+    """
+    Returns the url to reference the asset at path by: a data: uri when it
+    is a small enough image, or the url of its fingerprinted copy.
+    """
+
+    from compilation.settings import COMPILER
+    from compilation.hashing import hash_file
+    from compilation.storage.bundles import asset_location, save_bundle
+
+    mime, _ = mimetypes.guess_type(path)
+    threshold = COMPILER.CSS_DATA_URI_THRESHOLD
+    if threshold and mime is not None and mime.startswith('image/') and os.path.getsize(path) <= threshold:
+        with open(path, 'rb') as handle:
+            return 'data:%s;base64,%s' % (mime, base64.b64encode(handle.read()))
+
+    extension = posixpath.splitext(path)[1]
+    full_path, url = asset_location(hash_file(path), extension)
+    if not os.path.exists(full_path):
+        directory = os.path.dirname(full_path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(path, 'rb') as handle:
+            save_bundle(full_path, handle.read())
+    return url
+
+def rewrite_urls(content, base_url=None, base_path=None):
+    """
+    Returns the stylesheet content with its url()s pointing at fingerprinted
+    assets. base_url and base_path are where the stylesheet itself came from.
+    """
+
+    if 'url(' not in content:
+        return content
+
+    from compilation.hashing import hash_string
+    key = (hash_string(content), base_url, base_path)
+    cached = rewritten.get(key)
+    if cached is not None and fresh(cached[1]):
+        return cached[0]
+
+    dependencies = []
+    def replace(match):
+        quote, url = match.groups()
+        if is_external(url):
+            return match.group(0)
+
+        url, suffix = split_suffix(url)
+        path = locate(url, base_url, base_path)
+        if path is None:
+            return match.group(0)
+
+        dependencies.append((path, os.path.getmtime(path)))
+        new_url = asset_url(path)
+        if not new_url.startswith('data:'):
+            new_url += suffix
+        return 'url(%s%s%s)' % (quote, new_url, quote)
+
+    content = URL_PATTERN.sub(replace, content)
+    rewritten.set(key, (content, dependencies))
+    return content
+
+def relocate_urls(content, base_url, base_path):
+    """
+    Makes the url()s of an imported stylesheet work from the one importing
+    it: rewritten like any other, or made absolute when rewriting is off.
+    """
+
+    from compilation.settings import COMPILER
+    if COMPILER.CSS_REWRITE_URLS:
+        return rewrite_urls(content, base_url, base_path)
+    if base_url is None:
+        return content
+
+    def replace(match):
+        quote, url = match.groups()
+        if is_external(url) or url.startswith('/'):
+            return match.group(0)
+        return 'url(%s%s%s)' % (quote, urlparse.urljoin(base_url, url), quote)
+    return URL_PATTERN.sub(replace, content)
+
+def import_stylesheet(path, url, stack):
+    """
+    Returns (content, dependencies, cacheable) for an imported stylesheet
+    with its own imports flattened. Results that had to leave out an import
+    because of a cycle depend on who imported them, and aren't cacheable.
+    """
+
+    key = (path, url)
+    cached = imports.get(key)
+    if cached is not None and fresh(cached[1]):
+        return cached[0], cached[1], True
+
+    mtime = os.path.getmtime(path)
+    with open(path) as handle:
+        content = CHARSET_PATTERN.sub('', handle.read(), 1)
+
+    content, dependencies, cacheable = flatten(content, url, path, stack + (path,))
+    content = relocate_urls(content, url, path)
+    dependencies.append((path, mtime))
+    if cacheable:
+        imports.set(key, (content, dependencies))
+    return content, dependencies, cacheable
+
+def flatten(content, base_url, base_path, stack):
+    hoisted = []
+    dependencies = []
+    cacheable = [True]
+
+    def replace(match):
+        _, url_in_url, _, url_in_string, media = match.groups()
+        url = (url_in_url or url_in_string).strip()
+        path = None
+        if not is_external(url):
+            path = locate(split_suffix(url)[0], base_url, base_path)
+
+        if path is None:
+            #Still has to come before any rule to work
+            hoisted.append(match.group(0))
+            return ''
+
+        if path in stack:
+            cacheable[0] = False
+            return ''
+
+        imported, nested, nested_cacheable = import_stylesheet(path, absolute_url(url, base_url), stack)
+        dependencies.extend(nested)
+        cacheable[0] = cacheable[0] and nested_cacheable
+
+        media = media.strip()
+        if media:
+            return '@media %s {\n%s\n}' % (media, imported)
+        return imported
+
+    content = IMPORT_PATTERN.sub(replace, content)
+    if hoisted:
+        charset = CHARSET_PATTERN.match(content)
+        start = charset.end() if charset else 0
+        content = '%s\n%s\n%s' % (content[:start], '\n'.join(hoisted), content[start:])
+    return content, dependencies, cacheable[0]
+
+def flatten_imports(content, base_url=None, base_path=None):
+    """
+    Returns the stylesheet content with the stylesheets it @imports inlined
+    in their place, wrapped in @media blocks for imports with media queries.
+    Imports that can't be located (or are on other hosts) stay imports.
+    """
+
+    if '@import' not in content:
+        return content
+
+    stack = (base_path,) if base_path is not None else ()
+    return flatten(content, base_url, base_path, stack)[0]
+
+def imported_paths(content, base_url=None, base_path=None):
+    """
+    Returns the paths of the stylesheets flatten_imports would inline into
+    the content, recursively, for naming bundles after them too.
+    """
+
+    found = []
+    def walk(content, base_url, base_path, stack):
+        for match in IMPORT_PATTERN.finditer(content):
+            _, url_in_url, _, url_in_string, _ = match.groups()
+            url = (url_in_url or url_in_string).strip()
+            if is_external(url):
+                continue
+            path = locate(split_suffix(url)[0], base_url, base_path)
+            if path is None or path in stack or path in found:
+                continue
+
+            found.append(path)
+            with open(path) as handle:
+                walk(handle.read(), absolute_url(url, base_url), path, stack + (path,))
+
+    if '@import' in content:
+        walk(content, base_url, base_path, (base_path,) if base_path is not None else ())
+    return found
+
+def asset_paths(content, base_url=None, base_path=None, imports=False):
+    """
+    Returns the paths of the assets rewrite_urls would point the url()s of
+    the content at, and of the stylesheets it imports when imports are
+    flattened into it, for naming bundles after them too.
+    """
+
+    sources = [(content, base_url, base_path)]
+    if imports:
+        for path in imported_paths(content, base_url, base_path):
+            with open(path) as handle:
+                sources.append((handle.read(), None, path))
+
+    found = []
+    for content, base_url, base_path in sources:
+        for match in URL_PATTERN.finditer(content):
+            url = match.group(2)
+            if is_external(url):
+                continue
+            path = locate(split_suffix(url)[0], base_url, base_path)
+            if path is not None and path not in found:
+                found.append(path)
+    return found
+
+def split_rules(content):
+    """
+    Splits a stylesheet into its top level (prelude, body) pairs. body is
+    None for statements (@charset, @import).
+    """
+
+    content = COMMENT_PATTERN.sub('', content)
+    rules = []
+    depth = 0
+    start = 0
+    prelude_end = 0
+    index = 0
+    while index < len(content):
+        char = content[index]
+        if char in '"\'':
+            #Skip strings, braces in them don't count
+            index += 1
+            while index < len(content) and content[index] != char:
+                index += 2 if content[index] == '\\' else 1
+        elif char == '{':
+            if depth == 0:
+                prelude_end = index
+            depth += 1
+        elif char == '}' and depth > 0:
+            depth -= 1
+            if depth == 0:
+                rules.append((content[start:prelude_end].strip(), content[prelude_end + 1:index]))
+                start = index + 1
+        elif char == ';' and depth == 0:
+            rules.append((content[start:index + 1].strip(), None))
+            start = index + 1
+        index += 1
+    return rules
+
+def matches(prelude, selectors):
+    """
+    Returns whether any selector of a rule is one of the selectors, or
+    starts with one of them followed by a combinator or qualifier.
+    """
+
+    for selector in prelude.split(','):
+        selector = ' '.join(selector.split())
+        for wanted in selectors:
+            if selector == wanted or (selector.startswith(wanted) and selector[len(wanted)] in ' .#:[>+~'):
+                return True
+    return False
+
+def split_critical(content, selectors):
+    """
+    Returns the (critical, remainder) stylesheets for the rules of content
+    matching the selectors and the others. @font-face rules are critical,
+    other at-rules are not, and @media blocks are split in two.
+    """
+
+    critical = []
+    remainder = []
+    for prelude, body in split_rules(content):
+        if body is None:
+            remainder.append(prelude)
+        elif prelude.startswith(GROUPING_RULES):
+            inner_critical, inner_remainder = split_critical(body, selectors)
+            if inner_critical:
+                critical.append('%s{%s}' % (prelude, inner_critical))
+            if inner_remainder:
+                remainder.append('%s{%s}' % (prelude, inner_remainder))
+        elif prelude.startswith('@font-face') or (not prelude.startswith('@') and matches(prelude, selectors)):
+            critical.append('%s{%s}' % (prelude, body))
+        else:
+            remainder.append('%s{%s}' % (prelude, body))
+    return '\n'.join(critical), '\n'.join(remainder)
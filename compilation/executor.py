@@ -0,0 +1,203 @@
+"""
+Runs compiler commands (lessc, sass, coffee) for the compiling handlers with
+limits, so a burst of cold bundles can't fork a process per request:
+
+  * at most COMPILER.COMPILE_CONCURRENCY commands run at once, and at most
+    COMPILER.COMPILE_HANDLER_CONCURRENCY[mime] of one handler's.
+  * a command waits at most COMPILER.COMPILE_QUEUE_TIMEOUT seconds for a
+    slot before giving up with CompileBusy.
+  * a command running for more than COMPILER.COMPILE_TIMEOUT seconds is
+    killed, along with anything it started.
+  * COMPILER.COMPILE_CPU_LIMIT (seconds) and COMPILER.COMPILE_MEMORY_LIMIT
+    (bytes) are set as rlimits on the command.
+
+The limits are applied by the shell running the command, under setsid so
+the command gets a process group of its own, rather than in a preexec_fn:
+running python in the child of a threaded process can deadlock on a lock
+another thread held at the fork. Without a setsid binary, a timeout only
+kills the shell.
+
+In-process compilers (see compilation.backends) go through executor.call,
+under the same slots and timeout.
+
+executor.stats() returns the counters for monitoring.
+"""
+
+from distutils.spawn import find_executable
+import multiprocessing
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from compilation.settings import COMPILER
+from compilation.handlers.base import CompileError
+
+class CompileBusy(CompileError):
+    """
+    No slot freed up for a command in time. Says nothing about the input, so
+    unlike other CompileErrors it isn't remembered.
+    """
+
+    def __init__(self, command, waited):
+        CompileError.__init__(self, command, None, 'no compile slot after %.1fs' % waited)
+
+#Starts the command in a session and process group of its own
+SETSID = find_executable('setsid')
+
+def wrap(command):
+    """
+    Returns the argv running the shell command under the rlimits, in its
+    own process group where setsid is around, so a timeout kills the shell
+    and the compiler under it. The command isn't run if a limit can't be set.
+    """
+
+    limits = []
+    if COMPILER.COMPILE_CPU_LIMIT:
+        limits.append('ulimit -t %d' % COMPILER.COMPILE_CPU_LIMIT)
+    if COMPILER.COMPILE_MEMORY_LIMIT:
+        limits.append('ulimit -v %d' % (COMPILER.COMPILE_MEMORY_LIMIT // 1024))
+    script = ''.join('%s || exit 126\n' % limit for limit in limits) + command
+    argv = ['/bin/sh', '-c', script]
+    if SETSID:
+        argv.insert(0, SETSID)
+    return argv
+
+class CompileExecutor(object):
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.running = {}
+        self.total = 0
+        self.waiting = 0
+        self.peak_running = 0
+        self.peak_waiting = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+    def available(self, mime):
+        concurrency = COMPILER.COMPILE_CONCURRENCY or multiprocessing.cpu_count()
+        if self.total >= concurrency:
+            return False
+        handler_concurrency = COMPILER.COMPILE_HANDLER_CONCURRENCY.get(mime)
+        return handler_concurrency is None or self.running.get(mime, 0) < handler_concurrency
+
+    def acquire(self, mime, command):
+        started = time.time()
+        deadline = started + COMPILER.COMPILE_QUEUE_TIMEOUT
+        with self.condition:
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+            try:
+                while not self.available(mime):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise CompileBusy(command, time.time() - started)
+                    self.condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+                self.wait_seconds += time.time() - started
+
+            self.total += 1
+            self.running[mime] = self.running.get(mime, 0) + 1
+            self.peak_running = max(self.peak_running, self.total)
+
+    def release(self, mime):
+        with self.condition:
+            self.total -= 1
+            self.running[mime] -= 1
+            self.completed += 1
+            self.condition.notify_all()
+
+    def run(self, mime, command):
+        """
+        Runs a shell command for a handler of the mime type, returning its
+        (return code, stdout, stderr). Raises CompileBusy if it can't start
+        in time.
+        """
+
+        self.acquire(mime, command)
+        try:
+            process = subprocess.Popen(wrap(command), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+            timed_out = []
+            def kill():
+                timed_out.append(True)
+                try:
+                    if SETSID:
+                        os.killpg(process.pid, signal.SIGKILL)
+                    else:
+                        process.kill()
+                except OSError:
+                    pass
+
+            timer = threading.Timer(COMPILER.COMPILE_TIMEOUT, kill)
+            timer.daemon = True
+            timer.start()
+            try:
+                output, errors = process.communicate()
+            finally:
+                timer.cancel()
+        finally:
+            self.release(mime)
+
+        if timed_out:
+            with self.condition:
+                self.timeouts += 1
+            errors += 'Killed after %ss\n' % COMPILER.COMPILE_TIMEOUT
+        return process.returncode, output, errors
+
+    def call(self, mime, name, function, *args):
+        """
+        Runs function(*args) for a handler of the mime type under the same
+        slots and timeout as the commands, returning its result. A thread
+        can't be killed, so one running past COMPILE_TIMEOUT is given up on
+        with a CompileError and keeps its slot until it returns.
+        """
+
+        self.acquire(mime, name)
+        result = []
+        def work():
+            try:
+                result.append((True, function(*args)))
+            except Exception, e:
+                result.append((False, e))
+            finally:
+                self.release(mime)
+
+        thread = threading.Thread(target=work)
+        thread.daemon = True
+        try:
+            thread.start()
+        except:
+            self.release(mime)
+            raise
+        thread.join(COMPILER.COMPILE_TIMEOUT)
+
+        if not result:
+            with self.condition:
+                self.timeouts += 1
+            raise CompileError(name, None, 'Gave up after %ss\n' % COMPILER.COMPILE_TIMEOUT)
+        succeeded, value = result[0]
+        if not succeeded:
+            raise value
+        return value
+
+    def stats(self):
+        with self.condition:
+            return {
+                'running': self.total,
+                'running_by_mime': dict((mime, count) for mime, count in self.running.items() if count),
+                'waiting': self.waiting,
+                'peak_running': self.peak_running,
+                'peak_waiting': self.peak_waiting,
+                'completed': self.completed,
+                'timeouts': self.timeouts,
+                'rejected': self.rejected,
+                'wait_seconds': self.wait_seconds,
+            }
+
+executor = CompileExecutor()
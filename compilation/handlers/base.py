@@ -1,15 +1,89 @@
 import tempfile
 import os
+import copy
+import time
+
+from compilation.cache import BoundedCache
+from compilation.pipeline import PreInsert, Compile, RewriteUrls, Minify
+
+MODES = ('file', 'url', 'content')
+
+#Flyweights for file backed handlers, see BaseHandler.shared
+shared_handlers = BoundedCache(4096)
+
+#Recent failures to compile or locate something, keyed by what failed, so
+#they are raised again for COMPILER.FAILURE_TIMEOUT seconds instead of retried
+failures = BoundedCache(1024)
+
+class CompileError(Exception):
+    """
+    A compiler command exited with an error.
+    """
+    
+    def __init__(self, command, returncode, stderr):
+        Exception.__init__(self, '%s exited with %s: %s' % (command, returncode, stderr.strip()))
+        self.command = command
+        self.returncode = returncode
+        self.stderr = stderr
+
+def recent_failure(key):
+    failure = failures.get(key)
+    if failure is not None and failure[1] > time.time():
+        return failure[0]
+    return None
+
+def remember_failure(key, error):
+    from compilation.settings import COMPILER
+    if COMPILER.FAILURE_TIMEOUT:
+        failures.set(key, (error, time.time() + COMPILER.FAILURE_TIMEOUT))
+    return error
+
+def run_command(mime, command, content):
+    """
+    Runs a compiler command on the content through the executor, returning
+    its output. The command gets the path of a file holding the content.
+    """
+    
+    #Put the content into a file
+    with tempfile.NamedTemporaryFile(mode='w+b') as temp:
+        temp.write(content)
+        temp.flush()
+        
+        exec_command = command % temp.name
+        
+        from compilation.executor import executor
+        returncode, output, errors = executor.run(mime, exec_command)
+        if returncode != 0:
+            raise CompileError(exec_command, returncode, errors)
+        return output
 
 class HandlerRegistry(type):
     """
     Metaclass to register all classes with the mime type they handle.
+    
+    The handlers shipped here get empty __slots__ unless they define their
+    own, while other subclasses keep a __dict__ unless they declare
+    __slots__ themselves. All get interned mime and category strings and a
+    precomputed mode -> init_with_* table.
     """
     
     scripts = {}
     styles = {}
     
     def __new__(meta, classname, bases, class_dict):
+        if class_dict.get('__module__', '').startswith('compilation.handlers.'):
+            class_dict.setdefault('__slots__', ())
+        for key in ('mime', 'category'):
+            if isinstance(class_dict.get(key), str):
+                class_dict[key] = intern(class_dict[key])
+        
+        new_class = meta.create(classname, bases, class_dict)
+        new_class._initializers = dict((mode, getattr(new_class, 'init_with_%s' % mode))
+                                       for mode in MODES if hasattr(new_class, 'init_with_%s' % mode))
+        return new_class
+    
+    @classmethod
+    def create(meta, classname, bases, class_dict):
         #If abstract, don't register
         if 'abstract' in class_dict and class_dict['abstract']:
             #assert that we don't have a mime type
@@ -64,18 +138,77 @@ class HandlerRegistry(type):
 
 class BaseHandler(object):
     __metaclass__ = HandlerRegistry
+    __slots__ = ('_content', '_file_path', '_url')
     abstract = True
     
     mime = ''
     category = ''
+    #What the content goes through on its way into a bundle, see
+    #compilation.pipeline
+    stages = (PreInsert(), RewriteUrls(), Minify())
     
     def __init__(self, data, mode):
-        if mode not in ['file', 'url', 'content']:
+        try:
+            initializer = self._initializers[mode]
+        except KeyError:
             raise ValueError('Invalid mode')
         
         self._content = None
         self._file_path = None
-        getattr(self, 'init_with_%s' % mode)(data)
+        self._url = None
+        initializer(self, data)
+    
+    @classmethod
+    def shared(cls, data, mode):
+        """
+        Returns a handler that may be shared with every other caller asking
+        for the same file or url, so pages with hundreds of assets don't
+        allocate hundreds of handlers per render. Inline content is never
+        shared. Shared handlers must not be mutated, use clone() for that.
+        """
+        
+        if mode == 'content':
+            return cls(data, mode)
+        
+        key = (cls, mode, data)
+        handler = shared_handlers.get(key)
+        if handler is None or not os.path.exists(handler._file_path):
+            handler = shared_handlers.set(key, cls(data, mode))
+        return handler
+    
+    def clone(self):
+        """
+        Returns a private copy of the handler to run pre_insert on.
+        """
+        
+        clone = copy.copy(self)
+        clone.release()
+        return clone
+    
+    @property
+    def source(self):
+        """
+        The (data, mode, url) triple that recreates this handler through
+        from_source, for handing it to another process.
+        """
+        
+        if self._file_path is not None:
+            return self._file_path, 'file', self._url
+        return self._content, 'content', self._url
+    
+    @classmethod
+    def from_source(cls, data, mode, url=None):
+        handler = cls(data, mode)
+        handler._url = url
+        return handler
+    
+    def release(self):
+        """
+        Drops the content if it can be read from disk again.
+        """
+        
+        if self._file_path is not None:
+            self._content = None
     
     def init_with_file(self, data):
         self._file_path = data
@@ -90,24 +223,34 @@ class BaseHandler(object):
         
         from compilation.locators.base import LocatorRegistry
         
+        failure = recent_failure(('url', data))
+        if failure is not None:
+            raise failure
+        
         paths = []
         for locator in LocatorRegistry.locators:
-            paths.extend(locator.locate(data))
+            paths.extend(path for path in locator.locate(data) if os.path.exists(path))
         
         if len(paths) == 0:
-            raise ValueError('Unable to locate a file for the url (\'%s\').' % data)
+            raise remember_failure(('url', data), ValueError('Unable to locate a file for the url (\'%s\').' % data))
         
         #Schwartzian transform. ohh yeahh
         paths.sort(key=lambda path: os.path.getmtime(path))
         
         self._file_path = paths[0]
+        self._url = data
     
     def init_with_content(self, data):
         self._content = data
     
     def call_pre_insert(self):
-        if hasattr(self, 'pre_insert') and callable(self.pre_insert):
-            self.pre_insert()
+        """
+        Runs the stages on the content, returning the (stage id, seconds,
+        cached) of each one that ran.
+        """
+        
+        from compilation import pipeline
+        return pipeline.run(self)
     
     @property
     def content(self):
@@ -127,11 +270,21 @@ class BaseHandler(object):
         if self._content is None and self._file_path is None:
             raise ValueError('No content in this handler and no idea where to get any')
         
-        import hashlib, os.path
+        from compilation.hashing import hash_file, hash_string
         if self._file_path is not None:
-            return hashlib.sha1(str(os.path.getmtime(self._file_path))).hexdigest()
+            return hash_file(self._file_path)
+        
+        return hash_string(self._content)
+    
+    @property
+    def fingerprint(self):
+        """
+        The hash of what the handler puts into a bundle: its content and the
+        settings of its stages, see compilation.pipeline.fingerprint.
+        """
         
-        return hashlib.sha1(self._content).hexdigest()
+        from compilation import pipeline
+        return pipeline.fingerprint(self)
 
 
 class BaseCompilingHandler(BaseHandler):
@@ -141,17 +294,37 @@ class BaseCompilingHandler(BaseHandler):
     category = ''
     
     command = ''
+    #In-process compilers to try before the command, see compilation.backends
+    backends = ()
+    stages = (Compile(), RewriteUrls(), Minify())
     
     def pre_insert(self):
-        #Put the content into a file
-        with tempfile.NamedTemporaryFile(mode='w+b') as temp:
-            temp.write(self.content)
-            temp.flush()
-            
-            exec_command = self.command % temp.name
-            
-            output = os.popen(exec_command).read()
-            
-            self._content = output
+        #The same input fails the same way, don't run it again right away
+        key = ('compile', self.mime, self.hash)
+        failure = recent_failure(key)
+        if failure is not None:
+            raise failure
+        
+        from compilation.backends import choose_backend
+        from compilation.executor import executor, CompileBusy
+        backend = choose_backend(type(self))
+        if backend is not None:
+            name, compile = backend
+            try:
+                self._content = executor.call(self.mime, name, compile, self.content)
+            except CompileBusy:
+                raise
+            except CompileError, e:
+                raise remember_failure(key, e)
+            except Exception, e:
+                raise remember_failure(key, CompileError(name, 1, '%s: %s' % (e.__class__.__name__, e)))
+            return
+        
+        try:
+            self._content = run_command(self.mime, self.command, self.content)
+        except CompileBusy:
+            raise
+        except CompileError, e:
+            raise remember_failure(key, e)
 
 import handlers
@@ -2,6 +2,7 @@
 #find all of the classes defined in this file.
 
 from base import BaseHandler, BaseCompilingHandler
+from compilation.pipeline import FlattenImports, RewriteUrls, Minify
 
 class JavascriptHandler(BaseHandler):
     mime = 'text/javascript'
@@ -15,18 +16,22 @@ class CoffeescriptHandler(BaseCompilingHandler):
 class CSSHandler(BaseHandler):
     mime = 'text/css'
     category = 'style'
+    stages = (FlattenImports(), RewriteUrls(), Minify())
 
 class LESSHandler(BaseCompilingHandler):
     mime = 'text/less'
     category = 'style'
+    backends = ('lesscpy',)
     command = 'lessc %s'
 
 class SASSHandler(BaseCompilingHandler):
     mime = 'text/sass'
     category = 'style'
+    backends = ('libsass-sass',)
     command = 'sass -t compressed %s'
 
 class SCSSHandler(BaseCompilingHandler):
     mime = 'text/scss'
     category = 'style'
+    backends = ('libsass-scss',)
     command = 'sass --scss -t compressed %s'
\ No newline at end of file
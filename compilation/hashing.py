@@ -0,0 +1,104 @@
+"""
+Content fingerprints for handlers and bundles.
+
+The algorithm is picked with COMPILER.HASH_ALGORITHM: 'xxhash' (when the
+xxhash module is installed), 'blake2b', or anything hashlib.new accepts. Left
+unset it uses xxhash when available and blake2b otherwise.
+
+File digests are memoized on (device, inode, size, mtime) so a file is only
+read again once it changed, and the read is done in chunks through mmap so
+large files never sit in memory as a whole.
+"""
+
+import hashlib
+import mmap
+import os
+
+from compilation.settings import COMPILER
+from compilation.cache import BoundedCache
+
+CHUNK_SIZE = 1 << 20
+
+_constructors = {}
+_file_digests = BoundedCache(4096)
+
+def _blake2b():
+    if hasattr(hashlib, 'blake2b'):
+        blake2b = hashlib.blake2b
+    else:
+        try:
+            from pyblake2 import blake2b
+        except ImportError:
+            #Old interpreters without a binding get the next best thing
+            return hashlib.sha1
+    return lambda: blake2b(digest_size=20)
+
+def _xxhash():
+    try:
+        import xxhash
+    except ImportError:
+        return None
+    return xxhash.xxh64
+
+def get_algorithm(name=None):
+    """
+    Returns a callable making new hash objects for the named algorithm.
+    """
+
+    name = name or COMPILER.HASH_ALGORITHM
+    if name in _constructors:
+        return _constructors[name]
+
+    if name is None:
+        constructor = _xxhash() or _blake2b()
+    elif name == 'xxhash':
+        constructor = _xxhash() or _blake2b()
+    elif name == 'blake2b':
+        constructor = _blake2b()
+    else:
+        hashlib.new(name) #Blow up early on unknown names
+        constructor = lambda: hashlib.new(name)
+
+    _constructors[name] = constructor
+    return constructor
+
+def hash_string(data):
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    hasher = get_algorithm()()
+    hasher.update(data)
+    return hasher.hexdigest()
+
+def hash_file(path):
+    """
+    Returns the digest of the file content, reading it only if it changed
+    since the last call.
+    """
+
+    stat = os.stat(path)
+    mtime = getattr(stat, 'st_mtime_ns', stat.st_mtime)
+    key = (COMPILER.HASH_ALGORITHM, stat.st_dev, stat.st_ino, stat.st_size, mtime)
+
+    digest = _file_digests.get(key)
+    if digest is not None:
+        return digest
+
+    hasher = get_algorithm()()
+    #mmap refuses empty files, and there is nothing to read anyway
+    if stat.st_size > 0:
+        with open(path, 'rb') as handle:
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for offset in xrange(0, len(mapped), CHUNK_SIZE):
+                    hasher.update(mapped[offset:offset + CHUNK_SIZE])
+            finally:
+                mapped.close()
+
+    return _file_digests.set(key, hasher.hexdigest())
+
+def hash_digests(digests):
+    """
+    Combines a sequence of digests into one.
+    """
+
+    return hash_string(''.join(digests))
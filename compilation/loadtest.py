@@ -0,0 +1,259 @@
+"""
+Load test for rendering compile blocks from many processes and threads at
+once against one COMPILER_ROOT, to reproduce build contention locally:
+
+    python -m compilation.loadtest --processes 4 --threads 8 --renders 100 --latency 0.05
+
+The blocks reference source files through a stub compiler (sleep, then cat)
+with the given latency. Some of the files are shared by every block, and
+with --change-rate sources are rewritten while the test runs so bundles
+keep getting rebuilt. Every render is timed, and every bundle it emits is
+read back and checked for truncation. The report has latency percentiles,
+bundles written more than once, compiler runs, time spent waiting for a
+compile slot, and corrupted bundles.
+
+Nothing but the local disk is used. COMPILER_ROOT lives in a temporary
+directory unless --root is given.
+"""
+
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+MIME = 'text/x-loadtest'
+MEMBER = re.compile(r'^//member \S+ \S+ //end$')
+BUNDLE_URL = re.compile(r"src='/static/comp/js/([^']+)'")
+
+def configure(root):
+    """
+    Points django's settings at root, when nothing configured them yet.
+    """
+
+    from django.conf import settings
+    if not settings.configured:
+        settings.configure(MEDIA_ROOT=root, MEDIA_URL='/media/', COMPILER_ROOT='comp', INSTALLED_APPS=[])
+
+def stub_handler(latency):
+    from compilation.handlers.base import BaseCompilingHandler
+
+    class LoadTestHandler(BaseCompilingHandler):
+        mime = MIME
+        category = 'script'
+        command = 'sleep %s; cat %%s' % latency
+    return LoadTestHandler
+
+class Fragment(object):
+    #A block's nodelist, always rendering the same html
+    def __init__(self, html):
+        self.html = html
+
+    def render(self, context):
+        return self.html
+
+def write_member(root, name, version):
+    #Atomically, the test is about bundles and not half written sources
+    path = os.path.join(root, 'src', name + '.js')
+    temp_path = '%s.%s.tmp' % (path, version)
+    with open(temp_path, 'w') as handle:
+        handle.write('//member %s %s //end' % (name, version))
+    os.rename(temp_path, path)
+
+def setup(root, blocks, members, shared):
+    """
+    Makes the COMPILER_ROOT directories and source files in root, returning
+    the html of each block and the names of the sources.
+    """
+
+    for directory in ('comp', 'comp/css', 'comp/js', 'src'):
+        if not os.path.isdir(os.path.join(root, directory)):
+            os.makedirs(os.path.join(root, directory))
+
+    names = ['shared%d' % index for index in xrange(shared)]
+    html = []
+    for block in xrange(blocks):
+        own = ['block%d_%d' % (block, index) for index in xrange(members)]
+        names.extend(own)
+        html.append(''.join('<link type=\'%s\' href=\'/media/src/%s.js\' />' % (MIME, name)
+                            for name in names[:shared] + own))
+
+    for name in names:
+        write_member(root, name, 'v0')
+    return html, names
+
+def valid_bundle(path):
+    try:
+        with open(path) as handle:
+            content = handle.read()
+    except IOError:
+        return False
+    if not content.endswith('\n'):
+        return False
+    return all(MEMBER.match(line) for line in content[:-1].split('\n'))
+
+def worker(task):
+    """
+    Renders blocks from threads in this process, returning its measurements.
+    """
+
+    index, root, html, names, threads, renders, change_rate = task
+
+    from compilation import state
+    from compilation.executor import executor
+    from compilation.storage.bundles import add_build_listener, remove_build_listener
+    from compilation.templatetags import compiler
+
+    lock = threading.Lock()
+    latencies = []
+    saves = []
+    errors = []
+    corrupted = []
+
+    def built(node_type, name, full_path, seconds):
+        if full_path is not None:
+            with lock:
+                saves.append(full_path)
+
+    #Like the cached templates of a real process, shared by its threads
+    nodes = [compiler.CompilerNode(Fragment(block)) for block in html]
+
+    def render_loop(seed):
+        rng = random.Random(seed)
+        for _ in xrange(renders):
+            if change_rate and rng.random() < change_rate:
+                write_member(root, rng.choice(names), 'v%d' % rng.randrange(1 << 30))
+
+            node = rng.choice(nodes)
+            state.start()
+            started = time.time()
+            try:
+                markup = node.render(None)
+            except Exception, e:
+                with lock:
+                    errors.append('%s: %s' % (e.__class__.__name__, e))
+                continue
+            finally:
+                state.finish()
+
+            elapsed = time.time() - started
+            bad = [name for name in BUNDLE_URL.findall(markup) if not valid_bundle(os.path.join(root, 'comp', 'js', name))]
+            with lock:
+                latencies.append(elapsed)
+                corrupted.extend(bad)
+
+    add_build_listener(built)
+    try:
+        workers = [threading.Thread(target=render_loop, args=(index * threads + thread,)) for thread in xrange(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    finally:
+        remove_build_listener(built)
+
+    return {
+        'latencies': latencies,
+        'saves': saves,
+        'errors': errors,
+        'corrupted': corrupted,
+        'executor': executor.stats(),
+    }
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+class LoadTestReport(object):
+    def __init__(self, results, root, seconds):
+        self.seconds = seconds
+        self.latencies = sum((result['latencies'] for result in results), [])
+        self.saves = sum((result['saves'] for result in results), [])
+        self.errors = sum((result['errors'] for result in results), [])
+        #Seen while rendering, and left on disk after
+        self.corrupted = sorted(set(sum((result['corrupted'] for result in results), [])))
+        directory = os.path.join(root, 'comp', 'js')
+        self.corrupted_on_disk = sorted(name for name in os.listdir(directory)
+                                        if not name.startswith('.') and not valid_bundle(os.path.join(directory, name)))
+        self.compiles = sum(result['executor']['completed'] for result in results)
+        self.wait_seconds = sum(result['executor']['wait_seconds'] for result in results)
+        self.peak_running = max([result['executor']['peak_running'] for result in results] or [0])
+
+    @property
+    def duplicate_builds(self):
+        return len(self.saves) - len(set(self.saves))
+
+    def report(self, stream):
+        stream.write('%d renders in %.1fs (%.1f/s), %d errors\n' % (
+            len(self.latencies), self.seconds, len(self.latencies) / max(self.seconds, 1e-6), len(self.errors)))
+        stream.write('  latency ms: p50 %.1f, p90 %.1f, p99 %.1f, max %.1f\n' % tuple(
+            percentile(self.latencies, fraction) * 1000 for fraction in (0.5, 0.9, 0.99, 1.0)))
+        stream.write('  %d bundles written, %d of them duplicate builds\n' % (len(self.saves), self.duplicate_builds))
+        stream.write('  %d compiler runs, %.2fs waiting for compile slots, at most %d at once in a process\n' % (
+            self.compiles, self.wait_seconds, self.peak_running))
+        stream.write('  %d corrupted bundles seen, %d on disk\n' % (len(self.corrupted), len(self.corrupted_on_disk)))
+        for error in sorted(set(self.errors))[:10]:
+            stream.write('    %s\n' % error)
+
+def run(root, processes=2, threads=4, renders=50, latency=0.05, blocks=10, members=3, shared=2, change_rate=0.0):
+    """
+    Runs the load test against the COMPILER_ROOT in root, which django's
+    settings must already point at, and returns a LoadTestReport.
+    """
+
+    from compilation.handlers.base import HandlerRegistry
+
+    html, names = setup(root, blocks, members, shared)
+    handler = stub_handler(latency)
+    tasks = [(index, root, html, names, threads, renders, change_rate) for index in xrange(processes)]
+
+    started = time.time()
+    try:
+        if processes > 1:
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.map(worker, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = map(worker, tasks)
+    finally:
+        HandlerRegistry.delete_handler(handler)
+
+    return LoadTestReport(results, root, time.time() - started)
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Render compile blocks from many processes and threads at once.')
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4, help='threads per process')
+    parser.add_argument('--renders', type=int, default=50, help='renders per thread')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds each stub compile takes')
+    parser.add_argument('--blocks', type=int, default=10, help='distinct compile blocks')
+    parser.add_argument('--members', type=int, default=3, help='sources of its own per block')
+    parser.add_argument('--shared', type=int, default=2, help='sources in every block')
+    parser.add_argument('--change-rate', type=float, default=0.0, help='chance a render rewrites a source first')
+    parser.add_argument('--root', help='MEDIA_ROOT to use and keep, instead of a temporary one')
+    options = parser.parse_args(argv)
+
+    root = options.root or tempfile.mkdtemp(prefix='compilation-loadtest')
+    try:
+        configure(root)
+        report = run(root, options.processes, options.threads, options.renders, options.latency,
+                     options.blocks, options.members, options.shared, options.change_rate)
+        report.report(sys.stdout)
+    finally:
+        if not options.root:
+            shutil.rmtree(root)
+
+    return 1 if report.corrupted or report.corrupted_on_disk else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
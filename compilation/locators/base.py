@@ -26,6 +26,29 @@ class LocatorRegistry(type):
             self.locators.remove(locator)
         except KeyError:
             pass
+    
+    @classmethod
+    def locate(self, url):
+        """
+        Returns every path the locators found for the url.
+        """
+        
+        paths = []
+        for locator in self.locators:
+            paths.extend(locator.locate(url))
+        return paths
+    
+    @classmethod
+    def prefetch(self, urls):
+        """
+        Gives every locator the chance to warm up for a batch of urls before
+        they are located one at a time.
+        """
+        
+        urls = list(urls)
+        for locator in self.locators:
+            if hasattr(locator, 'prefetch'):
+                locator.prefetch(urls)
 
 class BaseLocator(object):
     __metaclass__ = LocatorRegistry
@@ -35,6 +58,10 @@ class BaseLocator(object):
     def locate(cls, url):
         return []
     
+    @classmethod
+    def prefetch(cls, urls):
+        pass
+    
     @classmethod
     def valid(cls):
         return True
@@ -2,6 +2,7 @@
 #find all of the classes defined in this file.
 
 from base import BaseLocator, BaseDirectoryLocator
+from remote import is_remote, remote_cache
 
 class DjangoMediaLocator(BaseLocator):
     @classmethod
@@ -35,6 +36,25 @@ class DjangoStaticfilesLocator(BaseLocator):
         except:
             return False
 
+class RemoteLocator(BaseLocator):
+    """
+    Locates absolute http(s) urls by fetching them into an on-disk cache.
+    """
+    
+    @classmethod
+    def locate(cls, url):
+        if not is_remote(url):
+            return []
+        
+        path = remote_cache.fetch(url)
+        if path is None:
+            return []
+        return [path]
+    
+    @classmethod
+    def prefetch(cls, urls):
+        remote_cache.prefetch(url for url in urls if is_remote(url))
+
 #Example directory locator for when your files aren't served by django
 #
 #    class MyDirectoryLocator(BaseDirectoryLocator):
@@ -0,0 +1,219 @@
+"""
+Fetching of absolute http(s) urls for the RemoteLocator.
+
+Responses are kept in an on-disk cache next to a small metadata file holding
+the validators (ETag/Last-Modified), so stale entries are revalidated with a
+conditional request instead of downloaded again. Redirects are followed, up
+to MAX_REDIRECTS, and the result is cached under the url asked for.
+Connections are pooled and kept alive per host.
+"""
+
+import hashlib
+import httplib
+import json
+import os
+import threading
+import time
+import urlparse
+
+from compilation.settings import COMPILER
+
+#Redirects followed before a url is given up on, like unversioned CDN paths
+#pointing at the latest release
+MAX_REDIRECTS = 5
+REDIRECTS = (301, 302, 303, 307, 308)
+
+#Threads fetching for RemoteCache.prefetch, started on first use
+_fetch_pool = None
+_fetch_pool_lock = threading.Lock()
+
+def is_remote(url):
+    return url.startswith('http://') or url.startswith('https://')
+
+def fetch_pool():
+    global _fetch_pool
+    with _fetch_pool_lock:
+        if _fetch_pool is None:
+            from multiprocessing.pool import ThreadPool
+            _fetch_pool = ThreadPool(COMPILER.REMOTE_CONCURRENCY)
+        return _fetch_pool
+
+class ConnectionPool(object):
+    """
+    Keeps idle keep-alive connections around per (scheme, host, port).
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def _connect(self, key):
+        scheme, host, port = key
+        connection_class = httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection
+        with self._lock:
+            self.created += 1
+        return connection_class(host, port, timeout=self.timeout or COMPILER.REMOTE_TIMEOUT)
+
+    def _checkout(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._connect(key), False
+
+    def _checkin(self, key, connection):
+        with self._lock:
+            self._idle.setdefault(key, []).append(connection)
+
+    def request(self, url, headers=None):
+        """
+        Performs a GET and returns (status, headers, body). Headers are keyed
+        by their lowercase name.
+        """
+
+        parts = urlparse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path = '%s?%s' % (path, parts.query)
+
+        connection, reused = self._checkout(key)
+        try:
+            try:
+                connection.request('GET', path, headers=headers or {})
+                response = connection.getresponse()
+            except (httplib.HTTPException, IOError):
+                #Idle connections may have been closed by the server, give
+                #it one more shot on a fresh one
+                connection.close()
+                if not reused:
+                    raise
+                connection = self._connect(key)
+                connection.request('GET', path, headers=headers or {})
+                response = connection.getresponse()
+
+            body = response.read()
+        except:
+            connection.close()
+            raise
+
+        if response.getheader('connection', '').lower() == 'close' or response.will_close:
+            connection.close()
+        else:
+            self._checkin(key, connection)
+
+        return response.status, dict(response.getheaders()), body
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+class RemoteCache(object):
+    """
+    On-disk cache of remote files. Within COMPILER.REMOTE_MAX_AGE seconds of
+    the last check a cached file is returned without touching the network.
+    """
+
+    def __init__(self, pool=None):
+        self.pool = pool or ConnectionPool()
+        self._checked = {}
+        self._lock = threading.Lock()
+
+    def paths(self, url):
+        directory = COMPILER.REMOTE_CACHE_DIR
+        extension = os.path.splitext(urlparse.urlsplit(url).path)[1]
+        name = hashlib.sha1(url).hexdigest()
+        path = os.path.join(directory, name + extension)
+        return path, path + '.meta'
+
+    def _read_meta(self, meta_path):
+        try:
+            with open(meta_path) as handle:
+                return json.load(handle)
+        except (IOError, ValueError):
+            return {}
+
+    def fresh(self, url):
+        """
+        Whether the local copy of url was checked within REMOTE_MAX_AGE.
+        """
+
+        with self._lock:
+            checked = self._checked.get(url)
+        return checked is not None and time.time() - checked < COMPILER.REMOTE_MAX_AGE and os.path.exists(self.paths(url)[0])
+
+    def fetch(self, url):
+        """
+        Returns the path of a local copy of url, or None if it can't be had.
+        """
+
+        path, meta_path = self.paths(url)
+        if self.fresh(url):
+            return path
+
+        if not os.path.exists(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                pass #Someone else made it
+
+        headers = {}
+        meta = {}
+        if os.path.exists(path):
+            meta = self._read_meta(meta_path)
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last-modified'):
+                headers['If-Modified-Since'] = meta['last-modified']
+
+        try:
+            request_url = url
+            for _ in xrange(MAX_REDIRECTS + 1):
+                status, response_headers, body = self.pool.request(request_url, headers)
+                location = response_headers.get('location')
+                if status not in REDIRECTS or not location:
+                    break
+                request_url = urlparse.urljoin(request_url, location)
+                if not is_remote(request_url):
+                    break
+        except (httplib.HTTPException, IOError):
+            #Serve what we have if the remote is down
+            return path if os.path.exists(path) else None
+
+        if status == 200:
+            #Renamed into place, readers never see partial files
+            from compilation.storage.bundles import write_file
+            write_file(path, body)
+            meta = dict((key, response_headers[key]) for key in ('etag', 'last-modified') if key in response_headers)
+            write_file(meta_path, json.dumps(meta))
+        elif status != 304 or not os.path.exists(path):
+            return path if os.path.exists(path) else None
+
+        with self._lock:
+            self._checked[url] = time.time()
+        return path
+
+    def prefetch(self, urls):
+        """
+        Fetches all the urls that aren't fresh concurrently, returning their
+        paths in order.
+        """
+
+        urls = list(urls)
+        stale = [url for url in urls if not self.fresh(url)]
+        if len(stale) < 2:
+            return [self.fetch(url) for url in urls]
+
+        fetched = dict(zip(stale, fetch_pool().map(self.fetch, stale)))
+        return [fetched[url] if url in fetched else self.fetch(url) for url in urls]
+
+    def clear(self):
+        with self._lock:
+            self._checked.clear()
+
+remote_cache = RemoteCache()
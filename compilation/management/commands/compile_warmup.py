@@ -0,0 +1,20 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+    help = 'Renders pages through the test client to build their bundles, see compilation.warmup.'
+    args = '[path ...]'
+    option_list = BaseCommand.option_list + (
+        make_option('--paths', action='append', default=[], help='file with a path per line'),
+        make_option('--log', action='append', default=[], help='nginx or gunicorn access log'),
+        make_option('--top', type='int', default=None, help='only the most requested paths of the logs'),
+        make_option('--concurrency', type='int', default=4, help='pages rendered at once'),
+        make_option('--host', default='localhost', help='Host header of the requests'),
+    )
+    
+    def handle(self, *args, **options):
+        from compilation.warmup import warm_up
+        if not warm_up(args, options['paths'], options['log'], options['top'], options['concurrency'],
+                       options['host'], self.stdout):
+            raise CommandError('Some pages failed to render')
@@ -0,0 +1,125 @@
+from compilation import state
+
+class RequestStateMiddleware(object):
+    """
+    Scopes compilation.state to a request. Compile blocks repeated within the
+    request are then only compiled once, and bundles already on the page can
+    be left out with COMPILER_SUPPRESS_DUPLICATE_TAGS.
+    
+    The other middlewares in this module work on that state, and can be
+    stacked in any order below it in MIDDLEWARE_CLASSES. The PreloadMiddleware
+    goes above the ones emitting bundles, so it sees them.
+    """
+    
+    def process_request(self, request):
+        state.start()
+    
+    def process_response(self, request, response):
+        state.finish()
+        return response
+
+def require_state(middleware):
+    if not state.active():
+        from django.core.exceptions import ImproperlyConfigured
+        raise ImproperlyConfigured('%s needs compilation.middleware.RequestStateMiddleware above it in MIDDLEWARE_CLASSES'
+                                   % middleware.__class__.__name__)
+
+class PreloadMiddleware(object):
+    """
+    Adds a `Link: <url>; rel=preload` header for every bundle emitted while
+    rendering the response so browsers can start fetching them before the
+    html is parsed.
+    """
+    
+    def process_request(self, request):
+        require_state(self)
+    
+    def process_response(self, request, response):
+        links = ['<%s>; rel=preload; as=%s' % (url, node_type) for url, node_type in state.bundles()]
+        if links:
+            if response.has_header('Link'):
+                links.insert(0, response['Link'])
+            response['Link'] = ', '.join(links)
+        
+        return response
+
+class AggregationMiddleware(object):
+    """
+    Merges the bundles of every compile block on a page into one script and
+    one style bundle. The blocks only leave placeholders while the page
+    renders, and the merged tags replace the first placeholder of each type.
+    Every distinct combination of members gets its own bundle, built once.
+    """
+    
+    def process_request(self, request):
+        require_state(self)
+        state.aggregate()
+    
+    def process_response(self, request, response):
+        if state.aggregating() and not getattr(response, 'streaming', False):
+            from compilation.templatetags.compiler import aggregate_tag
+            content = response.content
+            changed = False
+            for node_type in ('style', 'script'):
+                placeholder = state.placeholder(node_type)
+                if placeholder not in content:
+                    continue
+                markup = aggregate_tag(state.collected(node_type), node_type)
+                first, rest = content.split(placeholder, 1)
+                content = first + markup + rest.replace(placeholder, '')
+                changed = True
+            
+            if changed:
+                response.content = content
+                if response.has_header('Content-Length'):
+                    response['Content-Length'] = str(len(content))
+        
+        return response
+
+class StreamingCompileMiddleware(object):
+    """
+    Compiles the regions of html responses between COMPILER_STREAM_MARKERS,
+    for pages that don't go through {% compile %}. Streaming responses are
+    rewritten chunk by chunk as they go out, only holding back the regions.
+    """
+    
+    def process_request(self, request):
+        require_state(self)
+    
+    def rewriter(self):
+        from compilation.settings import COMPILER
+        from compilation.streaming import RegionRewriter
+        from compilation.templatetags.compiler import compile_fragment
+        start, end = COMPILER.STREAM_MARKERS
+        return RegionRewriter(compile_fragment, start, end)
+    
+    def stream(self, chunks):
+        #Runs after process_response, while the server sends the response and
+        #the request's state is gone, so it has its own
+        rewriter = self.rewriter()
+        state.start()
+        try:
+            for chunk in chunks:
+                output = rewriter.feed(chunk)
+                if output:
+                    yield output
+            output = rewriter.close()
+            if output:
+                yield output
+        finally:
+            state.finish()
+    
+    def process_response(self, request, response):
+        if 'html' not in response.get('Content-Type', ''):
+            return response
+        
+        if getattr(response, 'streaming', False):
+            response.streaming_content = self.stream(response.streaming_content)
+            if response.has_header('Content-Length'):
+                del response['Content-Length']
+            return response
+        
+        response.content = self.rewriter().rewrite(response.content)
+        if response.has_header('Content-Length'):
+            response['Content-Length'] = str(len(response.content))
+        return response
@@ -0,0 +1,232 @@
+"""
+The transform stages a handler's content goes through on its way into a
+bundle. Handlers declare theirs in order:
+
+    class CoffeescriptHandler(BaseCompilingHandler):
+        stages = (Compile(), Minify())
+
+Stages marked `cache` only depend on their input and key(handler), so their
+output is kept by (stage id, key, input digest): changing a stage's
+configuration changes its key and re-runs it, and the stages after it only
+run again if its output changed. Stages reading other files (imports,
+assets) check those themselves and aren't cached here, but list them in
+dependencies(): their digests go into the handler's fingerprint, which names
+the bundles it's in.
+
+stage_timings() returns the runs, cache hits and seconds of every stage.
+"""
+
+import os
+import threading
+import time
+
+from compilation.cache import BoundedCache, fresh
+from compilation.settings import COMPILER
+
+#(stage id, key, input digest) -> output
+outputs = BoundedCache(COMPILER.STAGE_CACHE_SIZE)
+
+#Files the stages of a handler read besides its content, keyed by (content
+#hash, url, file path, stage keys), as (path, mtime) pairs
+dependency_paths = BoundedCache(COMPILER.STAGE_CACHE_SIZE)
+
+#stage id -> {'runs', 'hits', 'seconds'}
+timings = {}
+_lock = threading.Lock()
+
+def record(stage_id, seconds, hit=False):
+    with _lock:
+        timing = timings.setdefault(stage_id, {'runs': 0, 'hits': 0, 'seconds': 0.0})
+        timing['runs'] += 1
+        timing['hits'] += int(hit)
+        timing['seconds'] += seconds
+
+def stage_timings():
+    with _lock:
+        return dict((stage_id, timing.copy()) for stage_id, timing in timings.items())
+
+class Stage(object):
+    #Name in cache keys and timings
+    id = ''
+    #Whether the output is cached by (id, key, input digest)
+    cache = False
+    #Whether the output is made from files listed by dependencies()
+    reads_files = False
+
+    def enabled(self, handler):
+        return True
+
+    def key(self, handler):
+        """
+        What, besides the input, the output depends on.
+        """
+
+        return ()
+
+    def dependencies(self, handler, content):
+        """
+        The files, besides the input, the output is made from.
+        """
+
+        return ()
+
+    def run(self, handler, content):
+        raise NotImplementedError
+
+class PreInsert(Stage):
+    #The handler's own pre_insert, if it has one
+    id = 'pre_insert'
+
+    def enabled(self, handler):
+        return callable(getattr(handler, 'pre_insert', None))
+
+    def run(self, handler, content):
+        handler._content = content
+        handler.pre_insert()
+        return handler.content
+
+class Compile(PreInsert):
+    #BaseCompilingHandler.pre_insert, which only depends on the command
+    id = 'compile'
+    cache = True
+
+    def key(self, handler):
+        from compilation.backends import choose_backend
+        backend = choose_backend(type(handler))
+        return (type(handler), handler.command, backend and backend[0])
+
+class FlattenImports(Stage):
+    id = 'flatten_imports'
+    reads_files = True
+
+    def enabled(self, handler):
+        return COMPILER.CSS_FLATTEN_IMPORTS
+
+    def dependencies(self, handler, content):
+        from compilation.css import imported_paths
+        return imported_paths(content, handler._url, handler._file_path)
+
+    def run(self, handler, content):
+        from compilation.css import flatten_imports
+        return flatten_imports(content, handler._url, handler._file_path)
+
+class RewriteUrls(Stage):
+    id = 'rewrite_urls'
+    reads_files = True
+
+    def enabled(self, handler):
+        return handler.category == 'style' and COMPILER.CSS_REWRITE_URLS
+
+    def dependencies(self, handler, content):
+        #The url()s of compiled stylesheets are taken from their source
+        from compilation.css import asset_paths
+        imports = any(isinstance(stage, FlattenImports) and stage.enabled(handler) for stage in handler.stages)
+        return asset_paths(content, handler._url, handler._file_path, imports)
+
+    def run(self, handler, content):
+        from compilation.css import rewrite_urls
+        return rewrite_urls(content, handler._url, handler._file_path)
+
+class Minify(Stage):
+    #COMPILER.MINIFY_COMMANDS[category], run like the compiler commands
+    id = 'minify'
+    cache = True
+
+    def enabled(self, handler):
+        return bool(COMPILER.MINIFY_COMMANDS.get(handler.category))
+
+    def key(self, handler):
+        return (COMPILER.MINIFY_COMMANDS[handler.category],)
+
+    def run(self, handler, content):
+        from compilation.handlers.base import run_command
+        return run_command('minify-%s' % handler.category, COMPILER.MINIFY_COMMANDS[handler.category], content)
+
+def stage_keys(handler):
+    #The stages that run and what their output depends on besides the input
+    return repr([(stage.id, stage.key(handler)) for stage in handler.stages if stage.enabled(handler)])
+
+def dependencies(handler):
+    """
+    Returns the paths of the files the handler's stages read besides its
+    content, like the stylesheets it imports.
+    """
+
+    stages = [stage for stage in handler.stages if stage.reads_files and stage.enabled(handler)]
+    if not stages:
+        return []
+
+    key = (handler.hash, handler._url, handler._file_path, stage_keys(handler))
+    cached = dependency_paths.get(key)
+    if cached is not None and fresh(cached):
+        return [path for path, _ in cached]
+
+    #Without loading the content into what may be a shared handler
+    content = handler._content
+    if content is None:
+        with open(handler._file_path) as handle:
+            content = handle.read()
+
+    paths = []
+    for stage in stages:
+        paths.extend(path for path in stage.dependencies(handler, content) if path not in paths)
+    dependency_paths.set(key, [(path, os.path.getmtime(path)) for path in paths])
+    return paths
+
+def fingerprint(handler):
+    """
+    Returns the digest of the handler's content, of the settings of its
+    stages and of the files they read, which names its part of a bundle:
+    changing any of them renames the bundles it's in.
+    """
+
+    from compilation.hashing import hash_digests, hash_file, hash_string
+    return hash_digests([handler.hash, hash_string(stage_keys(handler))] + [hash_file(path) for path in dependencies(handler)])
+
+def run(handler):
+    """
+    Runs the handler's stages on its content, leaving the result as its
+    content. Returns the (stage id, seconds, cached) of each stage that ran.
+    """
+
+    from compilation.hashing import hash_string
+
+    content = None
+    #The first input is the handler's own, whose digest may be memoized
+    digest = None
+    first = True
+    ran = []
+    for stage in handler.stages:
+        if not stage.enabled(handler):
+            continue
+
+        started = time.time()
+        hit = False
+        if stage.cache:
+            if digest is None:
+                digest = handler.hash if first else hash_string(content)
+            if first:
+                content = handler.content
+            key = (stage.id, stage.key(handler), digest)
+            output = outputs.get(key)
+            if output is None:
+                output = outputs.set(key, stage.run(handler, content))
+            else:
+                hit = True
+        else:
+            if first:
+                content = handler.content
+            output = stage.run(handler, content)
+
+        seconds = time.time() - started
+        record(stage.id, seconds, hit)
+        ran.append((stage.id, seconds, hit))
+
+        if output is not content:
+            digest = None
+        content = output
+        first = False
+
+    if not first:
+        handler._content = content
+    return ran
@@ -0,0 +1,178 @@
+"""
+cProfile profiles of compile block renders, taken in production without a
+profiler attached:
+
+  * COMPILER_PROFILE_SAMPLE_RATE = N profiles one in every N renders.
+  * COMPILER_PROFILE_SLOW_THRESHOLD = seconds profiles every render, and
+    keeps the profiles of the ones that took at least that long.
+
+Profiles go to COMPILER_PROFILE_DIR as <time>-<pid>-<bundle hashes>.pstats,
+with a .json next to each holding the render time, the bundles and the time
+spent in each phase (parse, locate, hash, compile, write). Only the newest
+COMPILER_PROFILE_KEEP are kept.
+
+    python -m compilation.profiling --top 20
+
+sums them up into the time per phase and the hottest functions.
+"""
+
+import cProfile
+import itertools
+import json
+import os
+import pstats
+import re
+import sys
+import time
+
+#(phase, file, function) of the function each phase is timed by
+PHASES = (
+    ('parse', 'compilation/parser/LxmlParser.py', 'tree'),
+    ('locate', 'compilation/handlers/base.py', 'init_with_url'),
+    ('hash', 'compilation/storage/bundles.py', 'hash_handlers'),
+    ('compile', 'compilation/storage/bundles.py', 'build_bundle'),
+    ('write', 'compilation/storage/bundles.py', 'save_bundle'),
+)
+
+#Which phase the report puts a function under, by where it lives
+AREAS = (
+    ('parse', ('compilation/parser/', 'lxml')),
+    ('locate', ('compilation/locators/',)),
+    ('hash', ('compilation/hashing.py',)),
+    ('compile', ('compilation/handlers/', 'compilation/pipeline.py', 'compilation/backends.py', 'compilation/executor.py', 'compilation/css.py', 'subprocess.py')),
+    ('write', ('compilation/storage/',)),
+)
+
+BUNDLE_NAME = re.compile(r'/([0-9a-f]{16,})\.(?:js|css)')
+
+_renders = itertools.count()
+
+def reason():
+    """
+    Returns why the next render should be profiled ('sample' or 'slow'), or
+    None if it shouldn't.
+    """
+
+    from compilation.settings import COMPILER
+    rate = COMPILER.PROFILE_SAMPLE_RATE
+    if rate and next(_renders) % rate == 0:
+        return 'sample'
+    if COMPILER.PROFILE_SLOW_THRESHOLD is not None:
+        return 'slow'
+    return None
+
+def profiled(function, *args):
+    """
+    Calls function(*args), which renders markup, under the profiler when
+    it's sampled.
+    """
+
+    why = reason()
+    if why is None:
+        return function(*args)
+
+    profile = cProfile.Profile()
+    started = time.time()
+    markup = profile.runcall(function, *args)
+    seconds = time.time() - started
+
+    from compilation.settings import COMPILER
+    if why == 'sample' or seconds >= COMPILER.PROFILE_SLOW_THRESHOLD:
+        save_profile(profile, markup, seconds, why)
+    return markup
+
+def area(filename):
+    filename = filename.replace(os.sep, '/')
+    for phase, patterns in AREAS:
+        if any(pattern in filename for pattern in patterns):
+            return phase
+    return ''
+
+def phase_times(stats):
+    """
+    Returns {phase: seconds} for a pstats stats dict.
+    """
+
+    times = dict((phase, 0.0) for phase, _, _ in PHASES)
+    for (filename, _, function), (_, _, _, cumulative, _) in stats.items():
+        filename = filename.replace(os.sep, '/')
+        for phase, phase_file, phase_function in PHASES:
+            if function == phase_function and filename.endswith(phase_file):
+                times[phase] += cumulative
+    return times
+
+def save_profile(profile, markup, seconds, why):
+    from compilation.settings import COMPILER
+    directory = COMPILER.PROFILE_DIR
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    stats = pstats.Stats(profile)
+    bundles = sorted(set(BUNDLE_NAME.findall(markup or '')))
+    name = '%.6f-%d-%s' % (time.time(), os.getpid(), '-'.join(bundle[:12] for bundle in bundles) or 'none')
+    path = os.path.join(directory, name)
+
+    stats.dump_stats(path + '.pstats')
+    with open(path + '.json', 'w') as handle:
+        json.dump({
+            'seconds': seconds,
+            'reason': why,
+            'bundles': bundles,
+            'phases': phase_times(stats.stats),
+        }, handle)
+
+    rotate(directory, COMPILER.PROFILE_KEEP)
+    return path
+
+def rotate(directory, keep):
+    names = sorted(name[:-len('.pstats')] for name in os.listdir(directory) if name.endswith('.pstats'))
+    for name in names[:max(len(names) - keep, 0)]:
+        for extension in ('.pstats', '.json'):
+            try:
+                os.unlink(os.path.join(directory, name + extension))
+            except OSError:
+                pass
+
+def report(directory, top, stream):
+    names = sorted(name[:-len('.pstats')] for name in os.listdir(directory) if name.endswith('.pstats'))
+    if not names:
+        stream.write('No profiles in %s\n' % directory)
+        return
+
+    seconds = 0.0
+    phases = dict((phase, 0.0) for phase, _, _ in PHASES)
+    for name in names:
+        try:
+            with open(os.path.join(directory, name + '.json')) as handle:
+                meta = json.load(handle)
+        except (IOError, ValueError):
+            continue
+        seconds += meta['seconds']
+        for phase, phase_seconds in meta['phases'].items():
+            phases[phase] = phases.get(phase, 0.0) + phase_seconds
+
+    stream.write('%d profiles, %.3fs of renders\n' % (len(names), seconds))
+    for phase, _, _ in PHASES:
+        stream.write('  %-8s %8.3fs %5.1f%%\n' % (phase, phases[phase], phases[phase] * 100 / max(seconds, 1e-9)))
+
+    stats = pstats.Stats(*[os.path.join(directory, name + '.pstats') for name in names])
+    hottest = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:top]
+    stream.write('\n%-8s %10s %10s %8s  function\n' % ('phase', 'own', 'cumulative', 'calls'))
+    for (filename, line, function), (_, calls, own, cumulative, _) in hottest:
+        stream.write('%-8s %9.3fs %9.3fs %8d  %s:%d(%s)\n' % (area(filename), own, cumulative, calls, filename, line, function))
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Sum up the compile block render profiles.')
+    parser.add_argument('--dir', default=None, help='profile directory, COMPILER_PROFILE_DIR by default')
+    parser.add_argument('--top', type=int, default=20, help='how many functions to list')
+    options = parser.parse_args(argv)
+    directory = options.dir
+    if directory is None:
+        #Copied profiles can be summed up without the site's settings
+        from compilation.settings import COMPILER
+        directory = COMPILER.PROFILE_DIR
+    report(directory, options.top, sys.stdout)
+
+if __name__ == '__main__':
+    main()
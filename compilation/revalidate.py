@@ -0,0 +1,61 @@
+"""
+Background rebuilding of compile blocks whose files changed, for
+COMPILER_REVALIDATE_IN_BACKGROUND: the previous bundles keep being served
+until the new ones are built, and the block switches over when they are.
+"""
+
+import logging
+import Queue
+import threading
+
+logger = logging.getLogger('compilation')
+
+class Revalidator(object):
+    def __init__(self, workers=1):
+        self.workers = workers
+        self.queue = Queue.Queue()
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def submit(self, key, build, store):
+        """
+        Queues build() and store(result) unless a build for the same key is
+        already queued or running. Returns whether it was queued.
+        """
+
+        with self.lock:
+            if key in self.pending:
+                return False
+            self.pending.add(key)
+
+            if not self.threads:
+                for _ in xrange(self.workers):
+                    thread = threading.Thread(target=self.work, name='compilation-revalidate')
+                    thread.daemon = True
+                    thread.start()
+                    self.threads.append(thread)
+
+        self.queue.put((key, build, store))
+        return True
+
+    def work(self):
+        while True:
+            key, build, store = self.queue.get()
+            try:
+                store(build())
+            except Exception:
+                logger.exception('Rebuilding a block in the background failed')
+            finally:
+                with self.lock:
+                    self.pending.discard(key)
+                self.queue.task_done()
+
+    def join(self):
+        """
+        Waits for everything queued so far to be built.
+        """
+
+        self.queue.join()
+
+revalidator = Revalidator()
@@ -1,3 +1,6 @@
+import os
+import tempfile
+
 try:
     from django.conf import settings as django_settings
 except ImportError:
@@ -12,5 +15,107 @@ class PropertyDict(object):
 
 COMPILER = PropertyDict({
     'PARSER_CLASS': getattr(django_settings, 'COMPILER_PARSER_CLASS', 'LxmlParser'),
-    'URL_GENERATOR': getattr(django_settings, 'COMPILER_URL_GENERATOR', 'MediaUrlGenerator')
+    'URL_GENERATOR': getattr(django_settings, 'COMPILER_URL_GENERATOR', 'MediaUrlGenerator'),
+    
+    #Development mode: no bundles, a tag per member. Plain files are
+    #referenced at their own url and only compiled ones get a file.
+    'DEBUG': getattr(django_settings, 'COMPILER_DEBUG', False),
+    
+    #Bundles of at most this many bytes are emitted inline instead of as a
+    #file reference. 0 disables inlining.
+    'INLINE_THRESHOLD': getattr(django_settings, 'COMPILER_INLINE_THRESHOLD', 0),
+    'INLINE_CACHE_SIZE': getattr(django_settings, 'COMPILER_INLINE_CACHE_SIZE', 1024),
+    
+    #Extra attribute for generated script tags: '', 'defer' or 'async'
+    'SCRIPT_LOADING': getattr(django_settings, 'COMPILER_SCRIPT_LOADING', ''),
+    #Emit a <link rel='preload'> in front of every generated tag
+    'PRELOAD_TAGS': getattr(django_settings, 'COMPILER_PRELOAD_TAGS', False),
+    
+    #Leave out tags for bundles already emitted earlier in the same request
+    #(needs compilation.middleware.RequestStateMiddleware)
+    'SUPPRESS_DUPLICATE_TAGS': getattr(django_settings, 'COMPILER_SUPPRESS_DUPLICATE_TAGS', False),
+    
+    #Compiled output kept per block with template variables, keyed on the
+    #values of the variables it reads
+    'BLOCK_CACHE_SIZE': getattr(django_settings, 'COMPILER_BLOCK_CACHE_SIZE', 256),
+    
+    #What marks the regions of html responses the StreamingCompileMiddleware
+    #compiles, instead of a {% compile %} block
+    'STREAM_MARKERS': getattr(django_settings, 'COMPILER_STREAM_MARKERS', ('<!-- compile -->', '<!-- endcompile -->')),
+    
+    #Compile and locate failures are raised again without retrying for this
+    #many seconds (0 disables). With COMPILE_ERRORS = 'stale' a block that
+    #fails to compile keeps its last good output instead of raising.
+    'FAILURE_TIMEOUT': getattr(django_settings, 'COMPILER_FAILURE_TIMEOUT', 60),
+    'COMPILE_ERRORS': getattr(django_settings, 'COMPILER_COMPILE_ERRORS', 'fail'),
+    
+    #Keep serving a block's previous bundles while the ones for its changed
+    #files are built on a background thread, see compilation.revalidate
+    'REVALIDATE_IN_BACKGROUND': getattr(django_settings, 'COMPILER_REVALIDATE_IN_BACKGROUND', False),
+    
+    #Compile with Python bindings (libsass, lesscpy) when they are installed
+    #instead of running the handler's command, see compilation.backends
+    'IN_PROCESS_COMPILERS': getattr(django_settings, 'COMPILER_IN_PROCESS_COMPILERS', True),
+    
+    #Limits on the compiler commands, see compilation.executor. None for
+    #COMPILE_CONCURRENCY is the number of cpus, HANDLER_CONCURRENCY maps
+    #mime types to their own cap.
+    'COMPILE_CONCURRENCY': getattr(django_settings, 'COMPILER_COMPILE_CONCURRENCY', None),
+    'COMPILE_HANDLER_CONCURRENCY': getattr(django_settings, 'COMPILER_COMPILE_HANDLER_CONCURRENCY', {}),
+    'COMPILE_QUEUE_TIMEOUT': getattr(django_settings, 'COMPILER_COMPILE_QUEUE_TIMEOUT', 30),
+    'COMPILE_TIMEOUT': getattr(django_settings, 'COMPILER_COMPILE_TIMEOUT', 60),
+    'COMPILE_CPU_LIMIT': getattr(django_settings, 'COMPILER_COMPILE_CPU_LIMIT', None),
+    'COMPILE_MEMORY_LIMIT': getattr(django_settings, 'COMPILER_COMPILE_MEMORY_LIMIT', None),
+    
+    #cProfile one in every PROFILE_SAMPLE_RATE renders (0 disables), and/or
+    #every render taking PROFILE_SLOW_THRESHOLD seconds (None disables), see
+    #compilation.profiling
+    'PROFILE_SAMPLE_RATE': getattr(django_settings, 'COMPILER_PROFILE_SAMPLE_RATE', 0),
+    'PROFILE_SLOW_THRESHOLD': getattr(django_settings, 'COMPILER_PROFILE_SLOW_THRESHOLD', None),
+    'PROFILE_DIR': getattr(django_settings, 'COMPILER_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'compilation-profiles')),
+    'PROFILE_KEEP': getattr(django_settings, 'COMPILER_PROFILE_KEEP', 100),
+    
+    #Remote (http/https) assets are cached here and only revalidated with
+    #the origin once REMOTE_MAX_AGE seconds have passed
+    'REMOTE_CACHE_DIR': getattr(django_settings, 'COMPILER_REMOTE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'compilation-remote')),
+    'REMOTE_MAX_AGE': getattr(django_settings, 'COMPILER_REMOTE_MAX_AGE', 300),
+    'REMOTE_TIMEOUT': getattr(django_settings, 'COMPILER_REMOTE_TIMEOUT', 10),
+    'REMOTE_CONCURRENCY': getattr(django_settings, 'COMPILER_REMOTE_CONCURRENCY', 8),
+    
+    #Rewrite url()s in stylesheets to fingerprinted copies of the assets,
+    #and inline images of at most CSS_DATA_URI_THRESHOLD bytes as data: uris
+    #(0 disables), see compilation.css
+    'CSS_REWRITE_URLS': getattr(django_settings, 'COMPILER_CSS_REWRITE_URLS', False),
+    'CSS_DATA_URI_THRESHOLD': getattr(django_settings, 'COMPILER_CSS_DATA_URI_THRESHOLD', 0),
+    #Selectors of the rules inlined for {% compile critical %} blocks, with the
+    #rest of the stylesheet loaded without blocking rendering. Blocks can
+    #list their own with {% compile critical=".header, .nav" %}.
+    'CRITICAL_SELECTORS': getattr(django_settings, 'COMPILER_CRITICAL_SELECTORS', (
+        'html', 'body', ':root', '*', 'header', 'nav', 'h1', 'h2', '.header', '#header', '.nav', '#nav')),
+    #Inline the stylesheets plain css @imports
+    'CSS_FLATTEN_IMPORTS': getattr(django_settings, 'COMPILER_CSS_FLATTEN_IMPORTS', False),
+    
+    #Commands minifying the output of the handlers of a category, like
+    #{'script': 'uglifyjs %s', 'style': 'cleancss %s'}, see compilation.pipeline
+    'MINIFY_COMMANDS': getattr(django_settings, 'COMPILER_MINIFY_COMMANDS', {}),
+    #Outputs of the cached pipeline stages kept in memory
+    'STAGE_CACHE_SIZE': getattr(django_settings, 'COMPILER_STAGE_CACHE_SIZE', 512),
+    #Write a gzipped copy next to every bundle (name.js.gz) for the web
+    #server to send as is
+    'GZIP_BUNDLES': getattr(django_settings, 'COMPILER_GZIP_BUNDLES', False),
+    #Record the size and compile time of every bundle built, and of each of
+    #its members, in COMPILER_ROOT/reports, see compilation.budget
+    'BUNDLE_REPORTS': getattr(django_settings, 'COMPILER_BUNDLE_REPORTS', False),
+    
+    #Alias of a django cache shared by all app servers to coordinate bundle
+    #builds through, see compilation.storage.shared. None disables it.
+    'SHARED_CACHE': getattr(django_settings, 'COMPILER_SHARED_CACHE', None),
+    'SHARED_STORE_BYTES': getattr(django_settings, 'COMPILER_SHARED_STORE_BYTES', False),
+    'SHARED_TIMEOUT': getattr(django_settings, 'COMPILER_SHARED_TIMEOUT', 60 * 60 * 24 * 30),
+    'SHARED_LEASE_TIMEOUT': getattr(django_settings, 'COMPILER_SHARED_LEASE_TIMEOUT', 60),
+    'SHARED_WAIT_TIMEOUT': getattr(django_settings, 'COMPILER_SHARED_WAIT_TIMEOUT', 30),
+    
+    #'xxhash', 'blake2b' or any hashlib name. None picks xxhash when it is
+    #installed and blake2b otherwise.
+    'HASH_ALGORITHM': getattr(django_settings, 'COMPILER_HASH_ALGORITHM', None),
 })
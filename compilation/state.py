@@ -0,0 +1,98 @@
+"""
+Per request state shared between the template tag and the middleware.
+
+Nothing is recorded unless a middleware called `start` for the current
+thread, so rendering outside of a request (management commands, tests) stays
+side effect free.
+"""
+
+import threading
+import uuid
+
+_local = threading.local()
+
+def start(aggregate=False):
+    _local.active = True
+    _local.bundles = []
+    _local.emitted = set()
+    _local.rendered = {}
+    _local.collected = [] if aggregate else None
+    _local.token = uuid.uuid4().hex
+
+def aggregate():
+    #Collect the compile blocks of the current request, see aggregating
+    if active():
+        _local.collected = []
+
+def finish():
+    _local.__dict__.clear()
+
+def active():
+    return getattr(_local, 'active', False)
+
+def record_bundle(url, node_type):
+    """
+    Remembers a bundle url emitted during this request, in emission order.
+    """
+    
+    if not active():
+        return
+    if (url, node_type) not in _local.bundles:
+        _local.bundles.append((url, node_type))
+
+def bundles():
+    return list(getattr(_local, 'bundles', []))
+
+def first_emission(key):
+    """
+    Returns whether a bundle, identified by its (node_type, hash) pair, is
+    emitted for the first time during this request.
+    """
+    
+    if not active():
+        return True
+    if key in _local.emitted:
+        return False
+    _local.emitted.add(key)
+    return True
+
+def get_rendered(html):
+    """
+    Returns the markup a compile block with this output already produced
+    during this request, or None.
+    """
+    
+    return getattr(_local, 'rendered', {}).get(html)
+
+def set_rendered(html, markup):
+    if active():
+        _local.rendered[html] = markup
+    return markup
+
+def aggregating():
+    """
+    Returns whether compile blocks should hand their handlers to the
+    AggregationMiddleware instead of emitting tags.
+    """
+    
+    return getattr(_local, 'collected', None) is not None
+
+def placeholder(node_type):
+    #Unguessable, so nothing else on the page gets replaced
+    return '<!--compilation:%s:%s-->' % (_local.token, node_type)
+
+def collect(node_type, handlers):
+    """
+    Adds the handlers of a compile block to the page's bundle, returning the
+    placeholder to put where its tag would have gone.
+    """
+    
+    _local.collected.append((node_type, list(handlers)))
+    return placeholder(node_type)
+
+def collected(node_type):
+    handlers = []
+    for collected_type, collected_handlers in getattr(_local, 'collected', None) or []:
+        if collected_type == node_type:
+            handlers.extend(collected_handlers)
+    return handlers
@@ -0,0 +1,162 @@
+"""
+Naming, building and saving of bundles in COMPILER_ROOT.
+"""
+
+import gzip
+import os
+import tempfile
+import threading
+import time
+
+EXTENSIONS = {
+    'script': 'js',
+    'style': 'css',
+}
+
+#Called with (node_type, name, full path, seconds) for every bundle built
+#while rendering, see add_build_listener
+_build_listeners = []
+_listeners_lock = threading.Lock()
+
+def add_build_listener(listener):
+    with _listeners_lock:
+        _build_listeners.append(listener)
+
+def remove_build_listener(listener):
+    with _listeners_lock:
+        if listener in _build_listeners:
+            _build_listeners.remove(listener)
+
+def bundle_built(node_type, name, full_path, seconds):
+    """
+    Tells the build listeners a bundle was built in the calling thread, in
+    seconds. full_path is None for bundles inlined into the page.
+    """
+
+    with _listeners_lock:
+        listeners = list(_build_listeners)
+    for listener in listeners:
+        listener(node_type, name, full_path, seconds)
+
+def hash_handlers(handlers):
+    from compilation.hashing import hash_digests
+    return hash_digests(handler.fingerprint for handler in handlers)
+
+def compiler_location(directory, filename):
+    """
+    Returns the (full path, url) pair for a file in a COMPILER_ROOT directory.
+    """
+
+    from django.conf import settings
+    url = os.path.join(settings.MEDIA_URL, directory, filename) #TODO: change to url_generators
+
+    #temp hack
+    url = '/static/comp/%s/%s' % (directory, filename)
+    return os.path.join(settings.MEDIA_ROOT, settings.COMPILER_ROOT, directory, filename), url
+
+def bundle_location(name, node_type):
+    """
+    Returns the (full path, url) pair for the bundle with the given hash.
+    """
+
+    extension = EXTENSIONS[node_type]
+    return compiler_location(extension, '%s.%s' % (name, extension))
+
+def asset_location(name, extension):
+    """
+    Returns the (full path, url) pair for an asset referenced from a bundle,
+    by the hash of its content and its extension ('.png').
+    """
+
+    return compiler_location('assets', name + extension)
+
+def build_member(handler):
+    """
+    Returns the content a handler contributes to a bundle.
+    """
+
+    #pre_insert replaces the content, so work on a private copy of what
+    #may be a shared handler. The copy (and its content) goes away after.
+    handler = handler.clone()
+    handler.call_pre_insert()
+    return handler.content
+
+def measure_member(handler):
+    """
+    Returns the content a handler contributes to a bundle along with its
+    record for the bundle reports, see compilation.budget.
+    """
+
+    from compilation.budget import member_record, member_source
+
+    handler = handler.clone()
+    source = member_source(handler)
+    raw_bytes = bundle_size(handler.content)
+    ran = handler.call_pre_insert()
+    return handler.content, member_record(handler, source, raw_bytes, ran)
+
+def join_members(contents):
+    output = []
+    for content in contents:
+        output.append(content)
+        output.append('\n')
+    return ''.join(output)
+
+def build_bundle(handlers, records=None):
+    """
+    Runs the handlers and returns the concatenated bundle content. Given a
+    list of records, the record of every member is added to it.
+    """
+
+    if records is None:
+        return join_members(build_member(handler) for handler in handlers)
+
+    contents = []
+    for handler in handlers:
+        content, record = measure_member(handler)
+        contents.append(content)
+        records.append(record)
+    return join_members(contents)
+
+def bundle_size(content):
+    if isinstance(content, unicode):
+        return len(content.encode('utf-8'))
+    return len(content)
+
+def write_file(full_path, content, compress=False):
+    #Next to the final name and renamed into place
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(full_path), prefix='.build')
+    try:
+        with os.fdopen(fd, 'wb') as handle:
+            if compress:
+                #No name or time in the header, the same bundle gzips the same
+                with gzip.GzipFile(filename='', mode='wb', compresslevel=9, fileobj=handle, mtime=0) as zipped:
+                    zipped.write(content)
+            else:
+                handle.write(content)
+        os.chmod(temp_path, 0644)
+        os.rename(temp_path, full_path)
+    except:
+        os.unlink(temp_path)
+        raise
+
+def save_bundle(full_path, content):
+    """
+    Writes the bundle next to its final name and renames it into place, so
+    other threads and processes never see a partially written bundle. With
+    COMPILER.GZIP_BUNDLES the gzipped copy is in place before the bundle.
+    """
+
+    from compilation.settings import COMPILER
+
+    if isinstance(content, unicode):
+        content = content.encode('utf-8')
+
+    extension = os.path.splitext(full_path)[1][1:]
+    if COMPILER.GZIP_BUNDLES and extension in EXTENSIONS.values():
+        from compilation import pipeline
+        started = time.time()
+        write_file(full_path + '.gz', content, compress=True)
+        pipeline.record('gzip', time.time() - started)
+
+    write_file(full_path, content)
@@ -0,0 +1,137 @@
+"""
+Bundle state shared between app servers through Django's cache framework.
+
+Set COMPILER_SHARED_CACHE to the alias of a cache every node can reach
+(memcached, redis) and a bundle built on one node is reused by the others:
+
+  * built bundles are recorded by hash, and while one node builds a bundle
+    it holds a lease so the others wait for it instead of building too.
+  * with COMPILER_SHARED_STORE_BYTES the bundle content is stored as well,
+    so nodes with their own disks write it out without compiling. Without
+    it, waiting only pays off when COMPILER_ROOT is on shared storage.
+"""
+
+import time
+import uuid
+
+from compilation.settings import COMPILER
+
+_states = {}
+
+def get_shared_state():
+    """
+    Returns the SharedBundleState for COMPILER.SHARED_CACHE, or None when
+    sharing is off.
+    """
+
+    alias = COMPILER.SHARED_CACHE
+    if not alias:
+        return None
+
+    if alias not in _states:
+        try:
+            from django.core.cache import caches
+            cache = caches[alias]
+        except ImportError:
+            from django.core.cache import get_cache
+            cache = get_cache(alias)
+        _states[alias] = SharedBundleState(cache)
+    return _states[alias]
+
+class SharedBundleState(object):
+    def __init__(self, cache, prefix='compilation'):
+        self.cache = cache
+        self.prefix = prefix
+
+    def key(self, kind, node_type, name):
+        return '%s:%s:%s:%s' % (self.prefix, kind, node_type, name)
+
+    def is_built(self, node_type, name):
+        return self.cache.get(self.key('built', node_type, name)) is not None
+
+    def fetch(self, node_type, name):
+        """
+        Returns the stored bundle content, or None.
+        """
+
+        if not COMPILER.SHARED_STORE_BYTES:
+            return None
+        return self.cache.get(self.key('bytes', node_type, name))
+
+    def publish(self, node_type, name, content=None):
+        timeout = COMPILER.SHARED_TIMEOUT
+        if content is not None and COMPILER.SHARED_STORE_BYTES:
+            self.cache.set(self.key('bytes', node_type, name), content, timeout)
+        self.cache.set(self.key('built', node_type, name), 1, timeout)
+
+    def acquire(self, node_type, name):
+        """
+        Tries to take the build lease, returning a token on success and None
+        when another node holds it. Leases expire on their own after
+        COMPILER.SHARED_LEASE_TIMEOUT seconds in case the holder dies.
+        """
+
+        token = uuid.uuid4().hex
+        if self.cache.add(self.key('lease', node_type, name), token, COMPILER.SHARED_LEASE_TIMEOUT):
+            return token
+        return None
+
+    def release(self, node_type, name, token):
+        key = self.key('lease', node_type, name)
+        if self.cache.get(key) == token:
+            self.cache.delete(key)
+
+    def wait(self, node_type, name, timeout=None, interval=0.1):
+        """
+        Waits until the bundle is marked built or the lease is gone. Returns
+        whether it was built.
+        """
+
+        timeout = COMPILER.SHARED_WAIT_TIMEOUT if timeout is None else timeout
+        deadline = time.time() + timeout
+        lease = self.key('lease', node_type, name)
+        while True:
+            if self.is_built(node_type, name):
+                return True
+            if self.cache.get(lease) is None or time.time() >= deadline:
+                return self.is_built(node_type, name)
+            time.sleep(interval)
+
+    def obtain(self, node_type, name, build, exists, save=None):
+        """
+        Returns the content of a bundle missing from the local disk, or None
+        when exists() says it showed up there (shared storage) meanwhile.
+        build() is only called when no other node has it or is building it.
+        save(content), when given, writes the content out: a bundle built
+        here is saved before it's marked built and the lease is released, so
+        nodes waiting on it find it with exists().
+        """
+
+        content = self.fetch(node_type, name)
+        if content is not None:
+            if save is not None:
+                save(content)
+            return content
+
+        token = self.acquire(node_type, name)
+        if token is None:
+            if self.wait(node_type, name):
+                content = self.fetch(node_type, name)
+                if content is not None:
+                    if save is not None:
+                        save(content)
+                    return content
+                if exists():
+                    return None
+            #The other node gave up, died, or can't share the bytes with us
+            token = self.acquire(node_type, name)
+
+        try:
+            content = build()
+            if save is not None:
+                save(content)
+            self.publish(node_type, name, content)
+        finally:
+            if token is not None:
+                self.release(node_type, name, token)
+        return content
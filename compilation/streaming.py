@@ -0,0 +1,81 @@
+"""
+Incremental rewriting of marked regions in html, for compiling responses as
+they stream out instead of in the template engine.
+
+    <!-- compile -->
+    <script type='text/javascript' src='/media/a.js'></script>
+    <!-- endcompile -->
+
+Everything outside of a region is passed on as soon as it arrives. A region
+is held back until its end marker shows up and then replaced with whatever
+the compile function returns for it.
+"""
+
+def partial_suffix(data, marker):
+    """
+    Returns the length of the longest end of data that the marker starts
+    with, which may turn into the marker with the next chunk.
+    """
+
+    for length in xrange(min(len(data), len(marker) - 1), 0, -1):
+        if data.endswith(marker[:length]):
+            return length
+    return 0
+
+class RegionRewriter(object):
+    def __init__(self, compile, start, end):
+        self.compile = compile
+        self.start = start
+        self.end = end
+        self.pending = ''
+        self.region = None
+
+    def feed(self, chunk):
+        """
+        Returns the output that can be sent on after this chunk.
+        """
+
+        data = self.pending + chunk
+        self.pending = ''
+        output = []
+        while data:
+            if self.region is None:
+                index = data.find(self.start)
+                if index == -1:
+                    keep = len(data) - partial_suffix(data, self.start)
+                    output.append(data[:keep])
+                    self.pending = data[keep:]
+                    break
+
+                output.append(data[:index])
+                data = data[index + len(self.start):]
+                self.region = []
+            else:
+                index = data.find(self.end)
+                if index == -1:
+                    keep = len(data) - partial_suffix(data, self.end)
+                    self.region.append(data[:keep])
+                    self.pending = data[keep:]
+                    break
+
+                self.region.append(data[:index])
+                output.append(self.compile(''.join(self.region)))
+                data = data[index + len(self.end):]
+                self.region = None
+        return ''.join(output)
+
+    def close(self):
+        """
+        Returns what is left at the end of the response. A region that was
+        never closed goes out as it came in.
+        """
+
+        output = self.pending
+        if self.region is not None:
+            output = self.start + ''.join(self.region) + output
+        self.pending = ''
+        self.region = None
+        return output
+
+    def rewrite(self, content):
+        return self.feed(content) + self.close()
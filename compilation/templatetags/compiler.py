@@ -1,14 +1,75 @@
+import logging
+
 from django import template
 from compilation.settings import COMPILER
+from compilation.cache import BoundedCache, fresh
+from compilation import state
+from compilation.profiling import profiled
+from compilation.storage.bundles import hash_handlers, build_bundle, bundle_size, bundle_location, save_bundle, bundle_built
+
+#Inline markup of bundles under COMPILER.INLINE_THRESHOLD, keyed by
+#(node_type, bundle hash) so inlining never has to touch the disk twice
+inline_cache = BoundedCache(COMPILER.INLINE_CACHE_SIZE)
+
+logger = logging.getLogger('compilation')
+logger.addHandler(logging.NullHandler())
 
-def hash_handlers(handlers):
-    import hashlib
-    return hashlib.sha1(''.join(handler.hash for handler in handlers)).hexdigest()
+#CompiledBlocks of html fragments compiled outside of templates
+fragment_blocks = BoundedCache(COMPILER.BLOCK_CACHE_SIZE)
+
+#(name, url, full path, markup) of style bundles split for critical css,
+#keyed by (bundle hash, selectors)
+critical_cache = BoundedCache(COMPILER.INLINE_CACHE_SIZE)
+
+def parse_critical(bits):
+    """
+    Returns the critical css selectors asked for by the tag arguments:
+    None without 'critical', the defaults for a bare 'critical', and the
+    comma separated selectors of critical="...".
+    """
+    
+    critical = None
+    for bit in bits:
+        key, equals, value = bit.partition('=')
+        if key != 'critical':
+            raise template.TemplateSyntaxError('Unknown compile argument: %s' % bit)
+        
+        if not equals:
+            critical = tuple(COMPILER.CRITICAL_SELECTORS)
+        else:
+            if value[:1] in ('"', "'") and value[-1:] == value[:1]:
+                value = value[1:-1]
+            critical = tuple(' '.join(selector.split()) for selector in value.split(',') if selector.strip())
+    return critical
 
 def do_compile(parser, token):
+    critical = parse_critical(token.split_contents()[1:])
     nodelist = parser.parse(('endcompile',))
     parser.delete_first_token()
-    return CompilerNode(nodelist)
+    #Blocks of plain html are compiled on their first render, once per
+    #(cached) template. Not here: with the AggregationMiddleware they only
+    #hand over their handlers, and a bundle of their own would go unused
+    return CompilerNode(nodelist, critical)
+
+def static_text(nodelist):
+    """
+    Returns the html of a nodelist made of nothing but literal text, or None
+    if it has variables or tags in it.
+    """
+    
+    try:
+        from django.template.base import TextNode
+    except ImportError:
+        return None
+    
+    try:
+        nodes = list(nodelist)
+    except TypeError:
+        return None
+    
+    if not all(isinstance(node, TextNode) for node in nodes):
+        return None
+    return ''.join(node.s for node in nodes)
 
 def convert_to_handlers(inlines, urls, handlers):
     def convert(nodes, node_type):
@@ -16,66 +77,272 @@ def convert_to_handlers(inlines, urls, handlers):
         for data, mime in nodes:
             if mime not in handlers:
                 raise ValueError('Unknown mime type: %s' % mime)
-            handler = handlers[mime](data, node_type)
+            handler = handlers[mime].shared(data, node_type)
             returned.append(handler)
         return returned
     
+    #Let the locators fetch remote members of the bundle all at once
+    from compilation.locators.base import LocatorRegistry
+    LocatorRegistry.prefetch(url for url, _ in urls)
+    
     returned = []
     returned.extend(convert(inlines, 'content'))
     returned.extend(convert(urls, 'url'))
     return returned
 
-def get_html_tag(handlers, node_type):
-    from django.conf import settings
+def inline_tag(content, node_type):
+    #Don't let the content close the tag early
+    if node_type == 'script':
+        content = content.replace('</script', '<\\/script')
+        return '<script type=\'text/javascript\'>%s</script>' % content
+    
+    content = content.replace('</style', '<\\/style')
+    return '<style type=\'text/css\'>%s</style>' % content
+
+def external_tag(url, node_type):
+    tags = []
+    if COMPILER.PRELOAD_TAGS:
+        tags.append('<link rel=\'preload\' href=\'%s\' as=\'%s\' />' % (url, node_type))
+    
+    if node_type == 'script':
+        loading = ''
+        if COMPILER.SCRIPT_LOADING:
+            loading = ' %s' % COMPILER.SCRIPT_LOADING
+        tags.append('<script type=\'text/javascript\' src=\'%s\'%s></script>' % (url, loading))
+    else:
+        tags.append('<link type=\'text/css\' href=\'%s\' />' % url)
+    
+    return ''.join(tags)
+
+def obtain_bundle(handlers, node_type, name, full_path, records=None, save=None):
+    """
+    Returns the content of a bundle missing from disk, taking it from another
+    app server when COMPILER_SHARED_CACHE is set. Returns None if the bundle
+    showed up on disk in the meantime. records gets the member records of a
+    bundle built here, see build_bundle. save(content) writes the bundle out
+    before other app servers are told it's built.
+    """
+    
+    import os.path
+    from compilation.storage.shared import get_shared_state
+    shared = get_shared_state()
+    if shared is None:
+        content = build_bundle(handlers, records)
+        if save is not None:
+            save(content)
+        return content
+    
+    return shared.obtain(node_type, name, lambda: build_bundle(handlers, records), lambda: os.path.exists(full_path), save)
+
+def bundle_tag(handlers, node_type):
+    """
+    Makes sure the bundle exists and returns (hash, url, full path, markup)
+    for it. url and full path are None when the bundle is inlined.
+    """
+    
     import os.path
+    import time
     #try:
     #    import compilation.handlers.url_generators as url_gens
     #    generator = getattr(url_gens, COMPILER.URL_GENERATOR)
     #except (AttributeError, ImportError):
     #    from django.core.exceptions import ImproperlyConfigured
     #    raise ImproperlyConfigured('Unable to import URL_GENERATOR (handlers.url_generators.%s)' % COMPILER.URL_GENERATOR)
+    
+    name = hash_handlers(handlers)
+    threshold = COMPILER.INLINE_THRESHOLD
+    if threshold:
+        markup = inline_cache.get((node_type, name))
+        if markup is not None:
+            return name, None, None, markup
+    
+    full_path, url = bundle_location(name, node_type)
+    
+    if not os.path.exists(full_path):
+        #Need to make the file, unless it's small enough to go in the page
+        started = time.time()
+        records = [] if COMPILER.BUNDLE_REPORTS else None
+        inlined = lambda content: threshold and bundle_size(content) <= threshold
+        def save(content):
+            if not inlined(content):
+                save_bundle(full_path, content)
+        
+        content = obtain_bundle(handlers, node_type, name, full_path, records, save)
+        if records:
+            from compilation.budget import save_report
+            save_report(name, node_type, None if inlined(content) else url, content, records)
+        if content is not None:
+            if inlined(content):
+                markup = inline_cache.set((node_type, name), inline_tag(content, node_type))
+                bundle_built(node_type, name, None, time.time() - started)
+                return name, None, None, markup
+            
+            bundle_built(node_type, name, full_path, time.time() - started)
+    elif threshold and os.path.getsize(full_path) <= threshold:
+        #Built before inlining was turned on, read it once
+        with open(full_path) as file_handle:
+            return name, None, None, inline_cache.set((node_type, name), inline_tag(file_handle.read(), node_type))
+    
+    return name, url, full_path, external_tag(url, node_type)
 
-    #Some convenience lookup dictionaries
-    extension = {
-        'script': 'js',
-        'style': 'css',
-    }
-    mime = {
-        'script': 'text/javascript',
-        'style': 'text/css'
-    }
+def deferred_style_tag(url):
+    #Loaded without blocking rendering, applied once it's in
+    return ('<link rel=\'preload\' href=\'%s\' as=\'style\' onload="this.onload=null;this.rel=\'stylesheet\'" />'
+            '<noscript><link type=\'text/css\' rel=\'stylesheet\' href=\'%s\' /></noscript>') % (url, url)
+
+def critical_tag(handlers, selectors):
+    """
+    Like bundle_tag for styles, but inlines the rules matching the selectors
+    and defers the rest, which goes into a bundle of its own. The split is
+    done once per bundle and set of selectors.
+    """
+    
+    import os.path
+    import time
+    from compilation.css import split_critical
+    from compilation.hashing import hash_digests, hash_string
     
+    name, url, full_path, markup = bundle_tag(handlers, 'style')
+    if full_path is None:
+        #Small enough to be inlined whole
+        return name, url, full_path, markup
+    
+    key = (name, selectors)
+    tag = critical_cache.get(key)
+    if tag is None or not os.path.exists(tag[2]):
+        started = time.time()
+        with open(full_path) as handle:
+            critical, remainder = split_critical(handle.read(), selectors)
+        
+        remainder_name = hash_digests([name, hash_string(','.join(selectors))])
+        remainder_path, remainder_url = bundle_location(remainder_name, 'style')
+        if not os.path.exists(remainder_path):
+            save_bundle(remainder_path, remainder)
+            bundle_built('style', remainder_name, remainder_path, time.time() - started)
+        
+        markup = deferred_style_tag(remainder_url)
+        if critical:
+            markup = inline_tag(critical, 'style') + markup
+        tag = critical_cache.set(key, (remainder_name, remainder_url, remainder_path, markup))
+    return tag
+
+def member_tag(handler, node_type):
+    """
+    Returns (name, url, full path, markup) for a single member in
+    COMPILER_DEBUG mode. Plain files are referenced at their own url, plain
+    inline content stays inline, and compiled members get a file of their
+    own named by their hash.
+    """
+    
+    from compilation.handlers.base import BaseCompilingHandler
+    if isinstance(handler, BaseCompilingHandler):
+        return bundle_tag([handler], node_type)
+    
+    if handler._url is not None:
+        return handler._url, handler._url, None, external_tag(handler._url, node_type)
+    return handler.hash, None, None, inline_tag(handler.content, node_type)
+
+def emit_tag(node_type, name, url, markup):
+    """
+    Returns the markup for a bundle on the page being rendered, recording it
+    on the request and leaving out duplicates if asked to.
+    """
+    
+    if COMPILER.SUPPRESS_DUPLICATE_TAGS and not state.first_emission((node_type, name)):
+        return ''
+    if url is not None:
+        state.record_bundle(url, node_type)
+    return markup
+
+def get_html_tag(handlers, node_type):
     #no tag if there arent any nodes
     if len(handlers) == 0:
         return ''
     
-    directory = os.path.join(settings.MEDIA_ROOT, settings.COMPILER_ROOT, extension[node_type])
-    filename = '%s.%s' % (hash_handlers(handlers), extension[node_type])
-    url = os.path.join(settings.MEDIA_URL, extension[node_type], filename) #TODO: change to url_generators
+    if COMPILER.DEBUG:
+        tags = []
+        for handler in handlers:
+            name, url, _, markup = member_tag(handler, node_type)
+            tags.append(emit_tag(node_type, name, url, markup))
+        return '\n'.join(tags)
+
+    name, url, _, markup = bundle_tag(handlers, node_type)
+    return emit_tag(node_type, name, url, markup)
+
+def aggregate_tag(handlers, node_type):
+    """
+    Returns the markup for one bundle of all the handlers collected on a page
+    with the AggregationMiddleware, leaving out members repeated by blocks.
+    """
     
-    #temp hack
-    url = '/static/comp/%s/%s' % (extension[node_type], filename)
-    full_path = os.path.join(directory, filename)
+    unique = []
+    seen = set()
+    for handler in handlers:
+        key = (handler.category, handler.mime, handler.fingerprint)
+        if key not in seen:
+            seen.add(key)
+            unique.append(handler)
+    return get_html_tag(unique, node_type)
+
+def refresh(key, block, compile, store):
+    """
+    Returns the block if it is still fresh, and otherwise stores and returns
+    what compile() makes. With COMPILER_REVALIDATE_IN_BACKGROUND a stale
+    block is returned as is, and compiled and stored in the background.
+    """
     
-    if not os.path.exists(full_path):
-        #Need to make the file
-        with open(full_path, 'w') as file_handle:
-            for handler in handlers:
-                handler.call_pre_insert()
-                file_handle.write(handler.content)
-                file_handle.write('\n')
-            file_handle.flush()
+    if block is not None and block.fresh():
+        return block
     
-    if node_type == 'script':
-        return '<script type=\'text/javascript\' src=\'%s\'></script>' % url
+    if block is not None and COMPILER.REVALIDATE_IN_BACKGROUND:
+        from compilation.revalidate import revalidator
+        revalidator.submit(key, compile, store)
+        return block
     
-    return '<link type=\'%s\' href=\'%s\' />' % (mime[node_type], url)
+    return store(compile())
+
+class CompiledBlock(object):
+    """
+    What a block's html compiled to: the tag for each bundle, and the mtimes
+    of the files (members and bundles) it depends on, so it can be reused
+    for as long as those are unchanged. Remote members are only trusted
+    until they are due to be revalidated, see RemoteCache.fresh.
+    """
+    
+    __slots__ = ('tags', 'dependencies', 'remote')
+    
+    def __init__(self, tags, dependencies, remote=()):
+        self.tags = tags
+        self.dependencies = dependencies
+        self.remote = remote
+    
+    def fresh(self):
+        if self.remote:
+            from compilation.locators.remote import remote_cache
+            if not all(remote_cache.fresh(url) for url in self.remote):
+                return False
+        return fresh(self.dependencies)
+    
+    def render(self):
+        return '\n'.join(emit_tag(*tag) for tag in self.tags)
 
 class CompilerNode(template.Node):
-    def __init__(self, nodelist):
+    def __init__(self, nodelist, critical=None):
         self.nodelist = nodelist
-    def render(self, context):
-        #First check if the environment is set up right
+        self.critical = critical
+        self.static_html = static_text(nodelist)
+        self.block = None
+        
+        #Dynamic blocks whose output only depends on a few variables are
+        #cached on their values, see compilation.variables
+        self.variables = None
+        self.blocks = None
+        if self.static_html is None:
+            from compilation.variables import find_variables
+            self.variables = find_variables(nodelist)
+            self.blocks = BoundedCache(COMPILER.BLOCK_CACHE_SIZE)
+    
+    def check_environment(self):
         from django.conf import settings
         required_attrs = ('COMPILER_ROOT', 'MEDIA_ROOT', 'MEDIA_URL')
         bad_attrs = (attr for attr in required_attrs if not hasattr(settings, attr))
@@ -91,6 +358,15 @@ class CompilerNode(template.Node):
         for d in bad_dirs:
             from django.core.exceptions import ImproperlyConfigured
             raise ImproperlyConfigured('COMPILER_ROOT directory not found. (%s)' % d)
+    
+    def handlers(self, html):
+        """
+        Returns the (script handlers, style handlers) for the rendered html
+        of the block.
+        """
+        
+        #First check if the environment is set up right
+        self.check_environment()
         
         from compilation.handlers.base import HandlerRegistry
         from compilation.parser.LxmlParser import LxmlParser as Parser
@@ -103,17 +379,133 @@ class CompilerNode(template.Node):
         except (AttributeError, ImportError):
             from django.core.exceptions import ImproperlyConfigured
             raise ImproperlyConfigured('Unable to import PARSER_CLASS (parser.%s)' % COMPILER.PARSER_CLASS)
-
-        html = self.nodelist.render(context)
+        
         parsed = Parser(html)
         styles = convert_to_handlers(parsed.style_inlines, parsed.style_files, HandlerRegistry.styles)
         scripts = convert_to_handlers(parsed.script_inlines, parsed.script_files, HandlerRegistry.scripts)
+        return scripts, styles
+    
+    def compile(self, html, previous=None):
+        """
+        Compiles the rendered html of the block into a CompiledBlock, or
+        returns previous, what the same html (or cache key) compiled to
+        before, if that fails and stale output is preferred over errors.
+        """
+        
+        try:
+            return self.build(html)
+        except Exception:
+            if COMPILER.COMPILE_ERRORS != 'stale' or previous is None:
+                raise
+            logger.exception('Compiling a block failed, serving its last good bundles')
+            return previous
+    
+    def build(self, html):
+        import os.path
+        from compilation import pipeline
+        scripts, styles = self.handlers(html)
+        
+        from compilation.locators.remote import is_remote
+        
+        tags = []
+        paths = set()
+        remote = set()
+        for handlers, node_type in ((scripts, 'script'), (styles, 'style')):
+            if len(handlers) == 0:
+                #no tag if there arent any nodes
+                tags.append((node_type, None, None, ''))
+                continue
+            
+            paths.update(handler._file_path for handler in handlers if handler._file_path is not None)
+            remote.update(handler._url for handler in handlers if handler._url is not None and is_remote(handler._url))
+            for handler in handlers:
+                paths.update(pipeline.dependencies(handler))
+            if COMPILER.DEBUG:
+                for handler in handlers:
+                    name, url, full_path, markup = member_tag(handler, node_type)
+                    tags.append((node_type, name, url, markup))
+                    if full_path is not None:
+                        paths.add(full_path)
+                continue
+            
+            if node_type == 'style' and self.critical is not None:
+                name, url, full_path, markup = critical_tag(handlers, self.critical)
+            else:
+                name, url, full_path, markup = bundle_tag(handlers, node_type)
+            tags.append((node_type, name, url, markup))
+            if full_path is not None:
+                paths.add(full_path)
         
-        output = []
-        output.append(get_html_tag(scripts, 'script'))
-        output.append(get_html_tag(styles, 'style'))
+        return CompiledBlock(tags, [(path, os.path.getmtime(path)) for path in paths], tuple(remote))
+    
+    def store_static(self, block):
+        self.block = block
+        return block
+    
+    def aggregate(self, context):
+        """
+        Hands the block's handlers to the page's bundles, see
+        compilation.middleware.AggregationMiddleware.
+        """
         
-        return '\n'.join(output)
+        html = self.static_html
+        if html is None:
+            html = self.nodelist.render(context)
         
+        scripts, styles = self.handlers(html)
+        return '\n'.join(state.collect(node_type, handlers) for handlers, node_type in ((scripts, 'script'), (styles, 'style')) if handlers)
+    
+    def render(self, context):
+        return profiled(self.render_block, context)
+    
+    def render_block(self, context):
+        if state.aggregating():
+            return self.aggregate(context)
+        
+        if self.static_html is not None:
+            #Constant, as long as none of the files changed
+            return refresh((self, None), self.block, lambda: self.compile(self.static_html, self.block), self.store_static).render()
+        
+        key = None
+        if self.variables is not None:
+            from compilation.variables import cache_key
+            key = cache_key(self.variables, context)
+            if key is not None:
+                block = self.blocks.get(key)
+                if block is not None and block.fresh():
+                    return block.render()
+        
+        html = self.nodelist.render(context)
+        
+        #Same block output as earlier in this request (includes, loops)
+        block = state.get_rendered(html)
+        if block is not None:
+            return block.render()
+        
+        if key is None and (COMPILER.REVALIDATE_IN_BACKGROUND or COMPILER.COMPILE_ERRORS == 'stale'):
+            #Something to find the previous version by
+            key = ('html', html)
+        
+        if key is None:
+            block = self.compile(html)
+        else:
+            previous = self.blocks.get(key)
+            block = refresh((self, key), previous, lambda: self.compile(html, previous), lambda block: self.blocks.set(key, block))
+        return state.set_rendered(html, block).render()
+        
+def compile_fragment(html):
+    """
+    Returns the tags for a fragment of html compiled outside of a template,
+    see compilation.middleware.StreamingCompileMiddleware.
+    """
+    
+    block = state.get_rendered(html)
+    if block is None:
+        node = CompilerNode(None)
+        previous = fragment_blocks.get(html)
+        block = refresh(('fragment', html), previous, lambda: node.compile(html, previous), lambda block: fragment_blocks.set(html, block))
+        state.set_rendered(html, block)
+    return block.render()
+
 register = template.Library()
-register.tag('compile', do_compile)
+register.tag('compile', do_compile)
\ No newline at end of file
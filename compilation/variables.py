@@ -0,0 +1,149 @@
+"""
+Finds the context variables a compile block depends on, so its output can be
+cached on their values instead of rendering the block every time.
+
+Only nodes known to read nothing from the context but their own expressions
+are understood. Anything else ({% include %}, {% csrf_token %}, custom tags)
+can reach into the whole context, and the block is then always rendered.
+"""
+
+import datetime
+import decimal
+
+#Builtin nodes whose output only depends on the expressions they hold. Not
+#IfChangedNode, which keeps state in the render context between renders, nor
+#URLNode, which depends on the urlconf and script prefix of the request
+PURE_NODES = frozenset([
+    'TextNode', 'VariableNode', 'ForNode', 'IfNode', 'IfEqualNode',
+    'WithNode', 'CommentNode', 'SpacelessNode',
+    'AutoEscapeControlNode', 'FilterNode', 'FirstOfNode', 'VerbatimNode',
+    'LoadNode', 'StaticNode', 'WidthRatioNode', 'TemplateTagNode',
+])
+
+#Where the objects making up expressions (conditions, operators) live
+EXPRESSION_MODULES = ('django.template.smartif', 'django.template.defaulttags')
+
+KEYABLE = (basestring, int, long, float, bool, type(None), decimal.Decimal,
+           datetime.date, datetime.time, datetime.timedelta)
+
+_missing = object()
+
+class Unkeyable(Exception):
+    pass
+
+def _bound_names(node):
+    names = set(getattr(node, 'loopvars', None) or [])
+    if names:
+        names.add('forloop')
+    extra_context = getattr(node, 'extra_context', None)
+    if isinstance(extra_context, dict):
+        names.update(extra_context)
+    return names
+
+def _expressions(value, found, seen):
+    """
+    Collects the Variables in an expression object graph.
+    """
+
+    from django.template.base import FilterExpression, Variable, Node, NodeList
+
+    if id(value) in seen:
+        return
+    seen.add(id(value))
+
+    if isinstance(value, Variable):
+        if value.lookups is not None:
+            found.append(value)
+    elif isinstance(value, FilterExpression):
+        _expressions(value.var, found, seen)
+        for _, args in value.filters:
+            for _, arg in args:
+                _expressions(arg, found, seen)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _expressions(item, found, seen)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _expressions(item, found, seen)
+    elif isinstance(value, (Node, NodeList)):
+        pass #Walked through child_nodelists
+    elif type(value).__module__ in EXPRESSION_MODULES and hasattr(value, '__dict__'):
+        for item in value.__dict__.values():
+            _expressions(item, found, seen)
+
+def _walk(nodelist, bound, found):
+    for node in nodelist:
+        if type(node).__name__ not in PURE_NODES:
+            return False
+
+        variables = []
+        for name, value in node.__dict__.items():
+            if name not in getattr(node, 'child_nodelists', ()):
+                _expressions(value, variables, set())
+
+        inner = bound | _bound_names(node)
+        found.extend(variable for variable in variables if variable.lookups[0] not in bound)
+
+        for name in getattr(node, 'child_nodelists', ()):
+            children = getattr(node, name, None)
+            if children and not _walk(children, inner, found):
+                return False
+    return True
+
+def find_variables(nodelist):
+    """
+    Returns the Variables the nodelist reads from the context, or None when
+    it can't tell.
+    """
+
+    try:
+        nodes = list(nodelist)
+    except TypeError:
+        return None
+
+    found = []
+    try:
+        if not _walk(nodes, frozenset(), found):
+            return None
+    except ImportError:
+        return None
+
+    #One of each, in a stable order
+    unique = {}
+    for variable in found:
+        unique.setdefault(variable.var, variable)
+    return [unique[name] for name in sorted(unique)]
+
+def freeze(value):
+    #Tagged with the type since 1 == 1.0 == True and [1] == (1,) when
+    #compared, but they all render differently
+    if isinstance(value, KEYABLE):
+        return value.__class__, value
+    if isinstance(value, (list, tuple)):
+        return value.__class__, tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return value.__class__, frozenset(freeze(item) for item in value)
+    if isinstance(value, dict):
+        return value.__class__, tuple(sorted((freeze(key), freeze(item)) for key, item in value.items()))
+    raise Unkeyable(type(value))
+
+def cache_key(variables, context):
+    """
+    Returns a hashable key of the variables' values in the context, or None
+    if one of them is something that can't be keyed on (model instances,
+    querysets...).
+    """
+    
+    values = []
+    for variable in variables:
+        try:
+            value = variable.resolve(context)
+        except Exception:
+            values.append(_missing)
+            continue
+        
+        try:
+            values.append(freeze(value))
+        except Unkeyable:
+            return None
+    return tuple(values)
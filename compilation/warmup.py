@@ -0,0 +1,176 @@
+"""
+Builds the bundles of a site's pages ahead of traffic, after a deploy or a
+COMPILER_ROOT wipe, by rendering the pages through django's test client:
+
+    python manage.py compile_warmup --log /var/log/nginx/access.log --top 200 --concurrency 4
+    python manage.py compile_warmup --paths urls.txt
+
+Access logs (nginx and gunicorn, common or combined format) are reduced to
+the successful GETs with their hit counts, and pages are rendered most
+popular first. Path lists have one path per line. The report lists every
+page with its status, render time and the bundles built for it with the
+time each build took, and the exit status is 1 if any page didn't render, so a deploy can hold a machine
+out of the load balancer until it's warm.
+"""
+
+import Queue
+import re
+import sys
+import threading
+import time
+
+#"GET /path HTTP/1.1" 200 in the common and combined log formats
+REQUEST_LINE = re.compile(r'"(?:GET|HEAD) (\S+) HTTP/[0-9.]+" (\d{3}) ')
+
+def count_log(lines, counts=None):
+    """
+    Adds the successful GETs of access log lines to {path: hits}.
+    """
+
+    if counts is None:
+        counts = {}
+    for line in lines:
+        match = REQUEST_LINE.search(line)
+        if match is not None and match.group(2) == '200':
+            path = match.group(1)
+            counts[path] = counts.get(path, 0) + 1
+    return counts
+
+def read_paths(lines):
+    #One path per line, blank lines and #comments skipped
+    paths = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            paths.append(line)
+    return paths
+
+def by_popularity(counts):
+    #Most hits first, then by path so runs are repeatable
+    return [path for path, _ in sorted(counts.items(), key=lambda item: (-item[1], item[0]))]
+
+class WarmedPage(object):
+    __slots__ = ('path', 'status', 'seconds', 'bundles', 'error')
+
+    def __init__(self, path, status, seconds, bundles, error=None):
+        self.path = path
+        self.status = status
+        self.seconds = seconds
+        self.bundles = bundles
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None and self.status < 400
+
+def warm(paths, make_client, concurrency=4):
+    """
+    Renders the paths in order with make_client() clients, at most
+    concurrency at once, returning a WarmedPage for each. Its bundles are
+    the (path, seconds) of the bundles built for it, with the name in place
+    of the path for bundles inlined into the page.
+    """
+
+    from compilation.storage.bundles import add_build_listener, remove_build_listener
+
+    queue = Queue.Queue()
+    for index, path in enumerate(paths):
+        queue.put((index, path))
+    pages = [None] * len(paths)
+
+    #The test client renders in the calling thread, so the bundles built
+    #by a thread were built for the page it's on
+    current = threading.local()
+    def built(node_type, name, full_path, seconds):
+        bundles = getattr(current, 'built', None)
+        if bundles is not None:
+            bundles.append((full_path or name, seconds))
+
+    def work():
+        client = make_client()
+        while True:
+            try:
+                index, path = queue.get_nowait()
+            except Queue.Empty:
+                return
+
+            current.built = []
+            started = time.time()
+            try:
+                status, error = client.get(path).status_code, None
+            except Exception, e:
+                status, error = None, '%s: %s' % (e.__class__.__name__, e)
+            pages[index] = WarmedPage(path, status, time.time() - started, current.built, error)
+            current.built = None
+
+    add_build_listener(built)
+    try:
+        threads = [threading.Thread(target=work) for _ in xrange(max(1, min(concurrency, len(paths))))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        remove_build_listener(built)
+    return pages
+
+def report(pages, seconds, stream):
+    for page in pages:
+        stream.write('%-6s %8.1fms %3d built  %s\n' % (
+            page.status if page.error is None else 'error', page.seconds * 1000, len(page.bundles), page.path))
+        for bundle, build_seconds in page.bundles:
+            stream.write('         %8.1fms  %s\n' % (build_seconds * 1000, bundle))
+        if page.error is not None:
+            stream.write('         %s\n' % page.error)
+
+    failed = [page for page in pages if not page.ok]
+    stream.write('%d pages in %.1fs, %d bundles built, %d failed\n' % (
+        len(pages), seconds, sum(len(page.bundles) for page in pages), len(failed)))
+
+def client_factory(host):
+    from django.test import Client
+    return lambda: Client(HTTP_HOST=host)
+
+def warm_up(paths=(), path_files=(), logs=(), top=None, concurrency=4, host='localhost', stream=None):
+    """
+    Renders the paths, those in the path files and the top most requested
+    of the access logs, and reports on them to stream. Returns whether every
+    page rendered.
+    """
+
+    stream = stream or sys.stdout
+
+    counts = {}
+    for name in logs:
+        with open(name) as handle:
+            count_log(handle, counts)
+    logged = by_popularity(counts)[:top]
+
+    paths = list(paths)
+    for name in path_files:
+        with open(name) as handle:
+            paths.extend(read_paths(handle))
+    #Listed paths first, then the logged ones, each once
+    seen = set()
+    paths = [path for path in paths + logged if not (path in seen or seen.add(path))]
+
+    started = time.time()
+    pages = warm(paths, client_factory(host), concurrency)
+    report(pages, time.time() - started, stream)
+    return all(page.ok for page in pages)
+
+def main(argv=None, stream=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Render pages through the test client to build their bundles.')
+    parser.add_argument('--paths', action='append', default=[], help='file with a path per line')
+    parser.add_argument('--log', action='append', default=[], help='nginx or gunicorn access log')
+    parser.add_argument('--top', type=int, default=None, help='only the most requested paths of the logs')
+    parser.add_argument('--concurrency', type=int, default=4, help='pages rendered at once')
+    parser.add_argument('--host', default='localhost', help='Host header of the requests')
+    parser.add_argument('path', nargs='*', help='paths to render')
+    options = parser.parse_args(argv)
+    ok = warm_up(options.path, options.paths, options.log, options.top, options.concurrency, options.host, stream)
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -118,6 +118,7 @@ def django_template():
     
     template = type('template', (object,), {
         'Node': object,
+        'TemplateSyntaxError': type('TemplateSyntaxError', (Exception,), {}),
         'Library': classmethod(lambda x: type('tag', (object, ), {
             'tag': classmethod(lambda x, y, z: None)
         }))
@@ -170,13 +171,15 @@ def modified_time(time = ''):
 
 @contextlib.contextmanager
 def modified_popen():
-    import sys
-    def new_popen(command):
+    import subprocess
+    def new_popen(command, *args, **kwargs):
         raise TestException(command)
-    old_popen = sys.modules['os'].popen
-    sys.modules['os'].popen = new_popen
-    yield
-    sys.modules['os'].popen = old_popen
+    old_popen = subprocess.Popen
+    subprocess.Popen = new_popen
+    try:
+        yield
+    finally:
+        subprocess.Popen = old_popen
 
 
 @contextlib.contextmanager
@@ -211,4 +214,105 @@ def exception_handler(cls, regis, _category, _mime='text/test'):
         def __init__(self, *args, **kwargs):
             raise TestException
     yield
-    regis.delete_handler(MyScriptHandler)
\ No newline at end of file
+    regis.delete_handler(MyScriptHandler)
+
+@contextlib.contextmanager
+def compiler_settings(**settings):
+    from compilation.settings import COMPILER
+    old = dict((key, getattr(COMPILER, key)) for key in settings)
+    COMPILER.update(settings)
+    try:
+        yield COMPILER
+    finally:
+        COMPILER.update(old)
+
+
+@contextlib.contextmanager
+def media_root(files={}):
+    #A real MEDIA_ROOT with the COMPILER_ROOT ('comp') directories made and
+    #the given {relative path: content} files written into it
+    import os, shutil, tempfile
+    root = tempfile.mkdtemp()
+    for directory in ('comp', 'comp/css', 'comp/js'):
+        os.mkdir(os.path.join(root, directory))
+    for name, content in files.items():
+        with open(os.path.join(root, name), 'w') as handle:
+            handle.write(content)
+    try:
+        yield root
+    finally:
+        shutil.rmtree(root)
+
+
+@contextlib.contextmanager
+def django_template_base():
+    #Fake django.template.base with just enough of the node and expression
+    #classes for the static block and variable detection
+    import imp, sys
+    
+    class Node(object):
+        child_nodelists = ('nodelist',)
+    
+    class NodeList(list):
+        def render(self, context):
+            return ''.join(node.render(context) for node in self)
+    
+    class TextNode(Node):
+        child_nodelists = ()
+        def __init__(self, s):
+            self.s = s
+        def render(self, context):
+            return self.s
+    
+    class Variable(object):
+        def __init__(self, var):
+            self.var = var
+            self.lookups = tuple(var.split('.'))
+        def resolve(self, context):
+            value = context
+            for lookup in self.lookups:
+                value = value[lookup]
+            return value
+    
+    class FilterExpression(object):
+        def __init__(self, var, filters=()):
+            self.var = var
+            self.filters = list(filters)
+        def resolve(self, context):
+            return self.var.resolve(context)
+    
+    class VariableNode(Node):
+        child_nodelists = ()
+        def __init__(self, filter_expression):
+            self.filter_expression = filter_expression
+        def render(self, context):
+            return unicode(self.filter_expression.resolve(context))
+    
+    base = imp.new_module('base')
+    base.__dict__.update({
+        'Node': Node,
+        'NodeList': NodeList,
+        'TextNode': TextNode,
+        'Variable': Variable,
+        'FilterExpression': FilterExpression,
+        'VariableNode': VariableNode,
+    })
+    added = ['django.template.base']
+    if 'django' not in sys.modules:
+        sys.modules['django'] = imp.new_module('django')
+        added.append('django')
+    if 'django.template' not in sys.modules:
+        sys.modules['django.template'] = imp.new_module('template')
+        added.append('django.template')
+    sys.modules['django.template.base'] = base
+    try:
+        yield base
+    finally:
+        del_keys(sys.modules, *added)
+
+
+@contextlib.contextmanager
+def django_text_nodes():
+    #Fake django.template.base.TextNode for the static block detection
+    with django_template_base() as base:
+        yield base.TextNode
@@ -1,7 +1,7 @@
 from tests.utils import CompilerTestCase, make_named_files
 from tests.exceptions import TestException
-from tests.contexts import command_handler, django_settings, modified_popen, open_exception
-from compilation.handlers.base import BaseHandler, BaseCompilingHandler, HandlerRegistry
+from tests.contexts import command_handler, django_settings, modified_popen, open_exception, compiler_settings
+from compilation.handlers.base import BaseHandler, BaseCompilingHandler, HandlerRegistry, CompileError, failures
 import contextlib
 
 class HandlerAbstract(object):
@@ -60,18 +60,98 @@ class HandlerAbstract(object):
                 self.assertRaises(TestException, getattr, handler, 'content') #Read when requested
     
     def test_hash(self):
-        import hashlib
-        import os.path
+        from compilation.hashing import hash_string
         handler = self.handler('test', 'content')
-        self.assertEqual(hashlib.sha1('test').hexdigest(), handler.hash)
+        self.assertEqual(hash_string('test'), handler.hash)
         
         with make_named_files() as temp_file:
-            with open_exception(temp_file.name): #Don't allow it to open the file for the hash
-                temp_file.write('test')
-                temp_file.flush()
+            temp_file.write('test')
+            temp_file.flush()
+            
+            handler = self.handler(temp_file.name, 'file')
+            self.assertEqual(hash_string('test'), handler.hash)
+            
+            with open_exception(temp_file.name): #Unchanged files aren't read again
+                self.assertEqual(hash_string('test'), self.handler(temp_file.name, 'file').hash)
+
+    def test_compact(self):
+        handler = self.handler('test', 'content')
+        self.assertFalse(hasattr(handler, '__dict__'))
+    
+    def test_subclass_keeps_dict(self):
+        class MyHandler(self.handler):
+            mime = ''
+            category = ''
+            abstract = True
+        
+        handler = MyHandler('test', 'content')
+        handler.extra = 'attribute'
+        self.assertEqual(handler.extra, 'attribute')
+        
+        class CompactHandler(self.handler):
+            __slots__ = ()
+            mime = ''
+            category = ''
+            abstract = True
+        
+        self.assertFalse(hasattr(CompactHandler('test', 'content'), '__dict__'))
+    
+    def test_shared_file_handler(self):
+        with make_named_files() as temp_file:
+            first = self.handler.shared(temp_file.name, 'file')
+            self.assertTrue(first is self.handler.shared(temp_file.name, 'file'))
+    
+    def test_content_not_shared(self):
+        self.assertFalse(self.handler.shared('test', 'content') is self.handler.shared('test', 'content'))
+    
+    def test_clone_is_private(self):
+        with make_named_files() as temp_file:
+            temp_file.write('test')
+            temp_file.flush()
+            handler = self.handler(temp_file.name, 'file')
+            clone = handler.clone()
+            self.assertFalse(clone is handler)
+            self.assertEqual(clone.content, 'test')
+            self.assertEqual(handler._content, None)
+    
+    def test_release(self):
+        with make_named_files() as temp_file:
+            temp_file.write('test')
+            temp_file.flush()
+            handler = self.handler(temp_file.name, 'file')
+            handler.content
+            handler.release()
+            self.assertEqual(handler._content, None)
+            self.assertEqual(handler.content, 'test')
+        
+        #Inline content has nowhere to come back from
+        handler = self.handler('test', 'content')
+        handler.release()
+        self.assertEqual(handler.content, 'test')
+
+    def test_locate_failure_cached(self):
+        failures.clear()
+        with django_settings({'MEDIA_URL': '/nope'}):
+            from compilation.locators.base import LocatorRegistry
+            class CountingLocator(object):
+                calls = 0
+                @classmethod
+                def locate(cls, url):
+                    cls.calls += 1
+                    return []
+            LocatorRegistry.locators.add(CountingLocator)
+            try:
+                self.assertRaises(ValueError, self.handler, '/test/missing', 'url')
+                self.assertRaises(ValueError, self.handler, '/test/missing', 'url')
+                self.assertEqual(CountingLocator.calls, 1)
                 
-                handler = self.handler(temp_file.name, 'file')
-                self.assertEqual(hashlib.sha1(str(os.path.getmtime(temp_file.name))).hexdigest(), handler.hash)
+                with compiler_settings(FAILURE_TIMEOUT=0):
+                    failures.clear()
+                    self.assertRaises(ValueError, self.handler, '/test/missing', 'url')
+                    self.assertRaises(ValueError, self.handler, '/test/missing', 'url')
+                    self.assertEqual(CountingLocator.calls, 3)
+            finally:
+                LocatorRegistry.delete_locator(CountingLocator)
 
 class TestBaseHandler(CompilerTestCase, HandlerAbstract):
     handler = BaseHandler
@@ -80,15 +160,53 @@ class TestBaseCompilingHandler(CompilerTestCase, HandlerAbstract):
     handler = BaseCompilingHandler
     
     def test_command_works(self):
-        #this test ties the implementation to os.popen.
+        #this test ties the implementation to subprocess.Popen.
         #If this test fails, make sure the implementation of BaseCompilingHandler hasn't changed
         with contextlib.nested(command_handler(BaseCompilingHandler, HandlerRegistry, 'script', 'some_command -some -args -p %s'), modified_popen()) as (TestHandler, _):
             handler = TestHandler('test', 'content')
             try:
                 handler.call_pre_insert()
             except TestException, e:
-                #Grab the non variable part of the command (pop the last word off)
-                command = ' '.join(e.message.split(' ')[:-1])
+                #Grab the non variable part of the command (pop the last word off),
+                #which the executor runs as the last argument of sh -c
+                command = ' '.join(e.message[-1].split(' ')[:-1])
                 self.assertEqual(command, 'some_command -some -args -p')
             else:
-                raise TestException('os.popen not called during compiling')
\ No newline at end of file
+                raise TestException('subprocess.Popen not called during compiling')
+    
+    def test_command_output(self):
+        with command_handler(BaseCompilingHandler, HandlerRegistry, 'script', 'cat %s') as TestHandler:
+            handler = TestHandler('test', 'content')
+            handler.call_pre_insert()
+            self.assertEqual(handler.content, 'test')
+    
+    def test_command_error(self):
+        failures.clear()
+        with command_handler(BaseCompilingHandler, HandlerRegistry, 'script', 'echo syntax error >&2; exit 3 # %s') as TestHandler:
+            handler = TestHandler('broken', 'content')
+            try:
+                handler.call_pre_insert()
+            except CompileError, e:
+                self.assertEqual(e.returncode, 3)
+                self.assertEqual(e.stderr, 'syntax error\n')
+            else:
+                raise TestException('CompileError not raised')
+    
+    def test_command_failure_cached(self):
+        import os, tempfile
+        failures.clear()
+        fd, counter = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            with command_handler(BaseCompilingHandler, HandlerRegistry, 'script', 'echo run >> %s; exit 1 # %%s' % counter) as TestHandler:
+                self.assertRaises(CompileError, TestHandler('broken', 'content').call_pre_insert)
+                self.assertRaises(CompileError, TestHandler('broken', 'content').call_pre_insert)
+                with open(counter) as handle:
+                    self.assertEqual(handle.read(), 'run\n')
+                
+                #Different input, compiled again
+                self.assertRaises(CompileError, TestHandler('other', 'content').call_pre_insert)
+                with open(counter) as handle:
+                    self.assertEqual(handle.read(), 'run\nrun\n')
+        finally:
+            os.unlink(counter)
@@ -66,4 +66,8 @@ class TestHandlerRegistry(CompilerTestCase):
         handler = self.make_handler('style', 'test/mime')
         self.assertTrue('test/mime' in HandlerRegistry.styles)
         HandlerRegistry.delete_handler('test/mime')
-        self.assertTrue('test/mime' not in HandlerRegistry.styles)
\ No newline at end of file
+        self.assertTrue('test/mime' not in HandlerRegistry.styles)
+    
+    def test_mime_interned(self):
+        handler = self.make_handler('script', ''.join(['text/', 'interned']))
+        self.assertTrue(handler.mime is intern('text/interned'))
@@ -0,0 +1,191 @@
+from tests.utils import CompilerTestCase
+from tests.contexts import compiler_settings
+from compilation.locators.remote import ConnectionPool, RemoteCache, is_remote, remote_cache
+from compilation.locators.locators import RemoteLocator
+import BaseHTTPServer
+import SocketServer
+import contextlib
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+class AssetServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+class AssetRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        self.server.connections += 1
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.path in self.server.redirects:
+            self.send_response(302)
+            self.send_header('Location', self.server.redirects[self.path])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path not in self.server.files:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = self.server.files[self.path]
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@contextlib.contextmanager
+def asset_server(files, redirects=None):
+    server = AssetServer(('127.0.0.1', 0), AssetRequestHandler)
+    server.files = files
+    server.redirects = redirects or {}
+    server.requests = []
+    server.connections = 0
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01})
+    thread.daemon = True
+    thread.start()
+    yield server, 'http://127.0.0.1:%d' % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+class RemoteCacheTests(CompilerTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = RemoteCache(ConnectionPool())
+
+    def tearDown(self):
+        self.cache.pool.close()
+        shutil.rmtree(self.directory)
+
+    def settings(self, max_age=300):
+        return compiler_settings(REMOTE_CACHE_DIR=self.directory, REMOTE_MAX_AGE=max_age)
+
+    def test_is_remote(self):
+        self.assertTrue(is_remote('http://cdn/a.js'))
+        self.assertTrue(is_remote('https://cdn/a.js'))
+        self.assertFalse(is_remote('/static/a.js'))
+
+    def test_fetch_stores_file(self):
+        with contextlib.nested(self.settings(), asset_server({'/a.js': 'var a;'})) as (_, (server, root)):
+            path = self.cache.fetch(root + '/a.js')
+            self.assertTrue(path.startswith(self.directory))
+            self.assertTrue(path.endswith('.js'))
+            with open(path) as handle:
+                self.assertEqual(handle.read(), 'var a;')
+
+    def test_fresh_entry_skips_network(self):
+        with contextlib.nested(self.settings(), asset_server({'/a.js': 'var a;'})) as (_, (server, root)):
+            self.cache.fetch(root + '/a.js')
+            self.cache.fetch(root + '/a.js')
+            self.assertEqual(len(server.requests), 1)
+
+    def test_stale_entry_revalidated(self):
+        with contextlib.nested(self.settings(max_age=0), asset_server({'/a.js': 'var a;'})) as (_, (server, root)):
+            path = self.cache.fetch(root + '/a.js')
+            os.utime(path, (0, 0))
+            self.assertEqual(self.cache.fetch(root + '/a.js'), path)
+
+            self.assertEqual(len(server.requests), 2)
+            self.assertEqual(server.requests[0][1], None)
+            self.assertNotEqual(server.requests[1][1], None)
+            #A 304 leaves the file (and so its mtime based hash) alone
+            self.assertEqual(os.path.getmtime(path), 0)
+
+    def test_changed_entry_refetched(self):
+        files = {'/a.js': 'var a;'}
+        with contextlib.nested(self.settings(max_age=0), asset_server(files)) as (_, (server, root)):
+            self.cache.fetch(root + '/a.js')
+            files['/a.js'] = 'var b;'
+            path = self.cache.fetch(root + '/a.js')
+            with open(path) as handle:
+                self.assertEqual(handle.read(), 'var b;')
+
+    def test_connections_kept_alive(self):
+        with contextlib.nested(self.settings(), asset_server({'/a.js': 'a', '/b.js': 'b', '/c.js': 'c'})) as (_, (server, root)):
+            for name in ('a', 'b', 'c'):
+                self.cache.fetch('%s/%s.js' % (root, name))
+            self.assertEqual(server.connections, 1)
+            self.assertEqual(self.cache.pool.created, 1)
+
+    def test_missing_file(self):
+        with contextlib.nested(self.settings(), asset_server({})) as (_, (server, root)):
+            self.assertEqual(self.cache.fetch(root + '/missing.js'), None)
+
+    def test_redirect_followed(self):
+        redirects = {'/lib/latest.js': '/lib/1.2.3.js', '/loop.js': '/loop.js'}
+        with contextlib.nested(self.settings(), asset_server({'/lib/1.2.3.js': 'var lib;'}, redirects)) as (_, (server, root)):
+            path = self.cache.fetch(root + '/lib/latest.js')
+            self.assertEqual(path, self.cache.paths(root + '/lib/latest.js')[0])
+            with open(path) as handle:
+                self.assertEqual(handle.read(), 'var lib;')
+            self.assertEqual([request for request, _ in server.requests], ['/lib/latest.js', '/lib/1.2.3.js'])
+
+            self.assertEqual(self.cache.fetch(root + '/loop.js'), None)
+            self.assertEqual(len(server.requests), 2 + 6)
+
+    def test_prefetch(self):
+        files = dict(('/%d.js' % i, 'var a%d;' % i) for i in xrange(10))
+        with contextlib.nested(self.settings(), asset_server(files)) as (_, (server, root)):
+            urls = [root + name for name in sorted(files)]
+            paths = self.cache.prefetch(urls)
+            self.assertEqual(len(paths), 10)
+            self.assertTrue(all(os.path.exists(path) for path in paths))
+
+            #Everything is fresh now, locating is free
+            for url in urls:
+                self.cache.fetch(url)
+            self.assertEqual(len(server.requests), 10)
+
+    def test_prefetch_fresh_skips_pool(self):
+        from compilation.locators import remote
+        files = dict(('/%d.js' % i, 'var a%d;' % i) for i in xrange(3))
+        with contextlib.nested(self.settings(), asset_server(files)) as (_, (server, root)):
+            urls = [root + name for name in sorted(files)]
+            paths = self.cache.prefetch(urls)
+            pool = remote.fetch_pool()
+            
+            #Nothing to fetch, nothing handed to the pool
+            original = remote.fetch_pool
+            remote.fetch_pool = None
+            try:
+                self.assertEqual(self.cache.prefetch(urls), paths)
+            finally:
+                remote.fetch_pool = original
+            self.assertTrue(remote.fetch_pool() is pool)
+            self.assertEqual(len(server.requests), 3)
+
+class RemoteLocatorTests(CompilerTestCase):
+    def test_ignores_local_urls(self):
+        self.assertEqual(RemoteLocator.locate('/static/a.js'), [])
+
+    def test_locates_remote_url(self):
+        directory = tempfile.mkdtemp()
+        try:
+            with contextlib.nested(compiler_settings(REMOTE_CACHE_DIR=directory), asset_server({'/vendor.js': 'vendor'})) as (_, (server, root)):
+                [path] = RemoteLocator.locate(root + '/vendor.js')
+                with open(path) as handle:
+                    self.assertEqual(handle.read(), 'vendor')
+                self.assertEqual(RemoteLocator.locate(root + '/missing.js'), [])
+        finally:
+            remote_cache.pool.close()
+            remote_cache.clear()
+            shutil.rmtree(directory)
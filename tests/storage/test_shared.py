@@ -0,0 +1,117 @@
+from tests.utils import CompilerTestCase, LocalCache, MockNodelist
+from tests.contexts import compiler_settings, command_handler, django_exceptions, django_settings, django_template, media_root
+from tests.exceptions import TestException
+from compilation.storage import shared
+from compilation.storage.shared import SharedBundleState
+from compilation.handlers.base import BaseHandler, HandlerRegistry
+import contextlib
+import os
+
+def failing_build():
+    raise TestException('should not have been built')
+
+class SharedBundleStateTests(CompilerTestCase):
+    def setUp(self):
+        self.state = SharedBundleState(LocalCache())
+    
+    def test_publish_marks_built(self):
+        self.assertFalse(self.state.is_built('script', 'abc'))
+        self.state.publish('script', 'abc', 'content')
+        self.assertTrue(self.state.is_built('script', 'abc'))
+        self.assertFalse(self.state.is_built('style', 'abc'))
+    
+    def test_bytes_only_stored_when_enabled(self):
+        self.state.publish('script', 'abc', 'content')
+        self.assertEqual(self.state.fetch('script', 'abc'), None)
+        with compiler_settings(SHARED_STORE_BYTES=True):
+            self.assertEqual(self.state.fetch('script', 'abc'), None)
+            self.state.publish('script', 'abc', 'content')
+            self.assertEqual(self.state.fetch('script', 'abc'), 'content')
+    
+    def test_lease(self):
+        token = self.state.acquire('script', 'abc')
+        self.assertNotEqual(token, None)
+        self.assertEqual(self.state.acquire('script', 'abc'), None)
+        self.state.release('script', 'abc', 'not the token')
+        self.assertEqual(self.state.acquire('script', 'abc'), None)
+        self.state.release('script', 'abc', token)
+        self.assertNotEqual(self.state.acquire('script', 'abc'), None)
+    
+    def test_obtain_builds_once(self):
+        with compiler_settings(SHARED_STORE_BYTES=True):
+            self.assertEqual(self.state.obtain('script', 'abc', lambda: 'built', lambda: False), 'built')
+            self.assertEqual(self.state.obtain('script', 'abc', failing_build, lambda: False), 'built')
+    
+    def test_obtain_waits_for_lease(self):
+        with compiler_settings(SHARED_STORE_BYTES=True, SHARED_WAIT_TIMEOUT=0):
+            self.state.acquire('script', 'abc')
+            #Another node holds the lease, but finishes while we wait
+            self.state.publish('script', 'abc', 'theirs')
+            self.assertEqual(self.state.obtain('script', 'abc', failing_build, lambda: False), 'theirs')
+    
+    def test_obtain_shared_storage(self):
+        self.state.acquire('script', 'abc')
+        self.state.publish('script', 'abc', 'theirs')
+        self.assertEqual(self.state.obtain('script', 'abc', failing_build, lambda: True), None)
+    
+    def test_obtain_after_lease_expires(self):
+        with compiler_settings(SHARED_WAIT_TIMEOUT=0):
+            self.state.acquire('script', 'abc')
+            self.assertEqual(self.state.obtain('script', 'abc', lambda: 'ours', lambda: False), 'ours')
+            self.assertTrue(self.state.is_built('script', 'abc'))
+    
+    def test_saved_before_published(self):
+        with media_root() as root:
+            path = os.path.join(root, 'abc.js')
+            exists = lambda: os.path.exists(path)
+            def save(content):
+                with open(path, 'w') as handle:
+                    handle.write(content)
+            
+            #What a node waiting on the lease sees as soon as the bundle is built
+            seen = []
+            publish = self.state.publish
+            def publishing(node_type, name, content=None):
+                publish(node_type, name, content)
+                seen.append((self.state.is_built(node_type, name), exists(), self.state.acquire(node_type, name)))
+            self.state.publish = publishing
+            
+            self.assertEqual(self.state.obtain('script', 'abc', lambda: 'ours', exists, save), 'ours')
+            #Built, on disk, and the lease still held
+            self.assertEqual(seen, [(True, True, None)])
+    
+    def test_disabled(self):
+        with compiler_settings(SHARED_CACHE=None):
+            self.assertEqual(shared.get_shared_state(), None)
+
+class CountingHandler(BaseHandler):
+    abstract = True
+    mime = ''
+    category = ''
+    builds = []
+    
+    def pre_insert(self):
+        CountingHandler.builds.append(self.content)
+
+class SharedTemplateTagTests(CompilerTestCase):
+    def setUp(self):
+        shared._states['test'] = SharedBundleState(LocalCache())
+        CountingHandler.builds = []
+    
+    def tearDown(self):
+        del shared._states['test']
+    
+    def test_bundle_reused_from_other_node(self):
+        html = "<script type=\"text/test\">shared between nodes</script>"
+        outputs = []
+        with contextlib.nested(compiler_settings(SHARED_CACHE='test', SHARED_STORE_BYTES=True), command_handler(CountingHandler, HandlerRegistry, 'script', '')):
+            #Two app servers, each with their own disk
+            for _ in xrange(2):
+                with media_root() as root:
+                    with contextlib.nested(django_template(), django_exceptions(), django_settings({'COMPILER_ROOT':'comp', 'MEDIA_ROOT':root, 'MEDIA_URL':'/media/'})):
+                        from compilation.templatetags.compiler import CompilerNode
+                        outputs.append(CompilerNode(MockNodelist(html)).render(None))
+                        self.assertEqual(len(os.listdir(os.path.join(root, 'comp', 'js'))), 1)
+        
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(CountingHandler.builds, ['shared between nodes'])
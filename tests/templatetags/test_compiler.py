@@ -1,7 +1,6 @@
-from tests.utils import CompilerTestCase, MockNodelist, make_named_files
-from tests.contexts import django_exceptions, django_template, django_settings, paths_exist, open_redirector, modified_time, exception_handler
+from tests.utils import CompilerTestCase, MockNodelist, MockNodes, MockParser, MockToken
+from tests.contexts import django_exceptions, django_template, django_settings, paths_exist, open_exception, exception_handler, compiler_settings, media_root, django_text_nodes, django_template_base
 from tests.exceptions import TestException
-import tempfile
 import contextlib
 
 class TestTemplateTag(CompilerTestCase):
@@ -9,6 +8,16 @@ class TestTemplateTag(CompilerTestCase):
         from compilation.handlers.base import BaseHandler, HandlerRegistry
         return exception_handler(BaseHandler, HandlerRegistry, category)
     
+    def media_settings(self, root):
+        return django_settings({'COMPILER_ROOT':'comp', 'MEDIA_ROOT':root, 'MEDIA_URL':'/media/'})
+    
+    def read_bundle(self, root, extension):
+        import os
+        directory = os.path.join(root, 'comp', extension)
+        [filename] = os.listdir(directory)
+        with open(os.path.join(directory, filename)) as handle:
+            return handle.read()
+    
     def basic_context(self):
         return contextlib.nested(django_template(), django_settings({'COMPILER_ROOT':'/'}), django_exceptions(), paths_exist('/css', '/js'))
     
@@ -57,56 +66,28 @@ class TestTemplateTag(CompilerTestCase):
             self.assertRaises(ImproperlyConfigured, compiler_node.render, None)
     
     def test_scripts_inline_compiled(self):
-        with tempfile.NamedTemporaryFile(mode='w') as temp_file:
-            read_handle = open(temp_file.name, 'r')
-            def temp_opener(filename):
-                if 'media/comp/js' in filename:
-                    return temp_file
-                return None
-            
-            with contextlib.nested(django_exceptions(), django_settings({'COMPILER_ROOT':'comp', 'MEDIA_ROOT':'media', 'MEDIA_URL':'/media/'}), open_redirector(temp_opener), paths_exist('media/comp', 'media/comp/css', 'media/comp/js')):
+        with media_root() as root:
+            with contextlib.nested(django_exceptions(), self.media_settings(root)):
                 from compilation.templatetags.compiler import CompilerNode
                 html = "<script type=\"text/javascript\">inline</script>"
                 nodelist = MockNodelist(html)
                 compiler_node = CompilerNode(nodelist)
                 compiler_node.render(None)
-                self.assertEqual(read_handle.read(), 'inline\n')
+                self.assertEqual(self.read_bundle(root, 'js'), 'inline\n')
     
     def test_scripts_file_compiled(self):
-        with contextlib.nested(*make_named_files(2)) as (js_file, temp_file):
-            js_file.write('file')
-            js_file.flush()
-            js_read_handle = open(js_file.name, 'r')
-            temp_read_handle = open(temp_file.name, 'r')
-            def temp_opener(filename):
-                if 'media/comp/js' in filename:
-                    return temp_file
-                if 'media/test.js' in filename:
-                    return js_read_handle
-                return None
-            
-            with contextlib.nested(django_exceptions(), django_settings({'COMPILER_ROOT':'comp', 'MEDIA_ROOT':'media', 'MEDIA_URL':'/media/'}), open_redirector(temp_opener), modified_time(), paths_exist('media/comp', 'media/comp/css', 'media/comp/js')):
+        with media_root({'test.js': 'file'}) as root:
+            with contextlib.nested(django_exceptions(), self.media_settings(root)):
                 from compilation.templatetags.compiler import CompilerNode
                 html = "<link type=\"text/javascript\" href=\"/media/test.js\" />"
                 nodelist = MockNodelist(html)
                 compiler_node = CompilerNode(nodelist)
                 compiler_node.render(None)
-                self.assertEqual(temp_read_handle.read(), 'file\n')
+                self.assertEqual(self.read_bundle(root, 'js'), 'file\n')
     
     def test_scripts_compiled(self):
-        with contextlib.nested(*make_named_files(2)) as (js_file, temp_file):
-            js_file.write('file')
-            js_file.flush()
-            js_read_handle = open(js_file.name, 'r')
-            temp_read_handle = open(temp_file.name, 'r')
-            def temp_opener(filename):
-                if 'media/comp/js' in filename:
-                    return temp_file
-                if 'media/test.js' in filename:
-                    return js_read_handle
-                return None
-            
-            with contextlib.nested(django_exceptions(), django_settings({'COMPILER_ROOT':'comp', 'MEDIA_ROOT':'media', 'MEDIA_URL':'/media/'}), open_redirector(temp_opener), modified_time(), paths_exist('media/comp', 'media/comp/css', 'media/comp/js')):
+        with media_root({'test.js': 'file'}) as root:
+            with contextlib.nested(django_exceptions(), self.media_settings(root)):
                 from compilation.templatetags.compiler import CompilerNode
                 html = """
                     <link type="text/javascript" href="/media/test.js" />
@@ -115,59 +96,31 @@ class TestTemplateTag(CompilerTestCase):
                 nodelist = MockNodelist(html)
                 compiler_node = CompilerNode(nodelist)
                 compiler_node.render(None)
-                self.assertSortedEqual(temp_read_handle.read().strip().split('\n'), ['file', 'inline'])
+                self.assertSortedEqual(self.read_bundle(root, 'js').strip().split('\n'), ['file', 'inline'])
     
     def test_styles_inline_compiled(self):
-        with tempfile.NamedTemporaryFile(mode='w') as temp_file:
-            read_handle = open(temp_file.name, 'r')
-            def temp_opener(filename):
-                if 'media/comp/css' in filename:
-                    return temp_file
-                return None
-            
-            with contextlib.nested(django_exceptions(), django_settings({'COMPILER_ROOT':'comp', 'MEDIA_ROOT':'media', 'MEDIA_URL':'/media/'}), open_redirector(temp_opener), paths_exist('media/comp', 'media/comp/css', 'media/comp/js')):
+        with media_root() as root:
+            with contextlib.nested(django_exceptions(), self.media_settings(root)):
                 from compilation.templatetags.compiler import CompilerNode
                 html = "<style type=\"text/css\">inline</style>"
                 nodelist = MockNodelist(html)
                 compiler_node = CompilerNode(nodelist)
                 compiler_node.render(None)
-                self.assertEqual(read_handle.read(), 'inline\n')
+                self.assertEqual(self.read_bundle(root, 'css'), 'inline\n')
 
     def test_styles_file_compiled(self):
-        with contextlib.nested(*make_named_files(2)) as (css_file, temp_file):
-            css_file.write('file')
-            css_file.flush()
-            css_read_handle = open(css_file.name, 'r')
-            temp_read_handle = open(temp_file.name, 'r')
-            def temp_opener(filename):
-                if 'media/comp/css' in filename:
-                    return temp_file
-                if 'media/test.css' in filename:
-                    return css_read_handle
-                return None
-            
-            with contextlib.nested(django_exceptions(), django_settings({'COMPILER_ROOT':'comp', 'MEDIA_ROOT':'media', 'MEDIA_URL':'/media/'}), open_redirector(temp_opener), modified_time(), paths_exist('media/comp', 'media/comp/css', 'media/comp/js')):
+        with media_root({'test.css': 'file'}) as root:
+            with contextlib.nested(django_exceptions(), self.media_settings(root)):
                 from compilation.templatetags.compiler import CompilerNode
                 html = "<link type=\"text/css\" href=\"/media/test.css\" />"
                 nodelist = MockNodelist(html)
                 compiler_node = CompilerNode(nodelist)
                 compiler_node.render(None)
-                self.assertEqual(temp_read_handle.read(), 'file\n')
+                self.assertEqual(self.read_bundle(root, 'css'), 'file\n')
 
     def test_styles_compiled(self):
-        with contextlib.nested(*make_named_files(2)) as (css_file, temp_file):
-            css_file.write('file')
-            css_file.flush()
-            css_read_handle = open(css_file.name, 'r')
-            temp_read_handle = open(temp_file.name, 'r')
-            def temp_opener(filename):
-                if 'media/comp/css' in filename:
-                    return temp_file
-                if 'media/test.css' in filename:
-                    return css_read_handle
-                return None
-            
-            with contextlib.nested(django_exceptions(), django_settings({'COMPILER_ROOT':'comp', 'MEDIA_ROOT':'media', 'MEDIA_URL':'/media/'}), open_redirector(temp_opener), modified_time(), paths_exist('media/comp', 'media/comp/css', 'media/comp/js')):
+        with media_root({'test.css': 'file'}) as root:
+            with contextlib.nested(django_exceptions(), self.media_settings(root)):
                 from compilation.templatetags.compiler import CompilerNode
                 html = """
                     <link type="text/css" href="/media/test.css" />
@@ -176,32 +129,11 @@ class TestTemplateTag(CompilerTestCase):
                 nodelist = MockNodelist(html)
                 compiler_node = CompilerNode(nodelist)
                 compiler_node.render(None)
-                self.assertSortedEqual(temp_read_handle.read().strip().split('\n'), ['file', 'inline'])
+                self.assertSortedEqual(self.read_bundle(root, 'css').strip().split('\n'), ['file', 'inline'])
 
     def test_everything_compiled(self):
-        with contextlib.nested(*make_named_files(4)) as (css_file, js_file, css_out, js_out):
-            css_file.write('cssfile')
-            css_file.flush()
-            js_file.write('jsfile')
-            js_file.flush()
-            
-            css_read_handle = open(css_file.name, 'r')
-            js_read_handle = open(js_file.name, 'r')
-            
-            css_out_handle = open(css_out.name, 'r')
-            js_out_handle = open(js_out.name, 'r')
-            def temp_opener(filename):
-                if 'media/comp/css' in filename:
-                    return css_out
-                if 'media/comp/js' in filename:
-                    return js_out
-                if 'media/test.css' in filename:
-                    return css_read_handle
-                if 'media/test.js' in filename:
-                    return js_read_handle
-                return None
-            
-            with contextlib.nested(django_exceptions(), django_settings({'COMPILER_ROOT':'comp', 'MEDIA_ROOT':'media', 'MEDIA_URL':'/media/'}), open_redirector(temp_opener), modified_time(), paths_exist('media/comp', 'media/comp/css', 'media/comp/js')):
+        with media_root({'test.css': 'cssfile', 'test.js': 'jsfile'}) as root:
+            with contextlib.nested(django_exceptions(), self.media_settings(root)):
                 from compilation.templatetags.compiler import CompilerNode
                 html = """
                     <link type="text/css" href="/media/test.css" />
@@ -212,5 +144,315 @@ class TestTemplateTag(CompilerTestCase):
                 nodelist = MockNodelist(html)
                 compiler_node = CompilerNode(nodelist)
                 compiler_node.render(None)
-                self.assertSortedEqual(css_out_handle.read().strip().split('\n'), ['cssfile', 'inline css'])
-                self.assertSortedEqual(js_out_handle.read().strip().split('\n'), ['jsfile', 'inline js'])
\ No newline at end of file
+                self.assertSortedEqual(self.read_bundle(root, 'css').strip().split('\n'), ['cssfile', 'inline css'])
+                self.assertSortedEqual(self.read_bundle(root, 'js').strip().split('\n'), ['jsfile', 'inline js'])
+
+    def test_small_bundle_inlined(self):
+        disallow = lambda filename: 'media/comp' in filename
+        with contextlib.nested(django_exceptions(), django_settings({'COMPILER_ROOT':'comp', 'MEDIA_ROOT':'media', 'MEDIA_URL':'/media/'}), compiler_settings(INLINE_THRESHOLD=100), open_exception(disallow), paths_exist('media/comp', 'media/comp/css', 'media/comp/js')):
+            from compilation.templatetags.compiler import CompilerNode
+            html = "<script type=\"text/javascript\">inline small</script>"
+            compiler_node = CompilerNode(MockNodelist(html))
+            self.assertEqual(compiler_node.render(None).strip(), "<script type='text/javascript'>inline small\n</script>")
+            #Served from memory the second time around
+            self.assertEqual(compiler_node.render(None).strip(), "<script type='text/javascript'>inline small\n</script>")
+    
+    def test_inline_escapes_closing_tag(self):
+        from compilation.templatetags.compiler import inline_tag
+        self.assertEqual(inline_tag('a = "</script>"', 'script'), "<script type='text/javascript'>a = \"<\\/script>\"</script>")
+    
+    def test_large_bundle_not_inlined(self):
+        with media_root() as root:
+            with contextlib.nested(django_exceptions(), self.media_settings(root), compiler_settings(INLINE_THRESHOLD=4)):
+                from compilation.templatetags.compiler import CompilerNode
+                html = "<script type=\"text/javascript\">not so small</script>"
+                compiler_node = CompilerNode(MockNodelist(html))
+                self.assertTrue('src=' in compiler_node.render(None))
+                self.assertEqual(self.read_bundle(root, 'js'), 'not so small\n')
+
+    def test_build_listeners(self):
+        from compilation.storage.bundles import add_build_listener, remove_build_listener
+        built = []
+        listener = lambda node_type, name, full_path, seconds: built.append((node_type, name, full_path))
+        with media_root() as root:
+            with contextlib.nested(django_exceptions(), self.media_settings(root)):
+                from compilation.templatetags.compiler import CompilerNode
+                html = "<script type=\"text/javascript\">listened</script>"
+                compiler_node = CompilerNode(MockNodelist(html))
+                add_build_listener(listener)
+                try:
+                    compiler_node.render(None)
+                    #Served from memory, nothing built
+                    compiler_node.render(None)
+                finally:
+                    remove_build_listener(listener)
+                [(node_type, name, full_path)] = built
+                self.assertEqual(node_type, 'script')
+                self.assertTrue(full_path.endswith('%s.js' % name))
+    
+    def test_emitted_bundles_recorded(self):
+        from compilation import state
+        with media_root() as root:
+            with contextlib.nested(django_exceptions(), self.media_settings(root), compiler_settings(SCRIPT_LOADING='defer', PRELOAD_TAGS=True)):
+                from compilation.templatetags.compiler import CompilerNode
+                html = "<script type=\"text/javascript\">recorded</script>"
+                compiler_node = CompilerNode(MockNodelist(html))
+                state.start()
+                try:
+                    output = compiler_node.render(None)
+                    [(url, node_type)] = state.bundles()
+                finally:
+                    state.finish()
+                self.assertEqual(node_type, 'script')
+                self.assertTrue("<link rel='preload' href='%s' as='script' />" % url in output)
+                self.assertTrue("src='%s' defer></script>" % url in output)
+
+    def test_repeated_block_memoized(self):
+        import os
+        from compilation import state
+        with media_root({'test.js': 'file'}) as root:
+            with contextlib.nested(django_exceptions(), self.media_settings(root)):
+                from compilation.templatetags.compiler import CompilerNode
+                compiler_node = CompilerNode(MockNodelist("<link type=\"text/javascript\" href=\"/media/test.js\" />"))
+                state.start()
+                try:
+                    first = compiler_node.render(None)
+                    #Nothing is located or hashed the second time around
+                    os.unlink(os.path.join(root, 'test.js'))
+                    self.assertEqual(compiler_node.render(None), first)
+                finally:
+                    state.finish()
+    
+    def test_duplicate_tags_suppressed(self):
+        from compilation import state
+        with media_root() as root:
+            with contextlib.nested(django_exceptions(), self.media_settings(root), compiler_settings(SUPPRESS_DUPLICATE_TAGS=True)):
+                from compilation.templatetags.compiler import CompilerNode
+                html = "<script type=\"text/javascript\">dup</script>"
+                state.start()
+                try:
+                    self.assertTrue('src=' in CompilerNode(MockNodelist(html)).render(None))
+                    self.assertEqual(CompilerNode(MockNodelist(html)).render(None).strip(), '')
+                    #Different markup, same bundle
+                    self.assertEqual(CompilerNode(MockNodelist(html.replace('"', "'"))).render(None).strip(), '')
+                finally:
+                    state.finish()
+
+    def test_static_text(self):
+        with django_text_nodes() as TextNode:
+            from compilation.templatetags.compiler import static_text
+            self.assertEqual(static_text(MockNodes([TextNode('<script '), TextNode('src="a.js">')])), '<script src="a.js">')
+            self.assertEqual(static_text(MockNodes([TextNode('<script '), object()])), None)
+            self.assertEqual(static_text(MockNodelist('not iterable')), None)
+    
+    def test_static_block_compiled_once(self):
+        import os
+        with media_root({'test.js': 'file'}) as root:
+            with contextlib.nested(django_exceptions(), self.media_settings(root), django_text_nodes()) as (_, _, TextNode):
+                from compilation.templatetags.compiler import do_compile
+                node = do_compile(MockParser(MockNodes([TextNode('<link type="text/javascript" href="/media/test.js" />')])), MockToken())
+                self.assertNotEqual(node.static_html, None)
+                #Built on the first render rather than when parsed
+                self.assertEqual(node.block, None)
+                self.assertEqual(os.listdir(os.path.join(root, 'comp', 'js')), [])
+                first = node.render(None)
+                self.assertNotEqual(node.block, None)
+                self.assertEqual(self.read_bundle(root, 'js'), 'file\n')
+                
+                #Rendering doesn't build anything while the files are unchanged
+                block = node.block
+                self.assertEqual(node.render(None), first)
+                self.assertTrue(node.block is block)
+                
+                with open(os.path.join(root, 'test.js'), 'w') as handle:
+                    handle.write('changed')
+                os.utime(os.path.join(root, 'test.js'), (1, 1))
+                self.assertNotEqual(node.render(None), first)
+                self.assertFalse(node.block is block)
+    
+    def test_dynamic_block_not_compiled_when_parsed(self):
+        with django_text_nodes() as TextNode:
+            from compilation.templatetags.compiler import do_compile
+            node = do_compile(MockParser(MockNodes([TextNode('<script>'), object()])), MockToken())
+            self.assertEqual(node.static_html, None)
+            self.assertEqual(node.block, None)
+    
+    def test_dynamic_block_keyed_on_variables(self):
+        with media_root() as root:
+            with contextlib.nested(django_exceptions(), self.media_settings(root), django_template_base()) as (_, _, base):
+                from compilation.templatetags.compiler import CompilerNode
+                
+                class CountingNodeList(base.NodeList):
+                    renders = 0
+                    def render(self, context):
+                        CountingNodeList.renders += 1
+                        return super(CountingNodeList, self).render(context)
+                
+                nodelist = CountingNodeList([
+                    base.TextNode('<script type="text/javascript">'),
+                    base.VariableNode(base.FilterExpression(base.Variable('code'))),
+                    base.TextNode('</script>'),
+                ])
+                node = CompilerNode(nodelist)
+                self.assertEqual([variable.var for variable in node.variables], ['code'])
+                
+                first = node.render({'code': 'one'})
+                self.assertEqual(node.render({'code': 'one', 'unused': 1}), first)
+                self.assertEqual(CountingNodeList.renders, 1)
+                
+                self.assertNotEqual(node.render({'code': 'two'}), first)
+                self.assertEqual(CountingNodeList.renders, 2)
+                
+                #Can't key on arbitrary objects, always rendered
+                class Code(object):
+                    def __unicode__(self):
+                        return u'one'
+                self.assertEqual(node.render({'code': Code()}), first)
+                self.assertEqual(CountingNodeList.renders, 3)
+    
+    def test_parse_critical(self):
+        with django_template():
+            from compilation.templatetags.compiler import parse_critical, template
+            from compilation.settings import COMPILER
+            self.assertEqual(parse_critical([]), None)
+            self.assertEqual(parse_critical(['critical']), tuple(COMPILER.CRITICAL_SELECTORS))
+            self.assertEqual(parse_critical(MockToken('compile critical=".header,  #nav  a"').split_contents()[1:]), ('.header', '#nav a'))
+            self.assertRaises(template.TemplateSyntaxError, parse_critical, ['unknown'])
+    
+    def test_critical_css(self):
+        import os
+        css = 'body { margin: 0 }\n.footer { color: red }\n@media print { .header { display: none } .footer { display: none } }'
+        with media_root() as root:
+            with contextlib.nested(django_template(), django_exceptions(), self.media_settings(root)):
+                from compilation.templatetags.compiler import CompilerNode, critical_cache
+                critical_cache.clear()
+                node = CompilerNode(MockNodelist('<style type="text/css">%s</style>' % css), ('body', '.header'))
+                markup = node.render(None)
+                
+                self.assertTrue(markup.strip().startswith("<style type='text/css'>body{ margin: 0 }\n@media print{.header{ display: none }}</style>"))
+                self.assertTrue("rel='preload'" in markup and '<noscript>' in markup)
+                self.assertEqual(len(critical_cache), 1)
+                
+                bundles = [os.path.join(root, 'comp', 'css', name) for name in os.listdir(os.path.join(root, 'comp', 'css'))]
+                self.assertEqual(len(bundles), 2)
+                [remainder] = [path for path in bundles if os.path.basename(path) in markup]
+                with open(remainder) as handle:
+                    self.assertEqual(handle.read(), '.footer{ color: red }\n@media print{.footer{ display: none }}')
+    
+    def test_stale_on_compile_error(self):
+        import os
+        with media_root({'test.js': 'good'}) as root:
+            with contextlib.nested(django_template(), django_exceptions(), self.media_settings(root)) as (_, _, _):
+                from compilation.templatetags.compiler import CompilerNode
+                from compilation.handlers.base import failures
+                html = '<link type="text/javascript" href="/media/test.js" />'
+                node = CompilerNode(MockNodelist(html))
+                with compiler_settings(COMPILE_ERRORS='stale'):
+                    first = node.render(None)
+                
+                os.unlink(os.path.join(root, 'test.js'))
+                try:
+                    self.assertRaises(ValueError, node.render, None)
+                    
+                    with compiler_settings(COMPILE_ERRORS='stale'):
+                        self.assertEqual(node.render(None), first)
+                        self.assertRaises(ValueError, CompilerNode(MockNodelist(html)).render, None)
+                finally:
+                    failures.clear()
+    
+    def test_stale_never_crosses_keys(self):
+        with media_root({'one.js': 'one'}) as root:
+            with contextlib.nested(django_exceptions(), self.media_settings(root), django_template_base(), compiler_settings(COMPILE_ERRORS='stale')) as (_, _, base, _):
+                from compilation.templatetags.compiler import CompilerNode
+                from compilation.handlers.base import failures
+                node = CompilerNode(base.NodeList([
+                    base.TextNode('<link type="text/javascript" href="/media/'),
+                    base.VariableNode(base.FilterExpression(base.Variable('name'))),
+                    base.TextNode('.js" />'),
+                ]))
+                first = node.render({'name': 'one'})
+                try:
+                    #No good version of its own to fall back on
+                    self.assertRaises(ValueError, node.render, {'name': 'two'})
+                    self.assertRaises(ValueError, node.render, {'name': 'two'})
+                    self.assertEqual(node.render({'name': 'one'}), first)
+                finally:
+                    failures.clear()
+    
+    def test_revalidate_in_background(self):
+        import os
+        with media_root({'test.js': 'first'}) as root:
+            with contextlib.nested(django_template(), django_exceptions(), self.media_settings(root), compiler_settings(REVALIDATE_IN_BACKGROUND=True)):
+                from compilation.templatetags.compiler import CompilerNode
+                from compilation.revalidate import revalidator
+                node = CompilerNode(MockNodelist('<link type="text/javascript" href="/media/test.js" />'))
+                first = node.render(None)
+                
+                with open(os.path.join(root, 'test.js'), 'w') as handle:
+                    handle.write('second')
+                os.utime(os.path.join(root, 'test.js'), (1, 1))
+                
+                #The previous bundle until the new one is built
+                self.assertEqual(node.render(None), first)
+                revalidator.join()
+                second = node.render(None)
+                self.assertNotEqual(second, first)
+                self.assertEqual(len(os.listdir(os.path.join(root, 'comp', 'js'))), 2)
+    
+    def test_debug_tag_per_member(self):
+        import os
+        from tests.contexts import command_handler
+        from compilation.handlers.base import BaseCompilingHandler, HandlerRegistry
+        with media_root({'plain.css': 'plain', 'fancy.test': 'fancy'}) as root:
+            with contextlib.nested(django_template(), django_exceptions(), self.media_settings(root), compiler_settings(DEBUG=True),
+                                   command_handler(BaseCompilingHandler, HandlerRegistry, 'style', 'tr a-z A-Z < %s')):
+                from compilation.templatetags.compiler import CompilerNode
+                html = """
+                    <link type="text/css" href="/media/plain.css" />
+                    <style type="text/css">inline</style>
+                    <link type="text/test" href="/media/fancy.test" />
+                """
+                node = CompilerNode(MockNodelist(html))
+                tags = node.render(None).split('\n')[1:] #No scripts
+                self.assertEqual(len(tags), 3)
+                self.assertTrue("<style type='text/css'>inline</style>" in tags)
+                self.assertTrue("<link type='text/css' href='/media/plain.css' />" in tags)
+                
+                #Only the compiled member got a file
+                self.assertEqual(self.read_bundle(root, 'css'), 'FANCY\n')
+                
+                with open(os.path.join(root, 'fancy.test'), 'w') as handle:
+                    handle.write('edited')
+                os.utime(os.path.join(root, 'fancy.test'), (1, 1))
+                edited = node.render(None).split('\n')[1:]
+                self.assertEqual(len(set(tags) - set(edited)), 1)
+                self.assertEqual(len(os.listdir(os.path.join(root, 'comp', 'css'))), 2)
+    
+    def test_remote_members_expire(self):
+        import shutil, tempfile
+        from tests.locators.test_remote import asset_server
+        from compilation.locators.remote import remote_cache
+        import compilation.locators.locators
+        directory = tempfile.mkdtemp()
+        files = {'/vendor.js': 'var vendor = 1;'}
+        try:
+            with media_root() as root:
+                with contextlib.nested(django_template(), django_exceptions(), self.media_settings(root),
+                                       compiler_settings(REMOTE_CACHE_DIR=directory), asset_server(files)) as (_, _, _, _, (server, url)):
+                    from compilation.templatetags.compiler import CompilerNode
+                    html = '<link type="text/javascript" href="%s/vendor.js" />' % url
+                    node = CompilerNode(MockNodelist(html))
+                    block = node.compile(html)
+                    self.assertTrue(block.fresh())
+                    
+                    #Due for revalidation: rebuilt, with what the server has now
+                    files['/vendor.js'] = 'var vendor = 2;'
+                    remote_cache.clear()
+                    self.assertFalse(block.fresh())
+                    rebuilt = node.compile(html)
+                    self.assertNotEqual(rebuilt.render(), block.render())
+                    self.assertTrue(rebuilt.fresh())
+        finally:
+            remote_cache.pool.close()
+            remote_cache.clear()
+            shutil.rmtree(directory)
@@ -0,0 +1,85 @@
+from tests.utils import CompilerTestCase
+from tests.exceptions import TestException
+from tests.contexts import command_handler, compiler_settings
+from compilation.handlers.base import BaseCompilingHandler, HandlerRegistry, CompileError, failures
+from compilation import backends
+import contextlib
+
+def shout(source):
+    return source.upper()
+
+def broken(source):
+    raise ValueError('bad syntax')
+
+class BackendTests(CompilerTestCase):
+    def setUp(self):
+        failures.clear()
+        self._backends = backends.BACKENDS.copy()
+        backends.BACKENDS.update({
+            'shout': ('json', shout),
+            'broken': ('json', broken),
+            'missing': ('no_such_module_anywhere', shout),
+        })
+    
+    def tearDown(self):
+        backends.BACKENDS = self._backends
+        backends.chosen.clear()
+    
+    def compile(self, TestHandler, content):
+        handler = TestHandler(content, 'content')
+        handler.call_pre_insert()
+        return handler.content
+    
+    def test_in_process(self):
+        with command_handler(BaseCompilingHandler, HandlerRegistry, 'style', 'exit 1 # %s') as TestHandler:
+            TestHandler.backends = ('missing', 'shout')
+            self.assertEqual(backends.choose_backend(TestHandler), ('shout', shout))
+            self.assertEqual(self.compile(TestHandler, 'a {}'), 'A {}')
+    
+    def test_fallback_to_command(self):
+        with command_handler(BaseCompilingHandler, HandlerRegistry, 'style', 'cat %s') as TestHandler:
+            TestHandler.backends = ('missing', 'unknown')
+            self.assertEqual(backends.choose_backend(TestHandler), None)
+            self.assertEqual(self.compile(TestHandler, 'a {}'), 'a {}')
+    
+    def test_disabled(self):
+        with contextlib.nested(command_handler(BaseCompilingHandler, HandlerRegistry, 'style', 'cat %s'), compiler_settings(IN_PROCESS_COMPILERS=False)) as (TestHandler, _):
+            TestHandler.backends = ('shout',)
+            self.assertEqual(self.compile(TestHandler, 'a {}'), 'a {}')
+    
+    def test_chosen_once(self):
+        with command_handler(BaseCompilingHandler, HandlerRegistry, 'style', 'cat %s') as TestHandler:
+            TestHandler.backends = ('shout',)
+            self.assertEqual(self.compile(TestHandler, 'a {}'), 'A {}')
+            backends.BACKENDS['shout'] = ('no_such_module_anywhere', shout)
+            self.assertEqual(self.compile(TestHandler, 'b {}'), 'B {}')
+    
+    def test_error(self):
+        with command_handler(BaseCompilingHandler, HandlerRegistry, 'style', 'cat %s') as TestHandler:
+            TestHandler.backends = ('broken',)
+            try:
+                self.compile(TestHandler, 'a {')
+            except CompileError, e:
+                self.assertEqual(e.command, 'broken')
+                self.assertEqual(e.stderr, 'ValueError: bad syntax')
+            else:
+                raise TestException('CompileError not raised')
+    
+    def test_executor_limits(self):
+        from compilation.executor import executor, CompileBusy
+        with command_handler(BaseCompilingHandler, HandlerRegistry, 'style', 'cat %s') as TestHandler:
+            TestHandler.backends = ('shout',)
+            completed = executor.stats()['completed']
+            self.assertEqual(self.compile(TestHandler, 'a {}'), 'A {}')
+            self.assertEqual(executor.stats()['completed'], completed + 1)
+            
+            with compiler_settings(COMPILE_CONCURRENCY=1, COMPILE_QUEUE_TIMEOUT=0.01):
+                executor.acquire(TestHandler.mime, 'test')
+                try:
+                    self.assertRaises(CompileBusy, self.compile, TestHandler, 'b {}')
+                finally:
+                    executor.release(TestHandler.mime)
+    
+    def test_handlers_list_backends(self):
+        self.assertEqual(HandlerRegistry.styles['text/scss'].backends, ('libsass-scss',))
+        self.assertEqual(HandlerRegistry.styles['text/less'].backends, ('lesscpy',))
@@ -0,0 +1,102 @@
+from tests.utils import CompilerTestCase, MockNodelist
+from tests.contexts import django_template, django_exceptions, django_settings, media_root, compiler_settings
+from compilation.budget import gzip_size, collect, diff, main
+from StringIO import StringIO
+import contextlib
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+def report(**sizes):
+    #{'name': gzip bytes} -> a collected report of script bundles
+    bundles = {}
+    for name, size in sizes.items():
+        bundles['script /media/%s.js' % name] = {'type': 'script', 'bytes': size * 3, 'gzip_bytes': size, 'compile_seconds': 0.1}
+    return {'bundles': bundles, 'totals': {
+        'bundles': len(bundles), 'bytes': sum(size * 3 for size in sizes.values()),
+        'gzip_bytes': sum(sizes.values()), 'compile_seconds': 0.1 * len(bundles)}}
+
+class BudgetTests(CompilerTestCase):
+    def context(self, root, **kw):
+        return contextlib.nested(django_template(), django_exceptions(),
+                                 django_settings({'COMPILER_ROOT':'comp', 'MEDIA_ROOT':root, 'MEDIA_URL':'/media/'}),
+                                 compiler_settings(BUNDLE_REPORTS=True, **kw))
+    
+    def test_gzip_size(self):
+        content = 'var a = 1;\n' * 100
+        stream = StringIO()
+        with gzip.GzipFile(fileobj=stream, mode='wb', compresslevel=9) as zipped:
+            zipped.write(content)
+        self.assertTrue(gzip_size(content) < len(content))
+        self.assertTrue(abs(gzip_size(content) - len(stream.getvalue())) < 16)
+    
+    def test_recorded_on_render(self):
+        with media_root({'test.js': 'var a = 1;'}) as root:
+            with self.context(root):
+                from compilation.templatetags.compiler import CompilerNode
+                html = '<link type="text/javascript" href="/media/test.js" /><script type="text/javascript">inline()</script>'
+                CompilerNode(MockNodelist(html)).render(None)
+                
+                report = collect(os.path.join(root, 'comp', 'reports'))
+                [(key, record)] = report['bundles'].items()
+                from compilation.hashing import hash_string
+                self.assertEqual(key, 'script inline text/javascript %s + /media/test.js' % hash_string('inline()')[:16])
+                self.assertEqual(record['bytes'], len('inline()\nvar a = 1;\n'))
+                self.assertEqual(record['raw_bytes'], len('inline()var a = 1;'))
+                self.assertTrue(record['url'].startswith('/static/comp/js/'))
+                self.assertEqual([member['bytes'] for member in record['members']], [8, 10])
+                self.assertEqual(report['totals']['bundles'], 1)
+    
+    def test_recorded_by_build(self):
+        from compilation.build import build_bundles
+        from compilation.handlers.base import HandlerRegistry
+        with media_root() as root:
+            with self.context(root):
+                jobs = [([HandlerRegistry.styles['text/css'](css, 'content')], 'style') for css in ('a { color: red }', 'b { color: blue }')]
+                build_bundles(jobs, processes=1, stream=StringIO())
+                #Different inline bundles are reported separately
+                records = collect(os.path.join(root, 'comp', 'reports'))['bundles'].values()
+                self.assertEqual(len(records), 2)
+                self.assertEqual([record['type'] for record in records], ['style', 'style'])
+                self.assertTrue(all(record['members'][0]['source'].startswith('inline text/css ') for record in records))
+    
+    def test_not_recorded_by_default(self):
+        with media_root({'test.js': 'var a = 1;'}) as root:
+            with contextlib.nested(self.context(root), compiler_settings(BUNDLE_REPORTS=False)):
+                from compilation.templatetags.compiler import CompilerNode
+                CompilerNode(MockNodelist('<link type="text/javascript" href="/media/test.js" />')).render(None)
+                self.assertFalse(os.path.exists(os.path.join(root, 'comp', 'reports')))
+    
+    def test_diff(self):
+        lines, violations = diff(report(a=100, b=100, c=100), report(a=100, b=150, d=10))
+        self.assertEqual(violations, [])
+        self.assertEqual([line.split()[0] for line in lines], ['changed', 'removed', 'added', 'total'])
+    
+    def test_budgets(self):
+        old = report(a=100, b=100)
+        new = report(a=100, b=150)
+        self.assertEqual(len(diff(old, new, max_growth_bytes=40)[1]), 1)
+        self.assertEqual(len(diff(old, new, max_growth_bytes=50)[1]), 0)
+        self.assertEqual(len(diff(old, new, max_growth_percent=20)[1]), 1)
+        self.assertEqual(len(diff(old, new, max_gzip_bytes=120)[1]), 1)
+        self.assertEqual(len(diff(old, new, max_bytes=300)[1]), 1)
+        self.assertEqual(len(diff(old, new, max_compile_seconds=0.05)[1]), 2)
+        self.assertEqual(len(diff(old, new, max_total_bytes=249)[1]), 1)
+    
+    def test_main(self):
+        directory = tempfile.mkdtemp()
+        try:
+            paths = []
+            for name, sizes in (('old', {'a': 100}), ('new', {'a': 200})):
+                paths.append(os.path.join(directory, name + '.json'))
+                with open(paths[-1], 'w') as handle:
+                    json.dump(report(**sizes), handle)
+            
+            stream = StringIO()
+            self.assertEqual(main(['diff'] + paths, stream), 0)
+            self.assertEqual(main(['diff'] + paths + ['--max-growth-percent', '50'], stream), 1)
+            self.assertTrue('OVER BUDGET: script /media/a.js grew by 100.0%' in stream.getvalue())
+        finally:
+            shutil.rmtree(directory)
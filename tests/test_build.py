@@ -0,0 +1,95 @@
+from tests.utils import CompilerTestCase
+from tests.contexts import django_settings, media_root, command_handler
+from compilation.build import build_bundles
+from compilation.handlers.base import BaseHandler, HandlerRegistry
+from StringIO import StringIO
+import contextlib
+import os
+
+class FailingHandler(BaseHandler):
+    abstract = True
+    mime = ''
+    category = ''
+    
+    def pre_insert(self):
+        raise ValueError('syntax error')
+
+class BuildTests(CompilerTestCase):
+    def settings(self, root):
+        return django_settings({'COMPILER_ROOT':'comp', 'MEDIA_ROOT':root, 'MEDIA_URL':'/media/'})
+
+    def script(self, content):
+        return HandlerRegistry.scripts['text/javascript'](content, 'content')
+
+    def style(self, content):
+        return HandlerRegistry.styles['text/css'](content, 'content')
+
+    def read(self, path):
+        with open(path) as handle:
+            return handle.read()
+
+    def test_builds_bundles(self):
+        with media_root({'a.js': 'file a'}) as root:
+            with self.settings(root):
+                file_handler = HandlerRegistry.scripts['text/javascript'](os.path.join(root, 'a.js'), 'file')
+                jobs = [
+                    ([self.script('one'), file_handler], 'script'),
+                    ([self.style('two')], 'style'),
+                ]
+                summary = build_bundles(jobs, processes=1, stream=StringIO())
+
+                self.assertEqual(len(summary.built), 2)
+                contents = sorted(self.read(path) for _, _, path, _ in summary.built)
+                self.assertEqual(contents, ['one\nfile a\n', 'two\n'])
+
+    def test_deduplicates(self):
+        with media_root() as root:
+            with self.settings(root):
+                jobs = [
+                    ([self.script('shared'), self.script('one')], 'script'),
+                    ([self.script('shared'), self.script('one')], 'script'),
+                    ([self.script('shared'), self.script('two')], 'script'),
+                ]
+                summary = build_bundles(jobs, processes=1, stream=StringIO())
+                self.assertEqual(len(summary.built), 2)
+                self.assertEqual(summary.duplicates, 1)
+                self.assertEqual(summary.compiled_members, 3)
+                self.assertEqual(summary.shared_members, 1)
+
+    def test_up_to_date_skipped(self):
+        with media_root() as root:
+            with self.settings(root):
+                jobs = [([self.script('one')], 'script')]
+                build_bundles(jobs, processes=1, stream=StringIO())
+                summary = build_bundles(jobs, processes=1, stream=StringIO())
+                self.assertEqual(summary.built, [])
+                self.assertEqual(summary.up_to_date, 1)
+
+                summary = build_bundles(jobs, processes=1, stream=StringIO(), force=True)
+                self.assertEqual(len(summary.built), 1)
+
+    def test_process_pool(self):
+        with media_root() as root:
+            with self.settings(root):
+                jobs = [([self.script('bundle %d' % i), self.script('shared')], 'script') for i in xrange(20)]
+                stream = StringIO()
+                summary = build_bundles(jobs, processes=2, stream=stream)
+                self.assertEqual(len(summary.built), 20)
+                for _, _, path, size in summary.built:
+                    self.assertEqual(len(self.read(path)), size)
+                self.assertTrue('Built 20 bundles' in stream.getvalue())
+                self.assertEqual(len(os.listdir(os.path.join(root, 'comp', 'js'))), 20)
+
+    def test_failure_reported(self):
+        with media_root() as root:
+            with contextlib.nested(self.settings(root), command_handler(FailingHandler, HandlerRegistry, 'script', '')) as (_, Failing):
+                jobs = [
+                    ([Failing('broken', 'content')], 'script'),
+                    ([self.script('fine')], 'script'),
+                ]
+                stream = StringIO()
+                summary = build_bundles(jobs, processes=1, stream=stream)
+                self.assertEqual(len(summary.built), 1)
+                [(node_type, name, error)] = summary.failed
+                self.assertEqual(error, 'ValueError: syntax error')
+                self.assertTrue('1 bundles failed' in stream.getvalue())
@@ -0,0 +1,41 @@
+from tests.utils import CompilerTestCase, make_named_files
+from compilation.cache import BoundedCache, fresh
+import os
+
+class BoundedCacheTests(CompilerTestCase):
+    def test_set_returns_value(self):
+        cache = BoundedCache()
+        self.assertEqual(cache.set('key', 'value'), 'value')
+        self.assertEqual(cache.get('key'), 'value')
+    
+    def test_missing_key(self):
+        cache = BoundedCache()
+        self.assertEqual(cache.get('key'), None)
+        self.assertEqual(cache.get('key', 'default'), 'default')
+    
+    def test_evicts_least_recently_used(self):
+        cache = BoundedCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertTrue('a' in cache)
+        self.assertTrue('b' not in cache)
+        self.assertTrue('c' in cache)
+        self.assertEqual(len(cache), 2)
+    
+    def test_unbounded(self):
+        cache = BoundedCache(0)
+        for i in xrange(100):
+            cache.set(i, i)
+        self.assertEqual(len(cache), 100)
+
+class FreshTests(CompilerTestCase):
+    def test_fresh(self):
+        with make_named_files() as temp_file:
+            dependencies = [(temp_file.name, os.path.getmtime(temp_file.name))]
+            self.assertTrue(fresh(dependencies))
+            os.utime(temp_file.name, (1, 1))
+            self.assertFalse(fresh(dependencies))
+        self.assertFalse(fresh([('/nonexistent/file', 0)]))
+        self.assertTrue(fresh([]))
@@ -0,0 +1,201 @@
+from tests.utils import CompilerTestCase
+from tests.contexts import django_settings, media_root, compiler_settings
+from compilation.css import rewrite_urls, split_suffix, flatten_imports, imported_paths, asset_paths, split_rules, split_critical, rewritten, imports
+from compilation.handlers.base import HandlerRegistry
+import contextlib
+import os
+
+class CSSTests(CompilerTestCase):
+    def setUp(self):
+        rewritten.clear()
+        imports.clear()
+    
+    def settings(self, root, **kw):
+        kw.setdefault('CSS_REWRITE_URLS', True)
+        kw.setdefault('CSS_FLATTEN_IMPORTS', True)
+        return contextlib.nested(
+            django_settings({'COMPILER_ROOT':'comp', 'MEDIA_ROOT':root, 'MEDIA_URL':'/media/'}),
+            compiler_settings(**kw))
+    
+    def files(self):
+        return media_root({'icon.png': 'tiny png', 'logo.png': 'a larger png than the icon'})
+    
+    def test_split_suffix(self):
+        self.assertEqual(split_suffix('font.eot?#iefix'), ('font.eot', '?#iefix'))
+        self.assertEqual(split_suffix('sprite.svg#icon'), ('sprite.svg', '#icon'))
+        self.assertEqual(split_suffix('plain.png'), ('plain.png', ''))
+    
+    def test_fingerprinted(self):
+        with self.files() as root:
+            with self.settings(root):
+                content = rewrite_urls('a { background: url("../logo.png?v=1") }', '/media/css/site.css')
+                [asset] = os.listdir(os.path.join(root, 'comp', 'assets'))
+                self.assertTrue(asset.endswith('.png'))
+                self.assertEqual(content, 'a { background: url("/static/comp/assets/%s?v=1") }' % asset)
+                with open(os.path.join(root, 'comp', 'assets', asset)) as handle:
+                    self.assertEqual(handle.read(), 'a larger png than the icon')
+    
+    def test_relative_to_file(self):
+        with self.files() as root:
+            with self.settings(root):
+                os.mkdir(os.path.join(root, 'css'))
+                content = rewrite_urls('a { background: url(../logo.png) }', base_path=os.path.join(root, 'css', 'site.css'))
+                self.assertTrue('/static/comp/assets/' in content)
+    
+    def test_data_uri(self):
+        with self.files() as root:
+            with self.settings(root, CSS_DATA_URI_THRESHOLD=10):
+                content = rewrite_urls("a { background: url('/media/icon.png') } b { background: url('/media/logo.png') }")
+                self.assertTrue("url('data:image/png;base64,dGlueSBwbmc=')" in content)
+                self.assertTrue("url('/static/comp/assets/" in content)
+    
+    def test_left_alone(self):
+        with self.files() as root:
+            with self.settings(root):
+                content = 'a { background: url(http://example.com/a.png) url(data:image/png;base64,AA==) url(missing.png) url(/media/missing.png) }'
+                self.assertEqual(rewrite_urls(content, '/media/site.css'), content)
+    
+    def test_asset_change(self):
+        with self.files() as root:
+            with self.settings(root):
+                css = 'a { background: url(/media/logo.png) }'
+                first = rewrite_urls(css)
+                self.assertEqual(rewrite_urls(css), first)
+                
+                with open(os.path.join(root, 'logo.png'), 'w') as handle:
+                    handle.write('a new logo')
+                os.utime(os.path.join(root, 'logo.png'), (1, 1))
+                self.assertNotEqual(rewrite_urls(css), first)
+    
+    def test_style_handlers_rewritten(self):
+        with self.files() as root:
+            with self.settings(root):
+                with open(os.path.join(root, 'site.css'), 'w') as handle:
+                    handle.write('a { background: url(logo.png) }')
+                handler = HandlerRegistry.styles['text/css']('/media/site.css', 'url')
+                handler.call_pre_insert()
+                self.assertTrue('url(/static/comp/assets/' in handler.content)
+                
+                handler = HandlerRegistry.styles['text/css'].from_source(*handler.source)
+                handler.call_pre_insert()
+                self.assertTrue('url(/static/comp/assets/' in handler.content)
+    
+    def test_disabled(self):
+        with self.files() as root:
+            with self.settings(root, CSS_REWRITE_URLS=False):
+                handler = HandlerRegistry.styles['text/css']('a { background: url(/media/logo.png) }', 'content')
+                handler.call_pre_insert()
+                self.assertEqual(handler.content, 'a { background: url(/media/logo.png) }')
+    
+    def write(self, root, name, content):
+        directory = os.path.dirname(os.path.join(root, name))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(os.path.join(root, name), 'w') as handle:
+            handle.write(content)
+    
+    def test_flatten_imports(self):
+        with self.files() as root:
+            with self.settings(root, CSS_REWRITE_URLS=False):
+                self.write(root, 'css/a.css', '@charset "utf-8";\n@import "sub/b.css";\na {}')
+                self.write(root, 'css/sub/b.css', "@import url('c.css') print;\nb { background: url(../../logo.png) }")
+                self.write(root, 'css/sub/c.css', 'c {}')
+                content = flatten_imports('@import url(/media/css/a.css);\nmain {}', '/media/page.css')
+                self.assertEqual(content, '\n@media print {\nc {}\n}\nb { background: url(/media/logo.png) }\na {}\nmain {}')
+    
+    def test_import_cycle(self):
+        with self.files() as root:
+            with self.settings(root, CSS_REWRITE_URLS=False):
+                self.write(root, 'a.css', '@import "b.css";\na {}')
+                self.write(root, 'b.css', '@import "a.css";\nb {}')
+                content = flatten_imports('@import "b.css";\na {}', '/media/a.css', os.path.join(root, 'a.css'))
+                self.assertEqual(content, '\nb {}\na {}')
+                #Only cached when complete
+                self.assertEqual(len(imports), 0)
+    
+    def test_unresolved_imports_hoisted(self):
+        with self.files() as root:
+            with self.settings(root, CSS_REWRITE_URLS=False):
+                self.write(root, 'a.css', 'a {}')
+                content = flatten_imports('@charset "utf-8";\n@import "a.css";\n@import url(http://example.com/font.css);\n@import "missing.css" screen;\nmain {}', '/media/page.css')
+                self.assertEqual(content, '@charset "utf-8";\n@import url(http://example.com/font.css);\n@import "missing.css" screen;\n\na {}\n\n\nmain {}')
+    
+    def test_imports_cached(self):
+        with self.files() as root:
+            with self.settings(root, CSS_REWRITE_URLS=False):
+                self.write(root, 'a.css', 'a {}')
+                self.assertEqual(flatten_imports('@import "/media/a.css";'), 'a {}')
+                self.assertEqual(len(imports), 1)
+                
+                self.write(root, 'a.css', 'changed {}')
+                os.utime(os.path.join(root, 'a.css'), (1, 1))
+                self.assertEqual(flatten_imports('@import "/media/a.css";'), 'changed {}')
+    
+    def test_css_handler_flattens(self):
+        with self.files() as root:
+            with self.settings(root):
+                self.write(root, 'css/a.css', 'a { background: url(../logo.png) }')
+                self.write(root, 'site.css', '@import "css/a.css";')
+                handler = HandlerRegistry.styles['text/css']('/media/site.css', 'url')
+                handler.call_pre_insert()
+                self.assertTrue(handler.content.startswith('a { background: url(/static/comp/assets/'))
+    
+    def test_split_rules(self):
+        content = '@charset "utf-8";\n/* { */ a { content: "}" }\n@media screen { b { x: y } }'
+        self.assertEqual(split_rules(content), [
+            ('@charset "utf-8";', None),
+            ('a', ' content: "}" '),
+            ('@media screen', ' b { x: y } '),
+        ])
+    
+    def test_split_critical(self):
+        content = '@charset "utf-8";\nh1, .title { a: b }\n.nav li { c: d }\n.navbar { e: f }\n@font-face { g: h }\n@keyframes spin { from { i: j } }'
+        critical, remainder = split_critical(content, ('h1', '.nav'))
+        self.assertEqual(critical, 'h1, .title{ a: b }\n.nav li{ c: d }\n@font-face{ g: h }')
+        self.assertEqual(remainder, '@charset "utf-8";\n.navbar{ e: f }\n@keyframes spin{ from { i: j } }')
+    
+    def test_imports_rename_bundle(self):
+        from tests.utils import MockNodelist
+        from tests.contexts import django_template, django_exceptions
+        with self.files() as root:
+            with contextlib.nested(self.settings(root, CSS_REWRITE_URLS=False), django_template(), django_exceptions()):
+                from compilation.templatetags.compiler import CompilerNode
+                self.write(root, 'a.css', '@import "b.css";\n.a{color:blue}')
+                self.write(root, 'b.css', '@import "c.css";\n.b{color:red}')
+                self.write(root, 'c.css', '.c{color:green}')
+                self.assertEqual(imported_paths('@import "/media/a.css";'), [os.path.join(root, name) for name in ('a.css', 'b.css', 'c.css')])
+                
+                node = CompilerNode(MockNodelist('<link type="text/css" href="/media/a.css" />'))
+                first = node.render(None)
+                block = node.compile('<link type="text/css" href="/media/a.css" />')
+                self.assertEqual(sorted(path for path, _ in block.dependencies if path.startswith(root) and not 'comp' in path),
+                                 [os.path.join(root, name) for name in ('a.css', 'b.css', 'c.css')])
+                
+                for name, content in (('b.css', '@import "c.css";\n.b{color:black}'), ('c.css', '.c{color:white}')):
+                    self.write(root, name, content)
+                    os.utime(os.path.join(root, name), (1, 1) if name == 'b.css' else (2, 2))
+                    second = node.render(None)
+                    self.assertNotEqual(second, first)
+                    first = second
+                
+                [bundle] = [name for name in os.listdir(os.path.join(root, 'comp', 'css')) if name in second]
+                with open(os.path.join(root, 'comp', 'css', bundle)) as handle:
+                    self.assertEqual(handle.read(), '.c{color:white}\n.b{color:black}\n.a{color:blue}\n')
+    
+    def test_assets_rename_bundle(self):
+        from compilation.storage.bundles import hash_handlers
+        with self.files() as root:
+            with self.settings(root, CSS_FLATTEN_IMPORTS=True):
+                self.write(root, 'site.css', '@import "sub/a.css";\nsite { background: url(icon.png) }')
+                self.write(root, 'sub/a.css', 'a { background: url(../logo.png) } b { background: url(http://example.com/x.png) }')
+                self.assertEqual(asset_paths('@import "sub/a.css";\nsite { background: url(icon.png) }', '/media/site.css', imports=True),
+                                 [os.path.join(root, 'icon.png'), os.path.join(root, 'logo.png')])
+                
+                handler = HandlerRegistry.styles['text/css']('/media/site.css', 'url')
+                first = hash_handlers([handler])
+                for name in ('logo.png', 'icon.png'):
+                    self.write(root, name, 'changed %s' % name)
+                    os.utime(os.path.join(root, name), (1, 1))
+                    second = hash_handlers([handler])
+                    self.assertNotEqual(second, first)
+                    first = second
@@ -0,0 +1,83 @@
+from tests.utils import CompilerTestCase
+from tests.contexts import compiler_settings
+from compilation.executor import CompileExecutor, CompileBusy, SETSID
+from compilation.handlers.base import CompileError
+import threading
+import unittest
+import sys
+import time
+
+class ExecutorTests(CompilerTestCase):
+    def setUp(self):
+        self.executor = CompileExecutor()
+    
+    def run_all(self, commands, mime='text/test'):
+        results = []
+        threads = [threading.Thread(target=lambda command=command: results.append(self.executor.run(mime, command))) for command in commands]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+    
+    def test_output(self):
+        self.assertEqual(self.executor.run('text/test', 'echo out; echo err >&2; exit 2'), (2, 'out\n', 'err\n'))
+        self.assertEqual(self.executor.stats()['completed'], 1)
+    
+    def test_global_concurrency(self):
+        with compiler_settings(COMPILE_CONCURRENCY=2):
+            self.run_all(['sleep 0.05'] * 6)
+            stats = self.executor.stats()
+            self.assertEqual(stats['peak_running'], 2)
+            self.assertTrue(stats['peak_waiting'] >= 1)
+            self.assertEqual(stats['running'], 0)
+            self.assertEqual(stats['completed'], 6)
+    
+    def test_handler_concurrency(self):
+        with compiler_settings(COMPILE_CONCURRENCY=4, COMPILE_HANDLER_CONCURRENCY={'text/test': 1}):
+            self.run_all(['sleep 0.05'] * 3)
+            self.assertEqual(self.executor.stats()['peak_running'], 1)
+    
+    def test_busy(self):
+        with compiler_settings(COMPILE_CONCURRENCY=1, COMPILE_QUEUE_TIMEOUT=0.05):
+            thread = threading.Thread(target=self.executor.run, args=('text/test', 'sleep 0.5'))
+            thread.start()
+            time.sleep(0.1)
+            try:
+                self.assertRaises(CompileBusy, self.executor.run, 'text/test', 'true')
+                self.assertEqual(self.executor.stats()['rejected'], 1)
+            finally:
+                thread.join()
+    
+    def test_timeout(self):
+        with compiler_settings(COMPILE_TIMEOUT=0.1):
+            started = time.time()
+            returncode, _, errors = self.executor.run('text/test', 'sleep 5; echo done')
+            self.assertTrue(time.time() - started < 2)
+            self.assertNotEqual(returncode, 0)
+            self.assertTrue('Killed after' in errors)
+            self.assertEqual(self.executor.stats()['timeouts'], 1)
+    
+    def test_resource_limits(self):
+        with compiler_settings(COMPILE_CPU_LIMIT=7, COMPILE_MEMORY_LIMIT=512 * 1024 * 1024):
+            self.assertEqual(self.executor.run('text/test', 'ulimit -t; ulimit -v'), (0, '7\n524288\n', ''))
+    
+    @unittest.skipUnless(SETSID, 'no setsid')
+    def test_own_process_group(self):
+        check = '%s -c "import os; print os.getpgid(0) == os.getppid()"' % sys.executable
+        self.assertEqual(self.executor.run('text/test', check), (0, 'True\n', ''))
+    
+    def test_call(self):
+        self.assertEqual(self.executor.call('text/test', 'add', lambda a, b: a + b, 1, 2), 3)
+        self.assertRaises(ValueError, self.executor.call, 'text/test', 'int', int, 'not a number')
+        stats = self.executor.stats()
+        self.assertEqual((stats['completed'], stats['running']), (2, 0))
+    
+    def test_call_limits(self):
+        with compiler_settings(COMPILE_CONCURRENCY=1, COMPILE_TIMEOUT=0.05, COMPILE_QUEUE_TIMEOUT=0.01):
+            self.assertRaises(CompileError, self.executor.call, 'text/test', 'sleep', time.sleep, 0.3)
+            self.assertEqual(self.executor.stats()['timeouts'], 1)
+            #The abandoned call keeps its slot until it returns
+            self.assertRaises(CompileBusy, self.executor.call, 'text/test', 'add', lambda a, b: a + b, 1, 2)
+            time.sleep(0.4)
+            self.assertEqual(self.executor.call('text/test', 'add', lambda a, b: a + b, 1, 2), 3)
@@ -0,0 +1,66 @@
+from tests.utils import CompilerTestCase, make_named_files
+from tests.contexts import compiler_settings, open_exception
+from compilation import hashing
+import hashlib
+import os
+
+class HashingTests(CompilerTestCase):
+    def test_default_algorithm(self):
+        hasher = hashing.get_algorithm()()
+        hasher.update('test')
+        self.assertEqual(hashing.hash_string('test'), hasher.hexdigest())
+    
+    def test_selectable_algorithm(self):
+        with compiler_settings(HASH_ALGORITHM='sha1'):
+            self.assertEqual(hashing.hash_string('test'), hashlib.sha1('test').hexdigest())
+    
+    def test_unknown_algorithm(self):
+        self.assertRaises(ValueError, hashing.get_algorithm, 'not-a-hash')
+    
+    def test_xxhash_falls_back(self):
+        #Works whether or not xxhash is installed
+        hasher = hashing.get_algorithm('xxhash')()
+        hasher.update('test')
+        self.assertTrue(hasher.hexdigest())
+    
+    def test_unicode(self):
+        self.assertEqual(hashing.hash_string(u'\u2603'), hashing.hash_string(u'\u2603'.encode('utf-8')))
+    
+    def test_file_matches_content(self):
+        with make_named_files() as temp_file:
+            temp_file.write('some content')
+            temp_file.flush()
+            self.assertEqual(hashing.hash_file(temp_file.name), hashing.hash_string('some content'))
+    
+    def test_empty_file(self):
+        with make_named_files() as temp_file:
+            self.assertEqual(hashing.hash_file(temp_file.name), hashing.hash_string(''))
+    
+    def test_large_file_chunked(self):
+        with make_named_files() as temp_file:
+            data = 'x' * (hashing.CHUNK_SIZE * 2 + 17)
+            temp_file.write(data)
+            temp_file.flush()
+            self.assertEqual(hashing.hash_file(temp_file.name), hashing.hash_string(data))
+    
+    def test_file_memoized(self):
+        with make_named_files() as temp_file:
+            temp_file.write('memo')
+            temp_file.flush()
+            digest = hashing.hash_file(temp_file.name)
+            with open_exception(temp_file.name):
+                self.assertEqual(hashing.hash_file(temp_file.name), digest)
+    
+    def test_changed_file_rehashed(self):
+        with make_named_files() as temp_file:
+            temp_file.write('before')
+            temp_file.flush()
+            before = hashing.hash_file(temp_file.name)
+            
+            temp_file.write(' and after')
+            temp_file.flush()
+            self.assertNotEqual(hashing.hash_file(temp_file.name), before)
+            self.assertEqual(hashing.hash_file(temp_file.name), hashing.hash_string('before and after'))
+    
+    def test_hash_digests(self):
+        self.assertEqual(hashing.hash_digests(['a', 'b']), hashing.hash_string('ab'))
@@ -0,0 +1,36 @@
+from tests.utils import CompilerTestCase
+from tests.contexts import django_template, django_exceptions, django_settings, media_root
+from compilation.loadtest import run, percentile, valid_bundle
+from StringIO import StringIO
+import contextlib
+import os
+
+class LoadTestTests(CompilerTestCase):
+    def context(self, root):
+        return contextlib.nested(django_template(), django_exceptions(), django_settings({'COMPILER_ROOT':'comp', 'MEDIA_ROOT':root, 'MEDIA_URL':'/media/'}))
+    
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEqual(percentile(values, 0.5), 51)
+        self.assertEqual(percentile(values, 1.0), 100)
+        self.assertEqual(percentile([], 0.5), 0.0)
+    
+    def test_valid_bundle(self):
+        with media_root({'good.js': '//member a v0 //end\n//member b v1 //end\n', 'bad.js': '//member a v0 //end\n//mem'}) as root:
+            self.assertTrue(valid_bundle(os.path.join(root, 'good.js')))
+            self.assertFalse(valid_bundle(os.path.join(root, 'bad.js')))
+            self.assertFalse(valid_bundle(os.path.join(root, 'missing.js')))
+    
+    def test_run(self):
+        with media_root() as root:
+            with self.context(root):
+                report = run(root, processes=2, threads=2, renders=5, latency=0.01, blocks=3, members=1, shared=1, change_rate=0.2)
+                self.assertEqual(report.errors, [])
+                self.assertEqual(len(report.latencies), 20)
+                self.assertEqual(report.corrupted, [])
+                self.assertEqual(report.corrupted_on_disk, [])
+                self.assertTrue(report.compiles > 0)
+                
+                stream = StringIO()
+                report.report(stream)
+                self.assertTrue(stream.getvalue().startswith('20 renders'))
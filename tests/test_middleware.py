@@ -0,0 +1,221 @@
+from tests.utils import CompilerTestCase, MockNodelist, MockNodes, MockParser, MockToken
+from tests.contexts import django_exceptions, django_settings, media_root, django_text_nodes
+from compilation import state
+from compilation.middleware import RequestStateMiddleware, PreloadMiddleware, AggregationMiddleware, StreamingCompileMiddleware
+import contextlib
+import os
+
+class MockResponse(dict):
+    def has_header(self, header):
+        return header in self
+
+class MiddlewareStack(object):
+    #Runs middlewares the way django does, responses going back up the list
+    def __init__(self, *middlewares):
+        self.middlewares = (RequestStateMiddleware(),) + middlewares
+    
+    def process_request(self, request):
+        for middleware in self.middlewares:
+            middleware.process_request(request)
+    
+    def process_response(self, request, response):
+        for middleware in reversed(self.middlewares):
+            response = middleware.process_response(request, response)
+        return response
+
+class StateTests(CompilerTestCase):
+    def tearDown(self):
+        state.finish()
+    
+    def test_not_recorded_outside_request(self):
+        state.record_bundle('/a.js', 'script')
+        self.assertEqual(state.bundles(), [])
+    
+    def test_recorded_once_in_order(self):
+        state.start()
+        state.record_bundle('/b.css', 'style')
+        state.record_bundle('/a.js', 'script')
+        state.record_bundle('/b.css', 'style')
+        self.assertEqual(state.bundles(), [('/b.css', 'style'), ('/a.js', 'script')])
+    
+    def test_first_emission(self):
+        self.assertTrue(state.first_emission(('script', 'abc')))
+        self.assertTrue(state.first_emission(('script', 'abc')))
+        state.start()
+        self.assertTrue(state.first_emission(('script', 'abc')))
+        self.assertFalse(state.first_emission(('script', 'abc')))
+        self.assertTrue(state.first_emission(('style', 'abc')))
+    
+    def test_rendered_outside_request(self):
+        self.assertEqual(state.set_rendered('<script>', 'markup'), 'markup')
+        self.assertEqual(state.get_rendered('<script>'), None)
+    
+    def test_collected(self):
+        state.start(aggregate=True)
+        self.assertTrue(state.aggregating())
+        self.assertEqual(state.collect('script', ['a']), state.placeholder('script'))
+        state.collect('style', ['b'])
+        state.collect('script', ['c', 'd'])
+        self.assertEqual(state.collected('script'), ['a', 'c', 'd'])
+        self.assertEqual(state.collected('style'), ['b'])
+        
+        state.start()
+        self.assertFalse(state.aggregating())
+    
+    def test_finish_clears(self):
+        state.start()
+        state.record_bundle('/a.js', 'script')
+        state.finish()
+        self.assertFalse(state.active())
+        self.assertEqual(state.bundles(), [])
+
+class RequestStateMiddlewareTests(CompilerTestCase):
+    def tearDown(self):
+        state.finish()
+    
+    def test_scopes_state(self):
+        middleware = RequestStateMiddleware()
+        middleware.process_request(None)
+        self.assertTrue(state.active())
+        state.set_rendered('<script>', 'markup')
+        self.assertEqual(state.get_rendered('<script>'), 'markup')
+        
+        response = MockResponse()
+        self.assertTrue(middleware.process_response(None, response) is response)
+        self.assertFalse(state.active())
+        self.assertEqual(state.get_rendered('<script>'), None)
+    
+    def test_required(self):
+        with django_exceptions():
+            from django.core.exceptions import ImproperlyConfigured
+            for middleware in (PreloadMiddleware(), AggregationMiddleware(), StreamingCompileMiddleware()):
+                self.assertRaises(ImproperlyConfigured, middleware.process_request, None)
+
+class PreloadMiddlewareTests(CompilerTestCase):
+    def setUp(self):
+        self.middleware = MiddlewareStack(PreloadMiddleware())
+    
+    def tearDown(self):
+        state.finish()
+    
+    def test_no_bundles_no_header(self):
+        self.middleware.process_request(None)
+        response = self.middleware.process_response(None, MockResponse())
+        self.assertFalse(response.has_header('Link'))
+    
+    def test_link_header(self):
+        self.middleware.process_request(None)
+        state.record_bundle('/comp/js/a.js', 'script')
+        state.record_bundle('/comp/css/b.css', 'style')
+        response = self.middleware.process_response(None, MockResponse())
+        self.assertEqual(response['Link'], '</comp/js/a.js>; rel=preload; as=script, </comp/css/b.css>; rel=preload; as=style')
+        self.assertFalse(state.active())
+    
+    def test_keeps_existing_header(self):
+        self.middleware.process_request(None)
+        state.record_bundle('/comp/js/a.js', 'script')
+        response = self.middleware.process_response(None, MockResponse({'Link': '</font.woff>; rel=preload'}))
+        self.assertEqual(response['Link'], '</font.woff>; rel=preload, </comp/js/a.js>; rel=preload; as=script')
+
+class AggregationMiddlewareTests(CompilerTestCase):
+    def setUp(self):
+        self.middleware = MiddlewareStack(PreloadMiddleware(), AggregationMiddleware())
+    
+    def tearDown(self):
+        state.finish()
+    
+    def context(self, root):
+        return contextlib.nested(django_exceptions(), django_settings({'COMPILER_ROOT':'comp', 'MEDIA_ROOT':root, 'MEDIA_URL':'/media/'}))
+    
+    def test_merged_bundles(self):
+        with media_root({'a.js': 'file a', 'b.js': 'file b'}) as root:
+            with self.context(root):
+                from compilation.templatetags.compiler import CompilerNode
+                self.middleware.process_request(None)
+                head = CompilerNode(MockNodelist('<link type="text/javascript" href="/media/a.js" /><style type="text/css">a {}</style>')).render(None)
+                body = CompilerNode(MockNodelist('<link type="text/javascript" href="/media/a.js" /><link type="text/javascript" href="/media/b.js" />')).render(None)
+                self.assertFalse('src=' in head + body)
+                
+                response = MockResponse({'Content-Length': '0'})
+                response.content = '<head>%s</head><body>%s</body>' % (head, body)
+                response = self.middleware.process_response(None, response)
+                
+                self.assertEqual(response.content.count('<script'), 1)
+                self.assertEqual(response.content.count('<link'), 1)
+                self.assertFalse('<!--compilation' in response.content)
+                self.assertEqual(response['Content-Length'], str(len(response.content)))
+                self.assertTrue('rel=preload' in response['Link'])
+                
+                [bundle] = os.listdir(os.path.join(root, 'comp', 'js'))
+                with open(os.path.join(root, 'comp', 'js', bundle)) as handle:
+                    self.assertEqual(handle.read(), 'file a\nfile b\n')
+    
+    def test_static_blocks_only_merged(self):
+        with media_root({'a.js': 'file a', 'b.js': 'file b'}) as root:
+            with contextlib.nested(self.context(root), django_text_nodes()) as (_, TextNode):
+                from compilation.templatetags.compiler import do_compile
+                head = do_compile(MockParser(MockNodes([TextNode('<link type="text/javascript" href="/media/a.js" />')])), MockToken())
+                body = do_compile(MockParser(MockNodes([TextNode('<link type="text/javascript" href="/media/b.js" />')])), MockToken())
+                
+                self.middleware.process_request(None)
+                response = MockResponse()
+                response.content = '<head>%s</head><body>%s</body>' % (head.render(None), body.render(None))
+                response = self.middleware.process_response(None, response)
+                
+                #No bundle of their own for the blocks, only the merged one
+                [bundle] = os.listdir(os.path.join(root, 'comp', 'js'))
+                self.assertTrue(bundle in response.content)
+                with open(os.path.join(root, 'comp', 'js', bundle)) as handle:
+                    self.assertEqual(handle.read(), 'file a\nfile b\n')
+    
+    def test_placeholders_not_emitted(self):
+        self.middleware.process_request(None)
+        response = MockResponse()
+        response.content = '<p>nothing</p>'
+        self.assertEqual(self.middleware.process_response(None, response).content, '<p>nothing</p>')
+        self.assertFalse(state.active())
+
+class StreamingCompileMiddlewareTests(CompilerTestCase):
+    def setUp(self):
+        self.middleware = MiddlewareStack(PreloadMiddleware(), StreamingCompileMiddleware())
+    
+    def tearDown(self):
+        state.finish()
+    
+    def context(self, root):
+        return contextlib.nested(django_exceptions(), django_settings({'COMPILER_ROOT':'comp', 'MEDIA_ROOT':root, 'MEDIA_URL':'/media/'}))
+    
+    def test_rewrites_content(self):
+        with media_root({'a.js': 'file a'}) as root:
+            with self.context(root):
+                self.middleware.process_request(None)
+                response = MockResponse({'Content-Type': 'text/html'})
+                response.content = '<head><!-- compile --><link type="text/javascript" href="/media/a.js" /><!-- endcompile --></head>'
+                response = self.middleware.process_response(None, response)
+                self.assertTrue(response.content.startswith("<head><script type='text/javascript' src='/static/comp/js/"))
+                self.assertFalse('compile' in response.content)
+                self.assertTrue('rel=preload' in response['Link'])
+                self.assertFalse(state.active())
+    
+    def test_streams(self):
+        with media_root({'a.js': 'file a'}) as root:
+            with self.context(root):
+                self.middleware.process_request(None)
+                response = MockResponse({'Content-Type': 'text/html; charset=utf-8', 'Content-Length': '100'})
+                response.streaming = True
+                response.streaming_content = iter(['<head><!-- comp', 'ile --><link type="text/javascript" ', 'href="/media/a.js" /><!-- endcompile -->', '</head>'])
+                response = self.middleware.process_response(None, response)
+                self.assertFalse(response.has_header('Content-Length'))
+                self.assertFalse(state.active())
+                
+                chunks = list(response.streaming_content)
+                self.assertEqual(chunks[0], '<head>')
+                self.assertTrue(chunks[1].startswith("<script type='text/javascript' src='/static/comp/js/"))
+                self.assertEqual(chunks[-1], '</head>')
+                self.assertEqual(len(os.listdir(os.path.join(root, 'comp', 'js'))), 1)
+    
+    def test_other_content_types(self):
+        self.middleware.process_request(None)
+        response = MockResponse({'Content-Type': 'application/json'})
+        response.content = '<!-- compile -->{}<!-- endcompile -->'
+        self.assertEqual(self.middleware.process_response(None, response).content, '<!-- compile -->{}<!-- endcompile -->')
@@ -0,0 +1,155 @@
+from tests.utils import CompilerTestCase
+from tests.contexts import command_handler, compiler_settings, media_root
+from compilation import pipeline
+from compilation.pipeline import Stage, Minify, outputs
+from compilation.handlers.base import BaseHandler, BaseCompilingHandler, HandlerRegistry
+from compilation.storage.bundles import save_bundle
+import gzip
+import os
+
+class Counting(Stage):
+    cache = True
+    
+    def __init__(self, id, transform, setting=None):
+        self.id = id
+        self.transform = transform
+        self.setting = setting
+        self.calls = []
+    
+    def key(self, handler):
+        return (self.setting,)
+    
+    def run(self, handler, content):
+        self.calls.append(content)
+        return self.transform(content)
+
+class PipelineTests(CompilerTestCase):
+    def setUp(self):
+        outputs.clear()
+        pipeline.timings.clear()
+    
+    def handler(self, *stages):
+        class StagedHandler(BaseHandler):
+            abstract = True
+            mime = ''
+            category = ''
+        StagedHandler.stages = stages
+        return StagedHandler
+    
+    def test_in_order(self):
+        first = Counting('first', lambda content: content + ' first')
+        second = Counting('second', lambda content: content + ' second')
+        handler = self.handler(first, second)('source', 'content')
+        ran = handler.call_pre_insert()
+        self.assertEqual(handler.content, 'source first second')
+        self.assertEqual([(stage_id, cached) for stage_id, _, cached in ran], [('first', False), ('second', False)])
+    
+    def test_cached_by_input(self):
+        first = Counting('first', lambda content: content.upper())
+        second = Counting('second', lambda content: content + '!')
+        Handler = self.handler(first, second)
+        
+        ran = Handler('source', 'content').call_pre_insert()
+        ran = Handler('source', 'content').call_pre_insert()
+        self.assertEqual([cached for _, _, cached in ran], [True, True])
+        self.assertEqual(len(first.calls), 1)
+        self.assertEqual(len(second.calls), 1)
+        
+        Handler('other', 'content').call_pre_insert()
+        self.assertEqual(len(first.calls), 2)
+        self.assertEqual(len(second.calls), 2)
+    
+    def test_config_change_reruns_stage(self):
+        first = Counting('first', lambda content: content.upper())
+        second = Counting('second', lambda content: content + '!')
+        Handler = self.handler(first, second)
+        Handler('source', 'content').call_pre_insert()
+        
+        #Same output from the changed stage, the next one isn't run again
+        first.setting = 'changed'
+        handler = Handler('source', 'content')
+        ran = handler.call_pre_insert()
+        self.assertEqual(handler.content, 'SOURCE!')
+        self.assertEqual([cached for _, _, cached in ran], [False, True])
+        self.assertEqual(len(first.calls), 2)
+        self.assertEqual(len(second.calls), 1)
+        
+        first.transform = lambda content: content.lower()
+        first.setting = 'lower'
+        handler = Handler('source', 'content')
+        handler.call_pre_insert()
+        self.assertEqual(handler.content, 'source!')
+        self.assertEqual(len(second.calls), 2)
+    
+    def test_file_input(self):
+        first = Counting('first', lambda content: content.upper())
+        with media_root({'a.js': 'var a;'}) as root:
+            handler = self.handler(first)(os.path.join(root, 'a.js'), 'file')
+            handler.call_pre_insert()
+            self.assertEqual(handler.content, 'VAR A;')
+            self.assertEqual(first.calls, ['var a;'])
+    
+    def test_timings(self):
+        Handler = self.handler(Counting('first', lambda content: content))
+        Handler('source', 'content').call_pre_insert()
+        Handler('source', 'content').call_pre_insert()
+        timing = pipeline.stage_timings()['first']
+        self.assertEqual((timing['runs'], timing['hits']), (2, 1))
+        self.assertTrue(timing['seconds'] >= 0)
+    
+    def test_compile_then_minify(self):
+        with command_handler(BaseCompilingHandler, HandlerRegistry, 'script', 'cat %s') as TestHandler:
+            with compiler_settings(MINIFY_COMMANDS={'script': 'tr -d " " < %s'}):
+                handler = TestHandler('var a = 1;', 'content')
+                ran = handler.call_pre_insert()
+                self.assertEqual(handler.content, 'vara=1;')
+                self.assertEqual([stage_id for stage_id, _, _ in ran], ['compile', 'minify'])
+            
+            handler = TestHandler('var a = 1;', 'content')
+            ran = handler.call_pre_insert()
+            self.assertEqual(handler.content, 'var a = 1;')
+            self.assertEqual([(stage_id, cached) for stage_id, _, cached in ran], [('compile', True)])
+    
+    def test_gzip_sidecar(self):
+        with media_root() as root:
+            path = os.path.join(root, 'bundle.js')
+            asset = os.path.join(root, 'logo.png')
+            with compiler_settings(GZIP_BUNDLES=True):
+                save_bundle(path, 'var a;')
+                save_bundle(asset, 'png')
+            with open(path) as handle:
+                self.assertEqual(handle.read(), 'var a;')
+            self.assertEqual(gzip.open(path + '.gz').read(), 'var a;')
+            self.assertFalse(os.path.exists(asset + '.gz'))
+            
+            with open(path + '.gz', 'rb') as handle:
+                first = handle.read()
+            with compiler_settings(GZIP_BUNDLES=True):
+                save_bundle(path, 'var a;')
+            with open(path + '.gz', 'rb') as handle:
+                self.assertEqual(handle.read(), first)
+    
+    def test_stage_settings_rename_bundles(self):
+        from compilation.storage.bundles import hash_handlers
+        with command_handler(BaseCompilingHandler, HandlerRegistry, 'script', 'cat %s') as TestHandler:
+            handler = TestHandler('var a = 1;', 'content')
+            plain = hash_handlers([handler])
+            with compiler_settings(MINIFY_COMMANDS={'script': 'tr -d " " < %s'}):
+                minified = hash_handlers([handler])
+                with compiler_settings(MINIFY_COMMANDS={'script': 'tr -d ";" < %s'}):
+                    self.assertNotEqual(hash_handlers([handler]), minified)
+            self.assertNotEqual(plain, minified)
+            self.assertEqual(hash_handlers([handler]), plain)
+            
+            TestHandler.command = 'cat %s # other'
+            self.assertNotEqual(hash_handlers([handler]), plain)
+    
+    def test_css_settings_rename_bundles(self):
+        from compilation.storage.bundles import hash_handlers
+        handler = HandlerRegistry.styles['text/css']('a { color: red }', 'content')
+        with compiler_settings(CSS_REWRITE_URLS=True, CSS_FLATTEN_IMPORTS=True):
+            both = hash_handlers([handler])
+        with compiler_settings(CSS_REWRITE_URLS=False, CSS_FLATTEN_IMPORTS=True):
+            self.assertNotEqual(hash_handlers([handler]), both)
+        with compiler_settings(CSS_REWRITE_URLS=True, CSS_FLATTEN_IMPORTS=False):
+            self.assertNotEqual(hash_handlers([handler]), both)
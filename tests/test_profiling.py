@@ -0,0 +1,74 @@
+from tests.utils import CompilerTestCase, MockNodelist
+from tests.contexts import django_template, django_exceptions, django_settings, media_root, compiler_settings
+from compilation.profiling import profiled, rotate, report, area
+from StringIO import StringIO
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+
+class ProfilingTests(CompilerTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def profiles(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.pstats'))
+    
+    def test_not_profiled(self):
+        with compiler_settings(PROFILE_DIR=self.directory):
+            self.assertEqual(profiled(lambda value: value, 'markup'), 'markup')
+            self.assertEqual(self.profiles(), [])
+    
+    def test_sample_rate(self):
+        with compiler_settings(PROFILE_DIR=self.directory, PROFILE_SAMPLE_RATE=2):
+            for _ in xrange(4):
+                self.assertEqual(profiled(lambda value: value, 'markup'), 'markup')
+            self.assertEqual(len(self.profiles()), 2)
+    
+    def test_slow_threshold(self):
+        import time
+        with compiler_settings(PROFILE_DIR=self.directory, PROFILE_SLOW_THRESHOLD=0.05):
+            profiled(lambda: 'fast')
+            self.assertEqual(self.profiles(), [])
+            profiled(lambda: time.sleep(0.06) or 'slow')
+            [name] = self.profiles()
+            with open(os.path.join(self.directory, name[:-len('.pstats')] + '.json')) as handle:
+                self.assertEqual(json.load(handle)['reason'], 'slow')
+    
+    def test_rotate(self):
+        for index in xrange(3):
+            for extension in ('.pstats', '.json'):
+                open(os.path.join(self.directory, '%d%s' % (index, extension)), 'w').close()
+        rotate(self.directory, 2)
+        self.assertEqual(self.profiles(), ['1.pstats', '2.pstats'])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, '0.json')))
+    
+    def test_area(self):
+        self.assertEqual(area('/srv/compilation/parser/LxmlParser.py'), 'parse')
+        self.assertEqual(area('/srv/compilation/hashing.py'), 'hash')
+        self.assertEqual(area('/srv/app/views.py'), '')
+    
+    def test_render_profiled(self):
+        with media_root({'test.js': 'file'}) as root:
+            with contextlib.nested(django_template(), django_exceptions(), compiler_settings(PROFILE_DIR=self.directory, PROFILE_SAMPLE_RATE=1),
+                                   django_settings({'COMPILER_ROOT':'comp', 'MEDIA_ROOT':root, 'MEDIA_URL':'/media/'})):
+                from compilation.templatetags.compiler import CompilerNode
+                CompilerNode(MockNodelist('<link type="text/javascript" href="/media/test.js" />')).render(None)
+                
+                [name] = self.profiles()
+                [bundle] = os.listdir(os.path.join(root, 'comp', 'js'))
+                self.assertTrue(bundle[:12] in name)
+                with open(os.path.join(self.directory, name[:-len('.pstats')] + '.json')) as handle:
+                    meta = json.load(handle)
+                self.assertEqual(meta['bundles'], [bundle[:-3]])
+                self.assertTrue(meta['phases']['parse'] > 0)
+                self.assertTrue(meta['phases']['locate'] > 0)
+                
+                stream = StringIO()
+                report(self.directory, 5, stream)
+                self.assertTrue(stream.getvalue().startswith('1 profiles'))
+                self.assertTrue('compile' in stream.getvalue())
@@ -0,0 +1,40 @@
+from tests.utils import CompilerTestCase
+from compilation.revalidate import Revalidator
+import threading
+
+class RevalidatorTests(CompilerTestCase):
+    def test_builds_and_stores(self):
+        revalidator = Revalidator()
+        stored = []
+        self.assertTrue(revalidator.submit('key', lambda: 'built', stored.append))
+        revalidator.join()
+        self.assertEqual(stored, ['built'])
+    
+    def test_one_build_per_key(self):
+        revalidator = Revalidator()
+        release = threading.Event()
+        stored = []
+        def build():
+            release.wait()
+            return 'built'
+        
+        self.assertTrue(revalidator.submit('key', build, stored.append))
+        self.assertFalse(revalidator.submit('key', build, stored.append))
+        self.assertTrue(revalidator.submit('other', lambda: 'other', stored.append))
+        release.set()
+        revalidator.join()
+        self.assertEqual(stored, ['built', 'other'])
+        
+        #Done, so it can be queued again
+        self.assertTrue(revalidator.submit('key', build, stored.append))
+        revalidator.join()
+    
+    def test_failures_dont_stop_worker(self):
+        revalidator = Revalidator()
+        stored = []
+        def fail():
+            raise ValueError('broken')
+        revalidator.submit('broken', fail, stored.append)
+        revalidator.submit('fine', lambda: 'built', stored.append)
+        revalidator.join()
+        self.assertEqual(stored, ['built'])
@@ -0,0 +1,35 @@
+from tests.utils import CompilerTestCase
+from compilation.streaming import RegionRewriter, partial_suffix
+
+class RegionRewriterTests(CompilerTestCase):
+    def rewriter(self):
+        return RegionRewriter(lambda html: '[%s]' % html.strip(), '<!-- compile -->', '<!-- endcompile -->')
+    
+    def test_partial_suffix(self):
+        self.assertEqual(partial_suffix('abc<!-- com', '<!-- compile -->'), 8)
+        self.assertEqual(partial_suffix('abc', '<!-- compile -->'), 0)
+        self.assertEqual(partial_suffix('<', '<!-- compile -->'), 1)
+    
+    def test_rewrite(self):
+        html = 'a<!-- compile --> one <!-- endcompile -->b<!-- compile -->two<!-- endcompile -->c'
+        self.assertEqual(self.rewriter().rewrite(html), 'a[one]b[two]c')
+    
+    def test_every_split(self):
+        html = '<p>before</p><!-- compile --><script></script><!-- endcompile --><p>after</p>'
+        for split in xrange(len(html) + 1):
+            rewriter = self.rewriter()
+            output = rewriter.feed(html[:split]) + rewriter.feed(html[split:]) + rewriter.close()
+            self.assertEqual(output, '<p>before</p>[<script></script>]<p>after</p>')
+    
+    def test_passes_text_on(self):
+        rewriter = self.rewriter()
+        self.assertEqual(rewriter.feed('<html><head>'), '<html><head>')
+        self.assertEqual(rewriter.feed('<!-- compile --><script>'), '')
+        #Held back in case it starts a marker
+        self.assertEqual(rewriter.feed('</script><!-- endcompile --></head><'), '[<script></script>]</head>')
+        self.assertEqual(rewriter.feed('body>'), '<body>')
+    
+    def test_unclosed_region(self):
+        rewriter = self.rewriter()
+        self.assertEqual(rewriter.feed('a<!-- compile -->b<!-- end'), 'a')
+        self.assertEqual(rewriter.close(), '<!-- compile -->b<!-- end')
@@ -0,0 +1,74 @@
+from tests.utils import CompilerTestCase, MockNodes
+from tests.contexts import django_template_base
+from compilation.variables import find_variables, cache_key, _missing
+
+class VariableTests(CompilerTestCase):
+    def variable_node(self, base, name, *args):
+        filters = [(None, [(False, base.Variable(arg))]) for arg in args]
+        return base.VariableNode(base.FilterExpression(base.Variable(name), filters))
+    
+    def test_unique_variables(self):
+        with django_template_base() as base:
+            nodes = MockNodes([
+                base.TextNode('<script src="'),
+                self.variable_node(base, 'user.name'),
+                self.variable_node(base, 'prefix', 'user.name'),
+            ])
+            self.assertEqual([variable.var for variable in find_variables(nodes)], ['prefix', 'user.name'])
+    
+    def test_unknown_node(self):
+        with django_template_base() as base:
+            class IncludeNode(base.Node):
+                pass
+            self.assertEqual(find_variables(MockNodes([base.TextNode('a'), IncludeNode()])), None)
+            self.assertEqual(find_variables(None), None)
+    
+    def test_stateful_nodes(self):
+        with django_template_base() as base:
+            class IfChangedNode(base.Node):
+                pass
+            class URLNode(base.Node):
+                pass
+            self.assertEqual(find_variables(MockNodes([IfChangedNode()])), None)
+            self.assertEqual(find_variables(MockNodes([URLNode()])), None)
+    
+    def test_nested_unknown_node(self):
+        with django_template_base() as base:
+            class IncludeNode(base.Node):
+                pass
+            class IfNode(base.Node):
+                def __init__(self, nodelist):
+                    self.nodelist = nodelist
+            self.assertEqual(find_variables(MockNodes([IfNode(base.NodeList([IncludeNode()]))])), None)
+    
+    def test_loop_variables_bound(self):
+        with django_template_base() as base:
+            class ForNode(base.Node):
+                def __init__(self, loopvars, sequence, nodelist):
+                    self.loopvars = loopvars
+                    self.sequence = sequence
+                    self.nodelist = nodelist
+            nodes = MockNodes([ForNode(['item'], base.FilterExpression(base.Variable('items')), base.NodeList([
+                self.variable_node(base, 'item.url'),
+                self.variable_node(base, 'forloop.counter'),
+                self.variable_node(base, 'media'),
+            ]))])
+            self.assertEqual([variable.var for variable in find_variables(nodes)], ['items', 'media'])
+    
+    def test_cache_key(self):
+        with django_template_base() as base:
+            variables = [base.Variable('a'), base.Variable('b')]
+            self.assertEqual(cache_key(variables, {'a': 1, 'b': [1, 'x']}), cache_key(variables, {'a': 1, 'b': [1, 'x']}))
+            self.assertNotEqual(cache_key(variables, {'a': 1, 'b': 2}), cache_key(variables, {'a': 1, 'b': 3}))
+            self.assertEqual(cache_key(variables, {'a': 1})[1], _missing)
+    
+    def test_cache_key_types(self):
+        with django_template_base() as base:
+            variables = [base.Variable('a')]
+            self.assertNotEqual(cache_key(variables, {'a': 1}), cache_key(variables, {'a': True}))
+            self.assertNotEqual(cache_key(variables, {'a': [1]}), cache_key(variables, {'a': (1,)}))
+    
+    def test_unkeyable(self):
+        with django_template_base() as base:
+            self.assertEqual(cache_key([base.Variable('a')], {'a': object()}), None)
+            self.assertEqual(cache_key([base.Variable('a')], {'a': {'key': object()}}), None)
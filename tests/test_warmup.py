@@ -0,0 +1,61 @@
+from tests.utils import CompilerTestCase
+from tests.contexts import django_template, django_exceptions
+from compilation.warmup import count_log, read_paths, by_popularity, warm, report
+from StringIO import StringIO
+import contextlib
+import threading
+
+NGINX = '10.0.0.1 - - [19/Oct/2026:10:00:00 +0000] "GET %s HTTP/1.1" %s 512 "-" "Mozilla/5.0"'
+GUNICORN = '10.0.0.2 - - [19/Oct/2026:10:00:01 +0000] "GET %s HTTP/1.0" %s 1024 "-" "curl/7.0"'
+
+class Response(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+class FakeClient(object):
+    #Builds a bundle for every page under /built, like a cold render would
+    def __init__(self, seen, lock):
+        self.seen = seen
+        self.lock = lock
+    
+    def get(self, path):
+        from compilation.storage.bundles import bundle_built
+        with self.lock:
+            self.seen.append(path)
+        if path == '/broken':
+            raise ValueError('template error')
+        if path.startswith('/built'):
+            bundle_built('script', path.strip('/'), '/nonexistent/%s.js' % path.strip('/'), 0.25)
+        return Response(404 if path == '/missing' else 200)
+
+class WarmupTests(CompilerTestCase):
+    def test_count_log(self):
+        lines = [NGINX % ('/', 200), NGINX % ('/about', 200), GUNICORN % ('/', 200),
+                 NGINX % ('/missing', 404), '10.0.0.1 - - "POST /form HTTP/1.1" 200 1', 'garbage']
+        self.assertEqual(count_log(lines), {'/': 2, '/about': 1})
+    
+    def test_read_paths(self):
+        self.assertEqual(read_paths(['/\n', '\n', '# comment\n', '  /about \n']), ['/', '/about'])
+    
+    def test_by_popularity(self):
+        self.assertEqual(by_popularity({'/b': 1, '/a': 1, '/popular': 5}), ['/popular', '/a', '/b'])
+    
+    def test_warm(self):
+        seen = []
+        lock = threading.Lock()
+        with contextlib.nested(django_template(), django_exceptions()):
+            from compilation.storage import bundles
+            pages = warm(['/built/a', '/plain', '/missing', '/broken', '/built/b'], lambda: FakeClient(seen, lock), concurrency=2)
+        
+        self.assertEqual(bundles._build_listeners, [])
+        self.assertEqual(sorted(seen), sorted(['/built/a', '/plain', '/missing', '/broken', '/built/b']))
+        self.assertEqual([page.path for page in pages], ['/built/a', '/plain', '/missing', '/broken', '/built/b'])
+        self.assertEqual([page.bundles for page in pages],
+                         [[('/nonexistent/built/a.js', 0.25)], [], [], [], [('/nonexistent/built/b.js', 0.25)]])
+        self.assertEqual([page.ok for page in pages], [True, True, False, False, True])
+        self.assertEqual(pages[3].error, 'ValueError: template error')
+        
+        stream = StringIO()
+        report(pages, 1.0, stream)
+        self.assertTrue('    250.0ms  /nonexistent/built/a.js\n' in stream.getvalue())
+        self.assertTrue(stream.getvalue().endswith('5 pages in 1.0s, 2 bundles built, 2 failed\n'))
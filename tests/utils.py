@@ -21,3 +21,42 @@ def make_named_files(count = 1):
     if count == 1:
         return files[0]
     return files
+
+class LocalCache(object):
+    #Just enough of the django cache api for compilation.storage.shared
+    def __init__(self):
+        self.data = {}
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+    def set(self, key, value, timeout=None):
+        self.data[key] = value
+    def add(self, key, value, timeout=None):
+        if key in self.data:
+            return False
+        self.data[key] = value
+        return True
+    def delete(self, key):
+        self.data.pop(key, None)
+
+class MockParser(object):
+    #Stands in for the template parser handed to do_compile
+    def __init__(self, nodelist):
+        self.nodelist = nodelist
+    def parse(self, until):
+        return self.nodelist
+    def delete_first_token(self):
+        pass
+
+class MockToken(object):
+    #Stands in for the {% compile %} token handed to do_compile
+    def __init__(self, contents='compile'):
+        self.contents = contents
+    def split_contents(self):
+        #Words, keeping quoted strings in them whole
+        import re
+        return re.findall(r'''(?:[^\s'"]*(?:"[^"]*"|'[^']*'))+\S*|\S+''', self.contents)
+
+class MockNodes(list):
+    #A nodelist made of real nodes
+    def render(self, context):
+        return ''.join(node.render(context) for node in self)